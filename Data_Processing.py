@@ -4,18 +4,118 @@ import csv
 import os
 import threading
 
+import numpy as np
 import pandas as pd
+from PySide6.QtCore import (QAbstractTableModel, QModelIndex, Qt, QTimer,
+                            Signal)
 from PySide6.QtGui import QBrush
 from PySide6.QtWidgets import (QFileDialog, QGridLayout, QMainWindow, QMenuBar,
-                               QTableWidget, QTableWidgetItem, QWidget)
+                               QTableView, QWidget)
+
+
+class Table_Model(QAbstractTableModel):
+    """model for the table view, the values are kept column by column and only turned into text when a cell is shown"""
+    def __init__(self):
+        super().__init__()
+
+        self.header = []
+        self.columns = []
+        self.rows = 0
+        self.dropped = 0
+        self.buffer = None
+        self.number_format = "{0}"
+        self.brush = QBrush("lightGray")
+
+    def set_frame(self, df, number_format = "{0:0,.2f}"):
+        """shows a pandas frame, for example a loaded excel file"""
+        self.beginResetModel()
+        self.buffer = None
+        self.header = [str(name) for name in df.columns]
+        self.columns = [df.iloc[:, idx].to_numpy() for idx in range(df.shape[1])]
+        self.rows = df.shape[0]
+        self.number_format = number_format
+        self.endResetModel()
+
+    def set_buffer(self, buffer):
+        """shows the samples of a sample buffer, new samples are added by poll"""
+        self.beginResetModel()
+        self.buffer = buffer
+        self.header = list(buffer.names)
+        snapshot, count = buffer.since(0)
+        self.columns = snapshot.T
+        self.rows = len(snapshot)
+        self.dropped = count - len(snapshot)
+        self.number_format = "{0}"
+        self.endResetModel()
+
+    def poll(self):
+        """appends the samples that were added to the buffer since the last call"""
+        if self.buffer is None:
+            return
+        snapshot, count = self.buffer.since(0)
+        if count <= self.dropped + self.rows:
+            return
+        if count - len(snapshot) > self.dropped:
+            #the oldest samples were dropped by the buffer, so the rows do not match anymore
+            self.set_buffer(self.buffer)
+            return
+        self.beginInsertRows(QModelIndex(), self.rows, len(snapshot)-1)
+        self.columns = snapshot.T
+        self.rows = len(snapshot)
+        self.endInsertRows()
+
+    def text(self, row, column):
+        value = self.columns[column][row]
+        if isinstance(value, str):
+            return value
+        if value is None or pd.isna(value):
+            return ""
+        if isinstance(value, (int, float, np.number)):
+            return self.number_format.format(value)
+        return str(value)
+
+    def rowCount(self, parent = QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self.rows
+
+    def columnCount(self, parent = QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.header)
+
+    def data(self, index, role = Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.DisplayRole:
+            return self.text(index.row(), index.column())
+        if role == Qt.BackgroundRole:
+            value = self.columns[index.column()][index.row()]
+            if isinstance(value, str) and value != "":
+                return self.brush
+        return None
+
+    def headerData(self, section, orientation, role = Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self.header[section]
+        return str(section + 1)
 
 
 class Data_Processing(QMainWindow):
     """overall class to manage the optimization point history"""
+    #the buffer can be handed over from another thread, the signal brings it to the GUI thread
+    samples_changed = Signal(object)
+
     def __init__(self):
         super().__init__()
 
-        self.data_table = QTableWidget(3000,29)
+        #the table only asks the model for the visible cells, so there is no row limit
+        self.model = Table_Model()
+        self.data_table = QTableView()
+        self.data_table.setModel(self.model)
+        self.samples_changed.connect(self.model.set_buffer)
         #self.data_table.setColumnWidth(0,120)
         #self.data_table.setColumnWidth(1,120)
         #self.data_table.setColumnWidth(2,120)
@@ -48,33 +148,24 @@ class Data_Processing(QMainWindow):
 
         self.setCentralWidget(self.overall_main)
 
+        #new samples of the live data are appended every second
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.model.poll)
+        self.timer.start(1000)
+
 
     def loadExcelData(self):
-        
-        brush = QBrush("lightGray")
 
         df = pd.read_excel("Calorimetry\strategy_test.xlsx", engine='openpyxl')
         if df.size == 0:
             return
 
-        df.fillna('', inplace=True)
-        self.data_table.setRowCount(df.shape[0])
-        self.data_table.setColumnCount(df.shape[1])
-        self.data_table.setHorizontalHeaderLabels(df.columns)
+        # the values are formatted by the model when they are shown
+        self.model.set_frame(df)
 
-        # returns pandas array object
-        for row in df.iterrows():
-            values = row[1]
-            for col_index, value in enumerate(values):
-                tableItem = QTableWidgetItem()
-                if isinstance(value, (str)):
-                    if value is not "":
-                        tableItem.setBackground(brush)
-                if isinstance(value, (float, int)):
-                    value = '{0:0,.2f}'.format(value)
-                tableItem.setText(str(value))
-
-                self.data_table.setItem(row[0], col_index, tableItem)
+    def show_samples(self, buffer):
+        """shows the samples of a sample buffer, can be called from any thread"""
+        self.samples_changed.emit(buffer)
 
 
     def save(self):
@@ -99,14 +190,10 @@ class Data_Processing(QMainWindow):
         if path[0]:
             with open(path[0], 'w', newline='') as stream:
                 writer = csv.writer(stream)
-                for row in range(self.data_table.rowCount()):
+                for row in range(self.model.rowCount()):
                     rowdata = []
-                    for column in range(self.data_table.columnCount()):
-                        item = self.data_table.item(row, column)
-                        if item is not None:
-                            rowdata.append(item.text())
-                        else:
-                            rowdata.append('')
+                    for column in range(self.model.columnCount()):
+                        rowdata.append(self.model.text(row, column))
                     writer.writerow(rowdata)
 
     def save_table_automated(self, algorithm, function):
@@ -116,14 +203,10 @@ class Data_Processing(QMainWindow):
         file_name = str(function)+str(".csv")
         with open(file_name, 'a+', newline='') as stream:
             writer = csv.writer(stream)
-            for row in range(self.data_table.rowCount()):
+            for row in range(self.model.rowCount()):
                 rowdata = []
-                for column in range((self.data_table.columnCount()-3)):
-                    item = self.data_table.item(row, column)
-                    if item is not None:
-                        rowdata.append(item.text())
-                    else:
-                        rowdata.append('')
+                for column in range((self.model.columnCount()-3)):
+                    rowdata.append(self.model.text(row, column))
                 writer.writerow(rowdata)
 
 
@@ -133,13 +216,6 @@ class Data_Processing(QMainWindow):
         """
         cls.txt_edit.insertPlainText(text)
 
-    def insert_in_table(self, cls, number: int, values):
-
-        for i in range(len(values)):
-            item = QTableWidgetItem()
-            item.setText(str(values[i]))
-            cls.data_table.setItem(number, (i), item)
-
     def open_csv(self):
         """
         for this, put a csv file with the needed values into the modules folder and the overall folder
@@ -160,14 +236,14 @@ class Data_Processing(QMainWindow):
         with open(path, mode = "r") as csv_file:
 
             csv_reader = csv.DictReader(csv_file)
-            line_count = 1
+            names = ["Exp Nr", "Temperature", "Residence Time", "Substrate Ratio", "Yield", "Error Value", "Experiment Time", "Real Ratio"]
+            rows = []
 
             for row in csv_reader:
-                parameters = [row.get("Exp Nr"), row.get("Temperature"), row.get("Residence Time"),
-                row.get("Substrate Ratio"), row.get("Yield"), row.get("Error Value") , row.get("Experiment Time"), row.get("Real Ratio")]
+                parameters = [row.get(name) for name in names]
                 print(parameters)
-                self.insert_in_table(number =line_count, values =parameters)
-                line_count +=1
+                rows.append(parameters)
 
+            self.model.set_frame(pd.DataFrame(rows, columns=names))
             print("History imported")
 
@@ -1,8 +1,10 @@
 #first we import all the modules needed for this script
+import numpy as np
+import automat.Decimation as Decimation
 from matplotlib.backends.backend_qt5agg import (FigureCanvasQTAgg,
                                                 NavigationToolbar2QT)
 from matplotlib.figure import Figure
-from PySide6.QtCore import Qt
+from PySide6.QtCore import Qt, QTimer
 from PySide6.QtGui import QAction
 from PySide6.QtWidgets import (QDockWidget, QMainWindow, QMenuBar,
                                QPlainTextEdit)
@@ -33,15 +35,43 @@ class Graph(QMainWindow):
         self.sub_graph_2.set_title("Reactor Temps")
         self.sub_graph_3.set_title("Voltage")
         self.sub_graph_4.set_title("PWM")
-        
-        self.values = [[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[]]
+
+        #the lines are created once with their legends, later only their data is replaced
+        #they are animated, so they are not part of the background that is restored for blitting
+        self.axes = [self.sub_graph_1, self.sub_graph_2, self.sub_graph_3, self.sub_graph_4]
+        self.axes_columns = [
+            [[1, "t_set"], [2, "t_pre"], [8, "t_A"], [9, "t_B"], [10, "t_out"]],
+            [[1, "t_set"], [3, "t_r1"], [4, "t_r2"], [5, "t_r3"], [6, "t_r4"], [7, "t_r5"]],
+            [[11, "U_pre"], [12, "U_r1"], [13, "U_r2"], [14, "U_r3"], [15, "U_r4"], [16, "U_r5"]],
+            [[17, "PWM_pre"], [18, "PWM_r1"], [19, "PWM_r2"], [20, "PWM_r3"], [21, "PWM_r4"], [22, "PWM_r5"]],
+            ]
+        self.lines = []
+        self.axes_lines = {}
+        for axes, columns in zip(self.axes, self.axes_columns):
+            self.axes_lines[axes] = []
+            for idx, label in columns:
+                line, = axes.plot([], [], label = label, animated = True)
+                self.lines.append([line, idx])
+                self.axes_lines[axes].append([line, idx])
+            axes.legend(loc=1)
+            #zooming and panning with the toolbar decimates the newly visible range
+            axes.callbacks.connect("xlim_changed", self.on_xlim_changed)
+        self.axes_columns = [[idx for idx, label in columns] for columns in self.axes_columns]
+
         self.new_point_list = []
+        self.ranges = {}
+        self.background = None
+        self.plotted_buffer = None
+        self.plotted_samples = 0
+        self.plotted_markers = 0
+        self.updating = False
 
         #now we put the figure into a canvas that we can insert into our actual GUI window
         self.canvas = FigureCanvasQTAgg(self.graph)
 
         #and we set this canvas as the main widget of the second tab
         self.setCentralWidget(self.canvas)
+        self.canvas.mpl_connect("draw_event", self.on_draw)
 
         #as for the first tab, we create a help text on the side, and a menu at the top
         # self.helpWindow = QDockWidget()
@@ -68,152 +98,138 @@ class Graph(QMainWindow):
         self.toolbar = NavigationToolbar2QT(self.canvas, self)
 
         self.addToolBar(self.toolbar)
-    
-    def real_time_plotter(self, buffer):
-        #this is the function that plots the data from the equipment in real time
-
-        self.sub_graph_1.clear()
-        self.sub_graph_2.clear()
-        self.sub_graph_3.clear()
-        self.sub_graph_4.clear()
-
-        self.values = [[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[]]
 
-        self.sub_graph_1.set_title("Inlet Temp")
-        self.sub_graph_2.set_title("Reactor Temp")
-        self.sub_graph_3.set_title("Voltage")
-        self.sub_graph_4.set_title("PWM")
-
-        try:
-            for i in self.instance.strategy.datalist:
-                for j in range(len(self.values)):
-                    self.values[j].append(i[j])
-
-            #and then we plot our new values into the empty graphs
-              
-            self.sub_graph_1.plot(self.values[0], self.values[1], label = "t_set")
-            self.sub_graph_1.plot(self.values[0], self.values[2], label = "t_pre")
-            self.sub_graph_1.plot(self.values[0], self.values[8], label = "t_A")
-            self.sub_graph_1.plot(self.values[0], self.values[9], label = "t_B")
-            self.sub_graph_1.plot(self.values[0], self.values[10], label = "t_out")
-            self.sub_graph_1.legend(loc=1)
-            
-            self.sub_graph_2.plot(self.values[0], self.values[1], label = "t_set")
-            self.sub_graph_2.plot(self.values[0], self.values[3], label = "t_r1")
-            self.sub_graph_2.plot(self.values[0], self.values[4], label = "t_r2")
-            self.sub_graph_2.plot(self.values[0], self.values[5], label = "t_r3")
-            self.sub_graph_2.plot(self.values[0], self.values[6], label = "t_r4")
-            self.sub_graph_2.plot(self.values[0], self.values[7], label = "t_r5")
-            self.sub_graph_2.legend(loc=1)
-            
-            self.sub_graph_3.plot(self.values[0], self.values[11], label = "U_pre")
-            self.sub_graph_3.plot(self.values[0], self.values[12], label = "U_r1")
-            self.sub_graph_3.plot(self.values[0], self.values[13], label = "U_r2")
-            self.sub_graph_3.plot(self.values[0], self.values[14], label = "U_r3")
-            self.sub_graph_3.plot(self.values[0], self.values[15], label = "U_r4")
-            self.sub_graph_3.plot(self.values[0], self.values[16], label = "U_r5")
-            self.sub_graph_3.legend(loc=1)
-
-            
-            self.sub_graph_4.plot(self.values[0], self.values[17], label = "PWM_pre")
-            self.sub_graph_4.plot(self.values[0], self.values[18], label = "PWM_r1")
-            self.sub_graph_4.plot(self.values[0], self.values[19], label = "PWM_r2")
-            self.sub_graph_4.plot(self.values[0], self.values[20], label = "PWM_r3")
-            self.sub_graph_4.plot(self.values[0], self.values[21], label = "PWM_r4")
-            self.sub_graph_4.plot(self.values[0], self.values[22], label = "PWM_r5")
-            self.sub_graph_4.legend(loc=1)
-
-        except:
-            pass
+        #every 2000 miliseconds the graphs are refreshed with the new samples
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(2000)
     
-        #try:
-        #    lower_limit_temp = int(self.values[1][0]) - 5
-        #    upper_limit_temp = int(self.values[1][0]) + 5
-        #    self.sub_graph_1.set_ylim([lower_limit_temp, upper_limit_temp])
-        #    self.sub_graph_2.set_ylim([lower_limit_temp, upper_limit_temp])
-
-        #except:
-        #    pass
-
+    def real_time_plotter(self, buffer = None):
+        #this is the function that plots the data from the equipment in real time, including the finished points
         try:
-            for i in self.instance.point_finished_list:
-                self.sub_graph_1.axvline(x=i, color='r')
-                self.sub_graph_2.axvline(x=i, color='r')
-                self.sub_graph_3.axvline(x=i, color='r')
-                self.sub_graph_4.axvline(x=i, color='r')
-        except:
+            self.update_plot(self.instance.strategy.datalist, self.instance.point_finished_list)
+        except AttributeError:
             pass
 
-    def graph_only_plotter(self, buffer):
-        
-        self.sub_graph_1.clear()
-        self.sub_graph_2.clear()
-        self.sub_graph_3.clear()
-        self.sub_graph_4.clear()
-
-        self.values = [[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[]]
-
-        self.sub_graph_1.set_title("Inlet Temp")
-        self.sub_graph_2.set_title("Reactor Temp")
-        self.sub_graph_3.set_title("Voltage")
-        self.sub_graph_4.set_title("PWM")
-
-        try:
-            for i in range(len(self.instance.output_values)):
-                for j in self.instance.output_values[i]:
-                    self.values[i].append(j)
-
-            #and then we plot our new values into the empty graphs
-              
-            self.sub_graph_1.plot(self.values[0], self.values[1], label = "t_set")
-            self.sub_graph_1.plot(self.values[0], self.values[2], label = "t_pre")
-            self.sub_graph_1.plot(self.values[0], self.values[8], label = "t_A")
-            self.sub_graph_1.plot(self.values[0], self.values[9], label = "t_B")
-            self.sub_graph_1.plot(self.values[0], self.values[10], label = "t_out")
-            self.sub_graph_1.legend(loc=1)
-            
-            self.sub_graph_2.plot(self.values[0], self.values[1], label = "t_set")
-            self.sub_graph_2.plot(self.values[0], self.values[3], label = "t_r1")
-            self.sub_graph_2.plot(self.values[0], self.values[4], label = "t_r2")
-            self.sub_graph_2.plot(self.values[0], self.values[5], label = "t_r3")
-            self.sub_graph_2.plot(self.values[0], self.values[6], label = "t_r4")
-            self.sub_graph_2.plot(self.values[0], self.values[7], label = "t_r5")
-            self.sub_graph_2.legend(loc=1)
-            
-            self.sub_graph_3.plot(self.values[0], self.values[11], label = "U_pre")
-            self.sub_graph_3.plot(self.values[0], self.values[12], label = "U_r1")
-            self.sub_graph_3.plot(self.values[0], self.values[13], label = "U_r2")
-            self.sub_graph_3.plot(self.values[0], self.values[14], label = "U_r3")
-            self.sub_graph_3.plot(self.values[0], self.values[15], label = "U_r4")
-            self.sub_graph_3.plot(self.values[0], self.values[16], label = "U_r5")
-            self.sub_graph_3.legend(loc=1)
-
-            
-            self.sub_graph_4.plot(self.values[0], self.values[17], label = "PWM_pre")
-            self.sub_graph_4.plot(self.values[0], self.values[18], label = "PWM_r1")
-            self.sub_graph_4.plot(self.values[0], self.values[19], label = "PWM_r2")
-            self.sub_graph_4.plot(self.values[0], self.values[20], label = "PWM_r3")
-            self.sub_graph_4.plot(self.values[0], self.values[21], label = "PWM_r4")
-            self.sub_graph_4.plot(self.values[0], self.values[22], label = "PWM_r5")
-            self.sub_graph_4.legend(loc=1)
-
-        except:
-            pass
-    
-        #try:
-        #    lower_limit_temp = int(self.values[1][0]) - 5
-        #    upper_limit_temp = int(self.values[1][0]) + 5
-        #    self.sub_graph_1.set_ylim([lower_limit_temp, upper_limit_temp])
-        #    self.sub_graph_2.set_ylim([lower_limit_temp, upper_limit_temp])
-
-        #except:
-        #    pass
-
-        #try:
-        #    for i in self.instance.point_finished_list:
-        #        self.sub_graph_1.axvline(x=i, color='r')
-        #        self.sub_graph_2.axvline(x=i, color='r')
-        #        self.sub_graph_3.axvline(x=i, color='r')
-        #        self.sub_graph_4.axvline(x=i, color='r')
-        #except:
-        #    pass
+    def graph_only_plotter(self, buffer = None):
+        self.update_plot(self.instance.samples, [])
+
+    def refresh(self):
+        #this function is called by the timer and shows the samples that the initialization tab currently records
+        #while a run is active, its batches of samples refresh the graphs (see add_samples)
+        if self.instance.controller.is_running():
+            return
+        self.update_plot(self.instance.samples, self.instance.point_finished_list)
+
+    def add_samples(self, rows):
+        #this function is called with the rows that a run hands over, so only they have to be checked against the limits
+        self.update_plot(self.instance.samples, self.instance.point_finished_list, rows)
+
+    def update_plot(self, samples, markers, rows = None):
+        #the lines are only given the new data, everything else stays as it is
+        if samples is not self.plotted_buffer:
+            self.reset_plot(samples)
+
+        #the buffer may only keep the latest samples, so the samples are counted from the beginning of the run
+        data, count = samples.since(0)
+        if rows is None:
+            if count == self.plotted_samples and len(markers) == self.plotted_markers:
+                return
+            new_data = data[max(len(data) - (count - self.plotted_samples), 0):]
+        else:
+            #the rows of a run are exactly the samples since its last batch, the buffer may already hold the next ones
+            new_data = rows
+
+        full_redraw = self.background is None
+        self.plotted_samples = count
+
+        #the markers of the finished points are drawn once and then belong to the background
+        for value in markers[self.plotted_markers:]:
+            for axes in self.axes:
+                axes.axvline(x=value, color='r')
+            full_redraw = True
+        self.plotted_markers = len(markers)
+
+        self.updating = True
+        for axes, columns in zip(self.axes, self.axes_columns):
+            if self.extend_limits(axes, columns, data, new_data):
+                full_redraw = True
+        self.updating = False
+        self.set_line_data(data, self.axes)
+
+        if full_redraw:
+            #the draw event stores the new background and draws the lines
+            self.canvas.draw_idle()
+            return
+
+        self.canvas.restore_region(self.background)
+        for line, idx in self.lines:
+            self.graph.draw_artist(line)
+        self.canvas.blit(self.graph.bbox)
+
+    def set_line_data(self, data, axes_list):
+        #the lines only get the visible samples, decimated to the minimum and maximum per pixel of the axes width
+        for axes in axes_list:
+            lower, upper = axes.get_xlim()
+            start, stop = Decimation.visible_range(data[:, 0], lower, upper)
+            visible = data[start:stop]
+            num_buckets = max(int(axes.bbox.width), 1)
+            for line, idx in self.axes_lines[axes]:
+                line.set_data(*Decimation.min_max(visible[:, 0], visible[:, idx], num_buckets))
+
+    def on_xlim_changed(self, axes):
+        #the limits that are set by update_plot itself are followed by set_line_data anyway
+        if self.updating or self.plotted_buffer is None:
+            return
+        self.set_line_data(self.plotted_buffer.snapshot(), [axes])
+
+    def reset_plot(self, samples):
+        #a new buffer means a new run, so the old markers and limits are removed
+        self.plotted_buffer = samples
+        self.plotted_samples = 0
+        self.plotted_markers = 0
+        self.updating = False
+        for axes in self.axes:
+            for marker in list(axes.lines):
+                if not marker.get_animated():
+                    marker.remove()
+            axes.set_autoscale_on(True)
+            self.ranges[axes] = None
+        self.background = None
+
+    def extend_limits(self, axes, columns, data, new_data):
+        #the limits get some headroom, so that they only change from time to time and not with every sample
+        #after the user zoomed or panned with the toolbar, the limits are left alone
+        changed = False
+        if len(new_data) == 0:
+            return changed
+
+        if axes.get_autoscalex_on():
+            lower, upper = axes.get_xlim()
+            if data[0, 0] < lower or data[-1, 0] > upper:
+                span = max(data[-1, 0] - data[0, 0], 1.0)
+                axes.set_xlim(data[0, 0], data[-1, 0] + 0.25 * span, auto=None)
+                changed = True
+
+        values = new_data[:, columns]
+        values = values[np.isfinite(values)]
+        if len(values) == 0:
+            return changed
+        if self.ranges[axes] is None:
+            self.ranges[axes] = [values.min(), values.max()]
+        else:
+            self.ranges[axes] = [min(self.ranges[axes][0], values.min()), max(self.ranges[axes][1], values.max())]
+
+        if axes.get_autoscaley_on():
+            lower, upper = axes.get_ylim()
+            if self.ranges[axes][0] < lower or self.ranges[axes][1] > upper:
+                margin = max(self.ranges[axes][1] - self.ranges[axes][0], 1.0) * 0.1
+                axes.set_ylim(self.ranges[axes][0] - margin, self.ranges[axes][1] + margin, auto=None)
+                changed = True
+        return changed
+
+    def on_draw(self, event):
+        #after every full redraw (new limits, resizing, toolbar) the background without the lines is stored again
+        self.background = self.canvas.copy_from_bbox(self.graph.bbox)
+        for line, idx in self.lines:
+            self.graph.draw_artist(line)
@@ -1,14 +1,9 @@
 #first we import all the modules needed for this script
-import random
-import threading
-import time
-
-import automat.Auto as Auto
-import automat.Communication as Communication
+import automat.Sample_Buffer as Sample_Buffer
 import automat.Strategy_OCAE as Strategy_OCAE
-import serial
+from Run_Controller import Run_Controller
 from PySide6.QtCore import Qt
-from PySide6.QtGui import QAction
+from PySide6.QtGui import QAction, QActionGroup
 from PySide6.QtWidgets import (QDockWidget, QGridLayout, QLabel, QLineEdit,
                                QMainWindow, QMenuBar, QPlainTextEdit,
                                QPushButton, QTableWidget, QTableWidgetItem,
@@ -46,10 +41,16 @@ class Initialization(QMainWindow):
 
         # and finally some buttons which we connect to functions of this class
         self.start_opt = QPushButton("Start Recording")
-        self.start_opt.clicked.connect(lambda:[self.data_thread()])
+        self.start_opt.clicked.connect(lambda:[self.start_run(self.get_mode())])
 
         self.stop_opt = QPushButton("Stop Recording")
-        self.stop_opt.clicked.connect(lambda:[self.data_thread.stop_all_Threads()])
+        self.stop_opt.clicked.connect(lambda:[self.controller.cancel()])
+
+        self.pause_opt = QPushButton("Pause Recording")
+        self.pause_opt.setCheckable(True)
+        self.pause_opt.toggled.connect(self.pause_run)
+
+        self.state_label = QLabel("Idle")
 
         # now we make a widget with a specific height
         self.overall_main = QWidget()
@@ -83,6 +84,8 @@ class Initialization(QMainWindow):
 
         self.overall_grid.addWidget(self.start_opt, 2,0)
         self.overall_grid.addWidget(self.stop_opt, 3,0)
+        self.overall_grid.addWidget(self.pause_opt, 4,0)
+        self.overall_grid.addWidget(self.state_label, 4,1)
         
         self.data_table = QTableWidget(10,4)
         for i in range(4):
@@ -108,20 +111,36 @@ class Initialization(QMainWindow):
         # self.helpWindow.setWidget(self.subwidget)
         # self.addDockWidget(Qt.RightDockWidgetArea,self.helpWindow)
 
-        # and we also make a menu bar with some actions in it, but they don't do anything yet
+        # and we also make a menu bar, in which the mode of the next run is chosen
+        # without a checked action, the start button runs the test points with simulated values
         self.menuBar = QMenuBar()
-        self.menu = self.menuBar.addMenu("Menu")
-        self.action1= QAction("Function 1", self.menu, checkable=True)
-        self.action2= QAction("Function 2", self.menu, checkable=True)
-        self.action3= QAction("Function 3", self.menu, checkable=True)
-        self.menu.addAction(self.action1)
-        self.menu.addAction(self.action2)
-        self.menu.addAction(self.action3)
+        self.menu = self.menuBar.addMenu("Mode")
+        self.mode_group = QActionGroup(self.menu)
+        self.mode_group.setExclusionPolicy(QActionGroup.ExclusionPolicy.ExclusiveOptional)
+        self.action1= QAction("Real Points", self.menu, checkable=True)
+        self.action1.setData("real_points")
+        self.action2= QAction("Calorimeter Only", self.menu, checkable=True)
+        self.action2.setData("calorimeter_only")
+        self.action3= QAction("Graphs Only", self.menu, checkable=True)
+        self.action3.setData("graphs_only")
+        for action in (self.action1, self.action2, self.action3):
+            self.mode_group.addAction(action)
+            self.menu.addAction(action)
 
         self.setMenuBar(self.menuBar)
 
         self.point_finished_list = []
 
+        # the samples shown in the graphs, the strategies bring their own buffer
+        self.samples = Sample_Buffer.Buffer()
+
+        # the runs are carried out by a worker on its own thread, the results come back as signals
+        self.controller = Run_Controller(self)
+        self.controller.buffer_changed.connect(self.set_samples)
+        self.controller.point_finished.connect(self.point_finished_list.append)
+        self.controller.state_changed.connect(self.state_label.setText)
+        self.controller.finished.connect(self.run_finished)
+
     
     def insert_in_table(cls,number: int, values: list):
         """ this function is used to put a list of values into a specific row of our table widget"""
@@ -129,17 +148,9 @@ class Initialization(QMainWindow):
             item = QTableWidgetItem()
             item.setText(str(values[i]))
             cls.data_table.setItem(number, (i), item)
-        
-    def data_thread(self):
-        # this is the function that creates a thread which will take our data and put it in the excel sheet
-        self.data_thread = Data_Thread(self, Initialization)
-        self.data_thread.start()
 
-        
-    def test_points(self):
-        
-        val2 = float(self.name_6.text())*1000
-      
+    def get_operation_points(self):
+        """ this function turns the rows of the table widget below the header into operating points"""
         rowdata = []
         for row in range(self.data_table.rowCount()):
                     for column in range(self.data_table.columnCount()):
@@ -148,96 +159,11 @@ class Initialization(QMainWindow):
                             rowdata.append(item.text())
                         else:
                             break
-        
-        # List of operating points
-        operation_point_list = []
 
-        point_number = len(rowdata) // 4
-
-
-        for i in range(0,(point_number*4-4),4):
-            op_time = float(rowdata[i+4]) * 1000
-            temperature = float(rowdata[i+5])
-            flowrate1 = float(rowdata[i+6])
-            flowrate2 = float(rowdata[i+7])
-            print(flowrate1, flowrate2, " flowrates")
-            operation_point_list.append(Strategy_OCAE.operation_point_list_entry(op_time, temperature, [flowrate1, flowrate2]))
-
-
-        print("Number of points: ", len(operation_point_list))
-        
-        # Stoffdaten [mass A, mass B], [volume A, volume B], [molar mass A, molar mass B], [name A, name B]
-        self.substance_data = Strategy_OCAE.substance_data([10, 15], [250, 250], [40.01, 60.05], ["B", "A"])
-        
-        # Erstellen der Strategie
-        self.strategy = Strategy_OCAE.Output_Calculation_Absolute_Evaluation(operation_point_list, self.substance_data, val2, "strategy_test")
-        
-        self.tmp_op = self.strategy.get_operation_point()
-
-        self.output_values= [[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[]]
-        new_point = True
-        time_ = 5
-        while self.tmp_op is not None:
-            if new_point:
-                print("new point")
-                temperature = self.tmp_op.get_temperature()
-                flowrate_list = []
-                for i in range(self.tmp_op.get_number_of_pumps()):
-                    flowrate_list.append(self.tmp_op.get_flowrate(i))
-                self.strategy.push_actual_flowrate(flowrate_list)
-                new_point = False
-
-                try:
-                    self.point_finished_list.append(self.strategy.datalist[-1][0])
-                except:
-                    print("no point recorded yet")
-
-            # points:       Time_Data	T_set	T_pre	T_r1	T_r2	T_r3	T_r4	T_r5	T_A	T_B	T_out	U_pre	U_r1	U_r2	U_r3	U_r4	U_r5	PWM_pre	PWM_r1	PWM_r2	PWM_r3	PWM_r4	PWM_r5	mW_pre	mW_r1	mW_r2	mW_r3	mW_r4	mW_r5
-            self.value = [time_, temperature, temperature, temperature, temperature,  temperature + 0.7, temperature + 0.6, temperature + 0.5, temperature + 0.5, temperature + 0.5, temperature - 0.1, -0.02, 0.45, 0.04, 0.0, 0.0, 0.0, -4.0, -3.0, -1.0, 0.0, 0.0, 0.0, -4.0, -3.0, -1.0, 0.0, 0.0, 0.0]
-            for i in range(1,len(self.value)):
-                self.value[i] = round(self.value[i] * random.randrange(97,103)/100,2)
-            time_ += 1
-        
-            self.strategy.push_value(self.value)
-            print(self.value)
-
-            for i in range(len(self.value)):
-                self.output_values[i].append(float(self.value[i]))
-            self.instance.insert_in_table(self.instance, len(self.output_values[0]), self.value)
-
-        
-            if self.strategy.has_error():
-                raise Exception("error")
-        
-            if self.strategy.point_complete():
-                new_point = True
-                self.tmp_op = self.strategy.get_operation_point()
-        
-            time.sleep(1)
-        self.strategy.get_finish_instruction()
-        print("Done")
-    
-    def real_points(self):
-        
-        dead_time = float(self.name_6.text())*1000
-
-        excel_file_name = "strategy_ocae"
-        
-        rowdata = []
-        for row in range(self.data_table.rowCount()):
-                    for column in range(self.data_table.columnCount()):
-                        item = self.data_table.item(row, column)
-                        if item is not None:
-                            rowdata.append(item.text())
-                            print(item.text())
-                        else:
-                            break
-        
         # List of operating points
         operation_point_list = []
 
         point_number = len(rowdata) // 4
-        print(point_number)
 
         for i in range(0,(point_number*4-4),4):
             op_time = float(rowdata[i+4]) * 1000
@@ -247,165 +173,49 @@ class Initialization(QMainWindow):
             operation_point_list.append(Strategy_OCAE.operation_point_list_entry(op_time, temperature, [flowrate1, flowrate2]))
 
         print("Number of points: ", len(operation_point_list))
-
-        # Substance data 
-        substance_data = Strategy_OCAE.substance_data([4, 6], [50, 50], [40.01, 60.05], ["B", "A"])
-        
-        # Devices used
-        User_Pumps = [[self.template3.text(), self.name_3.text()], [self.template4.text(), self.name_4.text()]] # example: [["HPLC A", "COM12"], ["HPLC B", "COM11"]] 
-        User_Fisher = [self.name_2.text()]
-        Portname_Calorimeter = self.name_1.text()
-        
-        # Setting up the strategy
-        self.strategy = Strategy_OCAE.Output_Calculation_Absolute_Evaluation(operation_point_list, substance_data, dead_time, excel_file_name)
-        
-        # Setting up the automatization
-        self.automat = Auto.matization(self.strategy, User_Pumps, User_Fisher, Portname_Calorimeter)
-        
-        # Automatization is called until the end state is reached
-        while(True):
-            self.automat.tick()
-            if self.automat.get_state() == "Finished":
-                break
-            if self.automat.get_state() == "Error_Thermostat" or self.automat.get_state() == "Error_Pump" or self.automat.get_state() == "Error_Calorimeter" or self.automat.get_state() == "Error":
-                break
-        print("Done")
-    
-    def calorimeter_only(self):
-
-        calorimeter_communication = Communication.Handle(self.name_1.text(), 9600, Communication.Handle.PARITY_NONE, 1)
-     
-        val2 = float(self.name_6.text())*1000
-
-        # get the information from the table of the GUI
-        rowdata = []
-        for row in range(self.data_table.rowCount()):
-                    for column in range(self.data_table.columnCount()):
-                        item = self.data_table.item(row, column)
-                        if item is not None:
-                            rowdata.append(item.text())
-                            print(item.text())
-                        else:
-                            break
-        
-        # make a list for the operating points
-        operation_point_list = []
-
-        point_number = len(rowdata) // 4
-        print(point_number)
-
-        # get the data from the rowdata list and transform them into actual operation points and put them in the Strategy list
-        for i in range(0,(point_number*4-4),4):
-            op_time = float(rowdata[i+4]) * 1000
-            temperature = float(rowdata[i+5])
-            flowrate1 = float(rowdata[i+6])
-            flowrate2 = float(rowdata[i+7])
-            operation_point_list.append(Strategy_OCAE.operation_point_list_entry(op_time, temperature, [flowrate1, flowrate2]))
-
-        print("Number of points: ", len(operation_point_list))
-        
-        # Stoffdaten
-        self.substance_data = Strategy_OCAE.substance_data([4, 6], [50, 50], [40.01, 60.05], ["B", "A"])
-        
-        # Erstellen der Strategie
-        self.strategy = Strategy_OCAE.Output_Calculation_Absolute_Evaluation(operation_point_list, self.substance_data, val2, "strategy_test")
-        
-        self.tmp_op = self.strategy.get_operation_point()
-        
-        new_point = True
-        time_ = 15
-        for i in range(10):
-            self.value = calorimeter_communication.receive().decode('utf-8')
-            print(self.value)
-            time.sleep(0.1)
-        
-        temperature = self.tmp_op.get_temperature()
-        print(temperature)
-        calorimeter_communication.send("<1,{0}>\n\r".format(temperature).encode('utf-8'))
-
-        for i in range(10):
-            self.value = calorimeter_communication.receive().decode('utf-8')
-            print(self.value)
-            time.sleep(0.1)
-        self.tmp_op = self.strategy.get_operation_point()
-        
-        while self.tmp_op is not None:
-            if new_point:
-                print("new point")
-                temperature = self.tmp_op.get_temperature()
-                calorimeter_communication.send(temperature)
-                flowrate_list = []
-                for i in range(self.tmp_op.get_number_of_pumps()):
-                    flowrate_list.append(self.tmp_op.get_flowrate(i))
-                self.strategy.push_actual_flowrate(flowrate_list)
-                new_point = False
-
-                try:
-                    self.point_finished_list.append(self.strategy.datalist[-1][0])
-                except:
-                    print("no point recorded yet")
-
-            time.sleep(2)
-            self.value = calorimeter_communication.receive().decode('utf-8')
-            self.value = self.value.split()
-            self.output_values=[]
-            for i in self.value:
-                self.output_values.append(float(i))
-            time_ += 2
-        
-            self.strategy.push_value(self.output_values)
-            print(self.value)
-        
-            if self.strategy.has_error():
-                raise Exception("error")
-        
-            if self.strategy.point_complete():
-                new_point = True
-                self.tmp_op = self.strategy.get_operation_point()
-        
-            time.sleep(1)
-        self.strategy.get_finish_instruction()
-        print("Done")
-        
-    def graphs_only(self):
-
-        calorimeter_communication = Communication.Handle(self.name_1.text(), 9600, Communication.Handle.PARITY_NONE, 1)
-
-        for i in range(10):
-            self.value = calorimeter_communication.receive().decode('utf-8')
-            print(self.value)
-            time.sleep(0.1)
-
-        self.output_values= [[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[],[]]
-        
-        while not self.data_thread.stop_threads:
-            time.sleep(2)
-            self.value = calorimeter_communication.receive().decode('utf-8')
-            self.values = self.value.split()
-            print(self.value)
-            self.instance.insert_in_table(self.instance, len(self.output_values[0]), self.values)
-
-            for i in range(len(self.values)):
-                self.output_values[i].append(float(self.values[i]))
-
-
-class Data_Thread(threading.Thread):
-    #this is a class for a thread. It is used to continuously carry out a function while
-    #letting us still use the rest of the GUI.
-    def __init__(self, use, task):
-        super(Data_Thread, self).__init__()
-        self.use = use
-        self.task = task
-    def run(self):
-        self.stop_threads = False
-        while self.stop_threads == False:
-            self.task.test_points(self.use)
-            break
-        print ("Thread ends")
-
-    def stop_all_Threads(self):
-        """function to stop all threads via the stop command"""
-        #we first declare this variable to be a global variable, and then set it to true.
-        #this stops the loop of the thread.
-        self.stop_threads = True
-        print("all Threads stopped")
\ No newline at end of file
+        return operation_point_list
+
+    def get_mode(self):
+        """ this function returns the mode that is checked in the menu, the test points if none is checked"""
+        action = self.mode_group.checkedAction()
+        if action is None:
+            return "test_points"
+        return action.data()
+
+    def start_run(self, mode):
+        """ this function starts a run (test_points, real_points, calorimeter_only or graphs_only) with the settings of the widgets"""
+        if self.controller.is_running():
+            print("a run is already active")
+            return
+
+        # the worker never touches the widgets, so everything it needs is read here
+        settings = {
+            "operation_point_list": self.get_operation_points(),
+            "dead_time": float(self.name_6.text())*1000,
+            "pumps": [[self.template3.text(), self.name_3.text()], [self.template4.text(), self.name_4.text()]], # example: [["HPLC A", "COM12"], ["HPLC B", "COM11"]] 
+            "fisher": [self.name_2.text()],
+            "calorimeter_port": self.name_1.text(),
+            }
+        self.pause_opt.setChecked(False)
+        # the mode can not change while the run is active
+        if self.controller.start(mode, settings):
+            self.menu.setEnabled(False)
+
+    def pause_run(self, checked):
+        if not checked:
+            self.controller.resume()
+        elif not self.controller.pause():
+            print("the run can not be paused")
+            self.pause_opt.setChecked(False)
+
+    def set_samples(self, buffer):
+        # a new run brings a new buffer, the graphs and the table start over with it
+        self.samples = buffer
+        self.point_finished_list.clear()
+        self.instance.show_samples(buffer)
+
+    def run_finished(self, ret):
+        self.pause_opt.setChecked(False)
+        self.menu.setEnabled(True)
+        self.state_label.setText(ret)
+        print("Done:", ret)
@@ -1,5 +1,4 @@
 #first we import all the modules needed for this script
-import matplotlib.animation as animation
 from Data_Processing import Data_Processing
 from Graph_Window import Graph
 from Initialization import Initialization
@@ -38,24 +37,26 @@ class TopLevelWindow(QWidget):
         oTabWidget.addTab(oPage2,"Real-Time Data")
         oTabWidget.addTab(oPage3,"Output Data")
 
-        #this is a fairly complicated part, we give the main window a function which it will call every 2000 miliseconds, to refresh our graphs in the second tab
-        self.anim = animation.FuncAnimation(oPage2.graph, oPage2.graph_only_plotter, interval = 2000)
+        #the graphs in the second tab are given the samples that a run hands over, without a run they refresh themselves with a timer every 2000 miliseconds
+        oPage1.controller.samples_ready.connect(oPage2.add_samples)
+        oPage1.controller.finished.connect(self.run_finished)
+        self.initialization = oPage1
+        self.close_requested = False
 
         #finally, we give the command to actually show all the parts we inserted above on the main window
         self.show()
     
     def closeEvent(self, event: QCloseEvent) -> None:
-        stop_all_Threads()
+        #a running run is cancelled, the window stays open until the devices are shut down and closes once the run is finished
+        if self.initialization.controller.stop():
+            self.close_requested = True
+            event.ignore()
+            return
         return super().closeEvent(event)
 
-
-def stop_all_Threads():
-    """function to stop all threads via the stop command"""
-    # we first declare this variable to be a global variable, and then set it to true.
-    # this stops the loop of the thread.
-    global stop_threads
-    stop_threads = True
-    print("all Threads stopped")
+    def run_finished(self, ret):
+        if self.close_requested:
+            self.close()
 
 
 # ------------------------------------------------------------------------------
@@ -0,0 +1,313 @@
+#first we import all the modules needed for this script
+import asyncio
+import random
+import threading
+import time
+
+import automat.Auto as Auto
+import automat.Communication as Communication
+import automat.Dictionary as Dictionary
+import automat.Sample_Buffer as Sample_Buffer
+import automat.Strategy_OCAE as Strategy_OCAE
+from PySide6.QtCore import QObject, QThread, Signal, Slot
+
+#the new samples are handed to the GUI in batches, at most this often
+sample_interval_s = 0.5
+
+
+class Run_Worker(QObject):
+    """worker object that carries out one run in its own thread, it only talks to the GUI via signals"""
+    #new rows of the sample buffer since the last batch (read-only numpy array)
+    samples_ready = Signal(object)
+    #the sample buffer of the run, it is handed over once at the beginning
+    buffer_changed = Signal(object)
+    #state of the automatization or of the strategy, and "Paused"
+    state_changed = Signal(str)
+    #time of the last sample before a new operating point
+    point_finished = Signal(float)
+    #end state of the run, "Cancelled" or the error message
+    finished = Signal(str)
+
+    def __init__(self, mode, settings):
+        super().__init__()
+
+        #the settings are read from the widgets by the GUI thread before the run starts
+        self.mode = mode
+        self.settings = settings
+
+        self.cancel_request = threading.Event()
+        self.resume_request = threading.Event()
+        self.resume_request.set()
+
+        self.samples = None
+        self.emitted_samples = 0
+        self.last_emit = 0
+        self.state = None
+
+    @Slot()
+    def run(self):
+        """carries out the run of the chosen mode, the finished signal is always emitted"""
+        try:
+            ret = getattr(self, "run_" + self.mode)()
+        except Exception as e:
+            ret = "Error: {}".format(e)
+        if self.samples is not None:
+            self.emit_samples(force = True)
+        self.finished.emit(ret)
+
+    #the following functions are called by the GUI thread
+    def cancel(self):
+        self.cancel_request.set()
+        self.resume_request.set()
+
+    def pause(self):
+        """holds the run at its next wait, the automatization keeps ticking its devices, so it can not be paused"""
+        if self.mode == "real_points":
+            return False
+        self.resume_request.clear()
+        return True
+
+    def resume(self):
+        self.resume_request.set()
+
+    #the following functions are called by the worker thread
+    def wait(self, duration_s):
+        """sleeps like time.sleep, but returns False as soon as the run is cancelled, a pause is held here"""
+        if self.cancel_request.wait(duration_s):
+            return False
+        if not self.resume_request.is_set():
+            self.state_changed.emit("Paused")
+            self.resume_request.wait()
+            if self.cancel_request.is_set():
+                return False
+            self.state_changed.emit(self.state)
+        return True
+
+    def set_state(self, state):
+        if state == self.state:
+            return
+        self.state = state
+        self.state_changed.emit(state)
+
+    def set_buffer(self, buffer):
+        self.samples = buffer
+        self.emitted_samples = 0
+        self.buffer_changed.emit(buffer)
+
+    def emit_samples(self, force = False):
+        """emits the samples that were added since the last batch"""
+        now = time.monotonic()
+        if not force and now - self.last_emit < sample_interval_s:
+            return
+        self.last_emit = now
+        data, self.emitted_samples = self.samples.since(self.emitted_samples)
+        if len(data) > 0:
+            self.samples_ready.emit(data)
+
+    def finish_point(self):
+        if len(self.samples) > 0:
+            self.point_finished.emit(float(self.samples[-1][0]))
+        else:
+            print("no point recorded yet")
+
+    def on_tick(self, automat):
+        self.set_state(automat.get_state())
+        self.emit_samples()
+
+    #the runs
+    def run_test_points(self):
+        #the strategy is fed with simulated values, one per second
+        substance_data = Strategy_OCAE.substance_data([10, 15], [250, 250], [40.01, 60.05], ["B", "A"])
+        strategy = Strategy_OCAE.Output_Calculation_Absolute_Evaluation(self.settings["operation_point_list"], substance_data, self.settings["dead_time"], "strategy_test")
+
+        tmp_op = strategy.get_operation_point()
+        self.set_buffer(strategy.datalist)
+
+        new_point = True
+        time_ = 5
+        ret = "Finished"
+        while tmp_op is not None:
+            if new_point:
+                temperature = tmp_op.get_temperature()
+                flowrate_list = []
+                for i in range(tmp_op.get_number_of_pumps()):
+                    flowrate_list.append(tmp_op.get_flowrate(i))
+                strategy.push_actual_flowrate(flowrate_list)
+                new_point = False
+                self.finish_point()
+
+            # points:       Time_Data	T_set	T_pre	T_r1	T_r2	T_r3	T_r4	T_r5	T_A	T_B	T_out	U_pre	U_r1	U_r2	U_r3	U_r4	U_r5	PWM_pre	PWM_r1	PWM_r2	PWM_r3	PWM_r4	PWM_r5	mW_pre	mW_r1	mW_r2	mW_r3	mW_r4	mW_r5
+            value = [time_, temperature, temperature, temperature, temperature,  temperature + 0.7, temperature + 0.6, temperature + 0.5, temperature + 0.5, temperature + 0.5, temperature - 0.1, -0.02, 0.45, 0.04, 0.0, 0.0, 0.0, -4.0, -3.0, -1.0, 0.0, 0.0, 0.0, -4.0, -3.0, -1.0, 0.0, 0.0, 0.0]
+            for i in range(1,len(value)):
+                value[i] = round(value[i] * random.randrange(97,103)/100,2)
+            time_ += 1
+
+            strategy.push_value(value)
+            self.set_state(strategy.state.name)
+            self.emit_samples()
+
+            if strategy.has_error():
+                raise Exception("error")
+
+            if strategy.point_complete():
+                new_point = True
+                tmp_op = strategy.get_operation_point()
+
+            if not self.wait(1):
+                ret = "Cancelled"
+                break
+        strategy.get_finish_instruction()
+        return ret
+
+    def run_real_points(self):
+        substance_data = Strategy_OCAE.substance_data([4, 6], [50, 50], [40.01, 60.05], ["B", "A"])
+
+        #setting up the strategy and the automatization
+        strategy = Strategy_OCAE.Output_Calculation_Absolute_Evaluation(self.settings["operation_point_list"], substance_data, self.settings["dead_time"], "strategy_ocae")
+        self.set_buffer(strategy.datalist)
+        automat = Auto.matization(strategy, self.settings["pumps"], self.settings["fisher"], self.settings["calorimeter_port"])
+
+        #a cancelled automatization shuts the devices down before it ends
+        return asyncio.run(Auto.run_async(automat, stop_request = self.cancel_request, on_tick = self.on_tick))
+
+    def receive_lines(self, calorimeter_communication, num):
+        #the first lines of the calorimeter are only waited for, they are not recorded
+        for i in range(num):
+            calorimeter_communication.receive()
+            if not self.wait(0.1):
+                return False
+        return True
+
+    def run_calorimeter_only(self):
+        calorimeter_communication = Communication.Handle(self.settings["calorimeter_port"], 9600, Communication.Handle.PARITY_NONE, 1, reader_thread=False)
+        substance_data = Strategy_OCAE.substance_data([4, 6], [50, 50], [40.01, 60.05], ["B", "A"])
+        strategy = Strategy_OCAE.Output_Calculation_Absolute_Evaluation(self.settings["operation_point_list"], substance_data, self.settings["dead_time"], "strategy_test")
+
+        tmp_op = strategy.get_operation_point()
+        self.set_buffer(strategy.datalist)
+
+        ret = "Cancelled"
+        try:
+            if not self.receive_lines(calorimeter_communication, 10):
+                return ret
+
+            temperature = tmp_op.get_temperature()
+            calorimeter_communication.send("<1,{0}>\n\r".format(temperature).encode('utf-8'))
+
+            if not self.receive_lines(calorimeter_communication, 10):
+                return ret
+            tmp_op = strategy.get_operation_point()
+
+            new_point = True
+            while tmp_op is not None:
+                if new_point:
+                    temperature = tmp_op.get_temperature()
+                    calorimeter_communication.send(temperature)
+                    flowrate_list = []
+                    for i in range(tmp_op.get_number_of_pumps()):
+                        flowrate_list.append(tmp_op.get_flowrate(i))
+                    strategy.push_actual_flowrate(flowrate_list)
+                    new_point = False
+                    self.finish_point()
+
+                if not self.wait(2):
+                    return ret
+                value = calorimeter_communication.receive().decode('utf-8')
+                strategy.push_value([float(i) for i in value.split()])
+                self.set_state(strategy.state.name)
+                self.emit_samples()
+
+                if strategy.has_error():
+                    raise Exception("error")
+
+                if strategy.point_complete():
+                    new_point = True
+                    tmp_op = strategy.get_operation_point()
+
+                if not self.wait(1):
+                    return ret
+            ret = "Finished"
+        finally:
+            strategy.get_finish_instruction()
+        return ret
+
+    def run_graphs_only(self):
+        calorimeter_communication = Communication.Handle(self.settings["calorimeter_port"], 9600, Communication.Handle.PARITY_NONE, 1, reader_thread=False)
+
+        self.set_buffer(Sample_Buffer.Buffer(max_length = Dictionary.samples["window_rows"]))
+        if not self.receive_lines(calorimeter_communication, 10):
+            return "Cancelled"
+
+        #the samples are only shown, so this mode runs until it is cancelled
+        self.set_state("Recording")
+        while self.wait(2):
+            value = calorimeter_communication.receive().decode('utf-8')
+            self.samples.append([float(i) for i in value.split()])
+            self.emit_samples()
+        return "Cancelled"
+
+
+class Run_Controller(QObject):
+    """starts the runs on a QThread and forwards the signals of their worker, it lives in the GUI thread"""
+    samples_ready = Signal(object)
+    buffer_changed = Signal(object)
+    state_changed = Signal(str)
+    point_finished = Signal(float)
+    finished = Signal(str)
+
+    def __init__(self, parent = None):
+        super().__init__(parent)
+        self.thread = None
+        self.worker = None
+
+    def is_running(self):
+        return self.thread is not None
+
+    def start(self, mode, settings):
+        """starts a run of the given mode (test_points, real_points, calorimeter_only or graphs_only), only one run at a time"""
+        if self.is_running():
+            return False
+
+        self.thread = QThread()
+        self.worker = Run_Worker(mode, settings)
+        self.worker.moveToThread(self.thread)
+
+        self.worker.samples_ready.connect(self.samples_ready)
+        self.worker.buffer_changed.connect(self.buffer_changed)
+        self.worker.state_changed.connect(self.state_changed)
+        self.worker.point_finished.connect(self.point_finished)
+        self.worker.finished.connect(self.on_finished)
+
+        self.thread.started.connect(self.worker.run)
+        self.thread.start()
+        return True
+
+    def on_finished(self, ret):
+        #the worker is done, so the thread can be ended without waiting for long
+        self.thread.quit()
+        self.thread.wait()
+        self.worker.deleteLater()
+        self.thread.deleteLater()
+        self.thread = None
+        self.worker = None
+        self.finished.emit(ret)
+
+    def cancel(self):
+        if self.worker is not None:
+            self.worker.cancel()
+
+    def pause(self):
+        if self.worker is None:
+            return False
+        return self.worker.pause()
+
+    def resume(self):
+        if self.worker is not None:
+            self.worker.resume()
+
+    def stop(self):
+        """cancels the run without waiting for it, returns True if a run is still shutting down its devices (the finished signal follows)"""
+        if self.thread is None:
+            return False
+        self.worker.cancel()
+        return True
@@ -2,22 +2,31 @@
 # and the following additional relevant classes and functions for 
 # the construction of this class: the required state classes, which 
 # can be assigned to the layers (A) and (B), functions for generating 
-# the drivers of each device and a function concerning the user's input.
+# the drivers of each device, a function concerning the user's input 
+# and the runners, which call the state machine until an end state is 
+# reached. Optionally, each driver is ticked by its own thread (see 
+# Driver_Worker).
 
 # library/modules from python:
-import time
+import asyncio
+import threading
 import math
 
 # own scripts:
 import automat.Calibration as Calibration
 import automat.Calorimeter as Calorimeter
+import automat.Clock as Clock
 import automat.Communication as Communication
 import automat.Dictionary as Dictionary
+import automat.Driver_Worker as Driver_Worker
 import automat.Fisher as Fisher
 import automat.HPLC as HPLC
 import automat.Lambda as Lambda
 import automat.LayerB as LayerB
+import automat.Metrics as Metrics
+import automat.Trace as Trace
 import automat.pyState as pyState
+import automat.Sample_Buffer as Sample_Buffer
 
 # layer (B) states:
 class Set_Operating_Point(pyState.State_Base):
@@ -57,12 +66,10 @@ class Operating(pyState.State_Base):
         self.calodata_idx = calodata_idx
         
     def __call__(self):
-        push_empty = True
-        while self.calodata_idx[0] < len(self.calodata):
-            push_empty = False
-            self.operating_point_strategy.push_value(self.calodata[self.calodata_idx[0]])
-            self.calodata_idx[0] += 1
-        if push_empty:
+        new_lines, self.calodata_idx[0] = self.calodata.since(self.calodata_idx[0])
+        for line in new_lines:
+            self.operating_point_strategy.push_value(line)
+        if len(new_lines) == 0:
             self.operating_point_strategy.push_value(None)
             
         if self.operating_point_strategy.has_error():
@@ -71,6 +78,9 @@ class Operating(pyState.State_Base):
         if self.operating_point_strategy.point_complete():
             return "next"
 
+    def get_wakeup(self):
+        return self.operating_point_strategy.get_wakeup()
+
 # layer (A) states:
 class Apply_Configuration(pyState.State_Base):
     """This state runs the configuration state of all devices and puts them all in a deactivated mode."""
@@ -82,7 +92,7 @@ class Apply_Configuration(pyState.State_Base):
         self.calorimeter = calorimeter
         self.calodata = calodata
 
-        self.deadline = time.monotonic_ns() + 60 * 1E9
+        self.deadline = Clock.now_ns() + 60 * 1E9
 
     def __call__(self):
 
@@ -92,7 +102,7 @@ class Apply_Configuration(pyState.State_Base):
         self.thermostat.tick()
         self.calorimeter.tick()
 
-        if self.deadline < time.monotonic_ns():
+        if self.deadline < Clock.now_ns():
             return "error"
 
         if self.thermostat.get_state() == "Error":
@@ -117,54 +127,57 @@ class Apply_Configuration(pyState.State_Base):
 
         return "next"
 
+    def get_wakeup(self):
+        return pyState.earliest([self.deadline] + get_driver_wakeups(self.pump_list, self.thermostat, self.calorimeter))
+
 class List_Processing(pyState.State_Base):
     """This state ensures the processing of the operating points."""
-    class factory:
-        def __init__(self, pump_list, thermostat, calorimeter, calodata, operating_point_strategy):
+    class factory(pyState.Factory_Base):
+        def arm(self, pump_list, thermostat, calorimeter, calodata, operating_point_strategy):
             self.pump_list = pump_list
             self.thermostat = thermostat
             self.calorimeter = calorimeter
             self.operating_point_strategy = operating_point_strategy
             self.calodata = calodata
-            self.calodata_idx = [len(calodata)]
-
-        def create_state(self, state_name):
-            if state_name == "Set_Operating_Point":
-                tmp_operation_point = self.operating_point_strategy.get_operation_point()
-                if tmp_operation_point is not None:
-                    st = Set_Operating_Point()
-                    st.enter(self.operating_point_strategy, self.pump_list, self.thermostat, self.calorimeter, tmp_operation_point)
-                    return st
-                else:
-                    st = pyState.State_Base()
-                    st.enter("Finished")
-                    return st
-            elif state_name == "Operating":
-                st = Operating()
-                st.enter(self.operating_point_strategy, self.calodata, self.calodata_idx)
-                return st    
-            elif state_name == "Error":
-                st = pyState.State_Base()
-                st.enter(state_name)
+            self.calodata_idx = [calodata.get_count()]
+
+        def create_Set_Operating_Point(self, state_name):
+            tmp_operation_point = self.operating_point_strategy.get_operation_point()
+            if tmp_operation_point is not None:
+                st = self.reuse(Set_Operating_Point, state_name)
+                st.enter(self.operating_point_strategy, self.pump_list, self.thermostat, self.calorimeter, tmp_operation_point)
+                return st
+            else:
+                st = self.reuse(pyState.State_Base, state_name)
+                st.enter("Finished")
                 return st
-            raise Exception("Unhandled State in Factory")
+
+        def create_Operating(self, state_name):
+            st = self.reuse(Operating, state_name)
+            st.enter(self.operating_point_strategy, self.calodata, self.calodata_idx)
+            return st
+
+        def create_Error(self, state_name):
+            st = self.reuse(pyState.State_Base, state_name)
+            st.enter(state_name)
+            return st
+
+    tab = [
+        ["Set_Operating_Point", "next",     "Operating"],
+        ["Operating",           "next",     "Set_Operating_Point"],
+        ["Operating",           "error",    "Error"],
+        ]
 
     def enter(self, pump_list, thermostat, calorimeter, calodata, operating_point_strategy):
         super().enter("List_Processing")
         print("entering state List_Processing")
-        self.tab = [
-            ["Set_Operating_Point", "next",     "Operating"],
-            ["Operating",           "next",     "Set_Operating_Point"],
-            ["Operating",           "error",    "Error"],
-            ]
         self.pump_list = pump_list
         self.thermostat = thermostat
         self.calorimeter = calorimeter
-        self.fac = List_Processing.factory(pump_list, thermostat, calorimeter, calodata, operating_point_strategy)
-        self.en = pyState.Engine(self.tab, self.fac, "Set_Operating_Point")
-        self.en.enter()
+        self.enter_engine(List_Processing.factory, "Set_Operating_Point", pump_list, thermostat, calorimeter, calodata, operating_point_strategy)
 
     def __call__(self):
+        
         for itm in self.pump_list:
             itm.tick()
         self.thermostat.tick()
@@ -192,6 +205,9 @@ class List_Processing(pyState.State_Base):
         self.en.exit()
         super().exit()
 
+    def get_wakeup(self):
+        return pyState.earliest([self.en.get_wakeup()] + get_driver_wakeups(self.pump_list, self.thermostat, self.calorimeter))
+
 class Deactivating(pyState.State_Base):
     """This state first switches off the pumps and then the thermostat. It is used for the regular shutdown as well as for the error shutdown."""
     def enter(self, state_name, leave_thermostat_on, pump_list, thermostat, calorimeter, operating_point_strategy, next_state):
@@ -205,6 +221,9 @@ class Deactivating(pyState.State_Base):
                         print(next_state, "from pump", itm.get_name())
             else:
                 print(next_state)
+            # the trace shows what led to the error
+            if Trace.enabled:
+                print("trace written to", Trace.dump())
 
         self.leave_thermostat_on = leave_thermostat_on
         self.pump_list = pump_list
@@ -219,7 +238,6 @@ class Deactivating(pyState.State_Base):
         operating_point_strategy.get_finish_instruction()
 
     def __call__(self):
-        
         for itm in self.pump_list:
             itm.tick()
         
@@ -253,42 +271,65 @@ class Deactivating(pyState.State_Base):
                 self.name = self.next_state
                 return None
 
+    def get_wakeup(self):
+        return pyState.earliest(get_driver_wakeups(self.pump_list, self.thermostat, self.calorimeter))
+
+def get_driver_wakeups(pump_list, thermostat, calorimeter):
+    ret = []
+    for itm in pump_list + [thermostat, calorimeter]:
+        ret.append(itm.get_wakeup())
+    return ret
+
 # generate the drivers:
 # Achtung: Hier wechseln sich dummy und normales Communication_Handle 
 # ab, je nachdem wie das Programm zuletzt verwendet wurde.
-def generate_hplc(name, port, calibration_func, head, _PMin_ = None, _PMax_ = None):
+# If a simulated plant is given, the handles of the simulated devices 
+# are used instead (see Simulator).
+def generate_hplc(name, port, calibration_func, head, _PMin_ = None, _PMax_ = None, plant = None):
     if head is None:
         raise Exception("No pump head is given")
     settings = HPLC.Driver.Settings(head)
     if not _PMin_ is None and not _PMax_ is None:
         settings.set_PMinMax(_PMin_, _PMax_)
     
-    # ch = Communication.Handle(port, 9600, Communication.Handle.PARITY_NONE, 1)
+    if plant is not None:
+        return HPLC.Driver(name, settings, calibration_func, plant.open_hplc(name, calibration_func))
+
+    # ch = Communication.open_handle(port, 9600, Communication.Handle.PARITY_NONE, 1)
     return HPLC.Driver(name, settings, calibration_func, HPLC.dummy_cmd_handle())
 
-def generate_lambda(name, port, calibration_func, address):
-    # ch = Communication.Handle(port, 2400, Communication.Handle.PARITY_ODD, 1)
+def generate_lambda(name, port, calibration_func, address, plant = None):
+    if plant is not None:
+        return Lambda.Driver(name, address, calibration_func, plant.open_lambda(name, calibration_func, address))
+
+    # ch = Communication.open_handle(port, 2400, Communication.Handle.PARITY_ODD, 1)
     return Lambda.Driver(name, address, calibration_func, Lambda.dummy_cmd_handle())
 
-def generate_fisher(port, _pump_speed = None, _ext_probe = None):
+def generate_fisher(port, _pump_speed = None, _ext_probe = None, plant = None):
     settings = Fisher.Driver.Settings()
     if not _pump_speed is None:
         settings.set_pump_speed(_pump_speed)
     if not _ext_probe is None:
         settings.set_external_probe(_ext_probe)
 
-    # ch = Communication.Handle(port, 9600, Communication.Handle.PARITY_NONE, 1)
+    if plant is not None:
+        return Fisher.Driver("Fisher", settings, plant.open_fisher())
+
+    # ch = Communication.open_handle(port, 9600, Communication.Handle.PARITY_NONE, 1)
     return Fisher.Driver("Fisher", settings, Fisher.dummy_cmd_handle())
 
-def generate_calorimeter(port, datalist):
-    ch = Communication.Handle(port, 9600, Communication.Handle.PARITY_NONE, 1)
+def generate_calorimeter(port, datalist, plant = None):
+    if plant is not None:
+        return Calorimeter.Driver("Calo", datalist, plant.open_calorimeter())
+
+    ch = Communication.open_handle(port, 9600, Communication.Handle.PARITY_NONE, 1)
     return Calorimeter.Driver("Calo", datalist, ch)
 
-def initialize_thermostat(thermostat_specification):
+def initialize_thermostat(thermostat_specification, plant = None):
     if len(thermostat_specification) == 0:
         raise Exception("There is no given specification for the thermostat")
     if len(thermostat_specification) == 1:
-        return generate_fisher(thermostat_specification[0])
+        return generate_fisher(thermostat_specification[0], plant=plant)
     
     _pump_speed = None
     _ext_probe = None
@@ -302,9 +343,9 @@ def initialize_thermostat(thermostat_specification):
         else:
             raise Exception("Given thermostat setting cannot be handled")
 
-    return generate_fisher(thermostat_specification[0], _pump_speed, _ext_probe)
+    return generate_fisher(thermostat_specification[0], _pump_speed, _ext_probe, plant)
 
-def initialize_single_pumpdriver(pump_cfg_entry):
+def initialize_single_pumpdriver(pump_cfg_entry, plant = None):
     length = len(pump_cfg_entry)
     if length < 2:
         raise Exception("Invalid list entry")
@@ -313,20 +354,20 @@ def initialize_single_pumpdriver(pump_cfg_entry):
 
     if pump_name == "HPLC A" or pump_name == "HPLC B" or pump_name == "HPLC C":
         if length == 2:           
-            return generate_hplc(pump_name, pump_cfg_entry[1], Dictionary.pump_calibration[pump_name], Dictionary.pump_head[pump_name])
+            return generate_hplc(pump_name, pump_cfg_entry[1], Dictionary.pump_calibration[pump_name], Dictionary.pump_head[pump_name], plant=plant)
         if length == 4:
-            return generate_hplc(pump_name, pump_cfg_entry[1], Dictionary.pump_calibration[pump_name], Dictionary.pump_head[pump_name], pump_cfg_entry[2], pump_cfg_entry[3])
+            return generate_hplc(pump_name, pump_cfg_entry[1], Dictionary.pump_calibration[pump_name], Dictionary.pump_head[pump_name], pump_cfg_entry[2], pump_cfg_entry[3], plant)
         raise Exception("Invalid list entry")
 
     if pump_name == "Lambda 1" or pump_name == "Lambda 2" or pump_name == "Lambda 3":
-        return generate_lambda(pump_name, pump_cfg_entry[1], Dictionary.pump_calibration[pump_name], Dictionary.lambda_address[pump_name])
+        return generate_lambda(pump_name, pump_cfg_entry[1], Dictionary.pump_calibration[pump_name], Dictionary.lambda_address[pump_name], plant)
     raise Exception("Invalid list entry")
 
-def initialize_all_pumpdrivers(pump_list):
+def initialize_all_pumpdrivers(pump_list, plant = None):
 
     ret = []
     for itm in pump_list:
-        ret.append(initialize_single_pumpdriver(itm))
+        ret.append(initialize_single_pumpdriver(itm, plant))
     return ret
 
 # class and function concerning the user's input:
@@ -340,7 +381,7 @@ def sanity_check_operation_point_list(liste, pump_list):
 # state machine class for the automatization:
 class matization:
 
-    class factory:
+    class factory(pyState.Factory_Base):
         def __init__(self, operating_point_strategy, pump_list, thermostat, calorimeter, calodata):
             self.operating_point_strategy = operating_point_strategy
             self.pump_list = pump_list
@@ -348,53 +389,73 @@ class matization:
             self.calorimeter = calorimeter
             self.calodata = calodata
 
-        def create_state(self, state_name):
-            if state_name == "Apply_Configuration":
-                st = Apply_Configuration()
-                st.enter(self.pump_list, self.thermostat, self.calorimeter, self.calodata)
-                return st
-            elif state_name == "List_Processing":
-                st = List_Processing()
-                st.enter(self.pump_list, self.thermostat, self.calorimeter, self.calodata, self.operating_point_strategy)
-                return st              
-            elif state_name == "Finished":
-                st = Deactivating()
-                st.enter("Shutdown_{}".format(state_name), False, self.pump_list, self.thermostat, self.calorimeter, self.operating_point_strategy, state_name)
-                return st
-            elif state_name == "Error" or state_name == "Error_Calorimeter" or state_name == "Error_Thermostat" or state_name == "Error_Pump":
-                st = Deactivating()
-                st.enter("Shutdown_{}".format(state_name), False, self.pump_list, self.thermostat, self.calorimeter, self.operating_point_strategy, state_name)
-                return st
-            raise Exception("Unhandled State in Factory")
+        def create_Apply_Configuration(self, state_name):
+            st = self.reuse(Apply_Configuration, state_name)
+            st.enter(self.pump_list, self.thermostat, self.calorimeter, self.calodata)
+            return st
 
-    def __init__(self, operating_point_strategy, User_Pumps, User_Fisher, Portname_Calorimeter):
-        self.tab = [
-            ["Apply_Configuration",       "next",     "List_Processing"],
-            ["List_Processing",           "next",     "Finished"],
+        def create_List_Processing(self, state_name):
+            st = self.reuse(List_Processing, state_name)
+            st.enter(self.pump_list, self.thermostat, self.calorimeter, self.calodata, self.operating_point_strategy)
+            return st
 
-            ["Apply_Configuration",        "error_calorimeter",     "Error_Calorimeter"],
-            ["List_Processing",            "error_calorimeter",     "Error_Calorimeter"],
+        def create_Finished(self, state_name):
+            st = self.reuse(Deactivating, state_name)
+            st.enter("Shutdown_{}".format(state_name), False, self.pump_list, self.thermostat, self.calorimeter, self.operating_point_strategy, state_name)
+            return st
 
-            ["Apply_Configuration",        "error_thermostat",      "Error_Thermostat"],
-            ["List_Processing",            "error_thermostat",      "Error_Thermostat"],
+        create_Cancelled = create_Finished
 
-            ["Apply_Configuration",        "error_pump",            "Error_Pump"],
-            ["List_Processing",            "error_pump",            "Error_Pump"],
-            
-            ["Apply_Configuration",        "error",                 "Error"],
-            ["List_Processing",            "error",                 "Error"],
-            ]
+        def create_Error(self, state_name):
+            st = self.reuse(Deactivating, state_name)
+            st.enter("Shutdown_{}".format(state_name), False, self.pump_list, self.thermostat, self.calorimeter, self.operating_point_strategy, state_name)
+            return st
 
-        self.calodata = []
+        create_Error_Calorimeter = create_Error
+        create_Error_Thermostat = create_Error
+        create_Error_Pump = create_Error
+
+    tab = [
+        ["Apply_Configuration",       "next",     "List_Processing"],
+        ["List_Processing",           "next",     "Finished"],
+
+        ["Apply_Configuration",        "error_calorimeter",     "Error_Calorimeter"],
+        ["List_Processing",            "error_calorimeter",     "Error_Calorimeter"],
+
+        ["Apply_Configuration",        "error_thermostat",      "Error_Thermostat"],
+        ["List_Processing",            "error_thermostat",      "Error_Thermostat"],
+
+        ["Apply_Configuration",        "error_pump",            "Error_Pump"],
+        ["List_Processing",            "error_pump",            "Error_Pump"],
+        
+        ["Apply_Configuration",        "error",                 "Error"],
+        ["List_Processing",            "error",                 "Error"],
+
+        ["Apply_Configuration",        "cancel",                "Cancelled"],
+        ["List_Processing",            "cancel",                "Cancelled"],
+        ]
+
+    def __init__(self, operating_point_strategy, User_Pumps, User_Fisher, Portname_Calorimeter, driver_threads = None, plant = None):
+        self.calodata = Sample_Buffer.Buffer(max_length = Dictionary.samples["window_rows"])
+        self.plant = plant
        
-        self.thermostat  = initialize_thermostat(User_Fisher)
-        self.calorimeter = generate_calorimeter(Portname_Calorimeter, self.calodata)
-        self.pump_list = initialize_all_pumpdrivers(User_Pumps)
+        self.thermostat  = initialize_thermostat(User_Fisher, plant)
+        self.calorimeter = generate_calorimeter(Portname_Calorimeter, self.calodata, plant)
+        self.pump_list = initialize_all_pumpdrivers(User_Pumps, plant)
+
+        if driver_threads is None:
+            driver_threads = Dictionary.automatization["driver_threads"]
+        if driver_threads and Clock.current.simulated:
+            raise Exception("Driver threads can not be used with the simulated clock")
+        if driver_threads:
+            self.thermostat = Driver_Worker.Worker(self.thermostat)
+            self.calorimeter = Driver_Worker.Worker(self.calorimeter)
+            self.pump_list = [Driver_Worker.Worker(itm) for itm in self.pump_list]
 
         #sanity_check_operation_point_list(operating_point_strategy, self.pump_list)
 
         self.fac = matization.factory(operating_point_strategy, self.pump_list, self.thermostat, self.calorimeter, self.calodata)
-        self.en = pyState.Engine(self.tab, self.fac, "Apply_Configuration")
+        self.en = pyState.Engine(self.tab, self.fac, "Apply_Configuration", path="Auto")
         self.en.enter()
 
     def tick(self):
@@ -405,4 +466,107 @@ class matization:
 
     def get_state(self):
         return self.en.get_state()
-        
\ No newline at end of file
+
+    def cancel(self):
+        """This function shuts the devices down like at the end of the list. It is ignored once a shutdown has started."""
+        self.en.handle_event("cancel")
+
+    def get_wakeup(self):
+        if self.plant is None:
+            return self.en.get_wakeup()
+        return pyState.earliest([self.en.get_wakeup(), self.plant.get_wakeup()])
+
+    def get_com_handles(self):
+        """The handles of drivers with an own thread are left out, because they wake up the thread of their driver."""
+        ret = []
+        for itm in self.pump_list + [self.thermostat, self.calorimeter]:
+            if not isinstance(itm, Driver_Worker.Worker):
+                ret.append(itm.get_com_handle())
+        return ret
+
+    def get_workers(self):
+        ret = []
+        for itm in self.pump_list + [self.thermostat, self.calorimeter]:
+            if isinstance(itm, Driver_Worker.Worker):
+                ret.append(itm)
+        return ret
+
+    def stop_workers(self):
+        for itm in self.get_workers():
+            itm.stop()
+
+# runners for the automatization:
+end_states = ["Finished", "Cancelled", "Error_Thermostat", "Error_Pump", "Error_Calorimeter", "Error"]
+
+def run(automat, max_sleep_s = 0.05, stop_request = None, on_tick = None):
+    """This function runs the automatization in the calling thread. Between the ticks it sleeps until the earliest wake-up time of the states or until a port has received new bytes. A simulated clock jumps to the wake-up time instead. Once the stop request (threading.Event) is set, the automatization is cancelled. on_tick is called with the automatization after the ticks."""
+    wakeup = threading.Event()
+
+    handles = []
+    for ch in automat.get_com_handles():
+        if isinstance(ch, Communication.Handle) and ch.reader is not None:
+            ch.set_notifier(wakeup.set)
+            handles.append(ch)
+    for itm in automat.get_workers():
+        itm.set_notifier(wakeup.set)
+    reporter = Metrics.start_reporter()
+
+    try:
+        while True:
+            wakeup.clear()
+            if stop_request is not None and stop_request.is_set():
+                automat.cancel()
+            pyState.tick_until_idle(automat)
+            if on_tick is not None:
+                on_tick(automat)
+            if automat.get_state() in end_states:
+                return automat.get_state()
+            if Clock.current.simulated:
+                Clock.jump(automat.get_wakeup(), max_sleep_s)
+                continue
+            wakeup.wait(pyState.get_sleep_s(automat, max_sleep_s))
+    finally:
+        for ch in handles:
+            ch.set_notifier(None)
+        automat.stop_workers()
+        if reporter is not None:
+            reporter.stop()
+
+async def run_async(automat, max_sleep_s = 0.05, stop_request = None, on_tick = None):
+    """This coroutine runs the automatization in an asyncio event loop. Between the ticks it sleeps until the earliest wake-up time of the states or until a port has received new bytes. The stop request and on_tick are handled like in run."""
+    loop = asyncio.get_running_loop()
+    wakeup = asyncio.Event()
+
+    async_handles = []
+    for ch in automat.get_com_handles():
+        if isinstance(ch, Communication.Async_Handle):
+            ch.attach(loop, wakeup)
+            async_handles.append(ch)
+    for itm in automat.get_workers():
+        itm.set_notifier(lambda: loop.call_soon_threadsafe(wakeup.set))
+    reporter = Metrics.start_reporter()
+
+    try:
+        while True:
+            wakeup.clear()
+            if stop_request is not None and stop_request.is_set():
+                automat.cancel()
+            pyState.tick_until_idle(automat)
+            if on_tick is not None:
+                on_tick(automat)
+            if automat.get_state() in end_states:
+                return automat.get_state()
+            if Clock.current.simulated:
+                Clock.jump(automat.get_wakeup(), max_sleep_s)
+                await asyncio.sleep(0)
+                continue
+            try:
+                await asyncio.wait_for(wakeup.wait(), pyState.get_sleep_s(automat, max_sleep_s))
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        for ch in async_handles:
+            ch.detach()
+        automat.stop_workers()
+        if reporter is not None:
+            reporter.stop()
@@ -0,0 +1,140 @@
+# This file contains the batch reprocessing of archived result workbooks
+# of the strategy "Output_Calculation_Absolute_Evaluation". Only the
+# columns of the evaluation sheet that hold the process setup and the
+# mean values are loaded; the heat fluxes and dHr are calculated again
+# with the current calibrations and constants of the dictionary. The
+# workbooks are distributed over a pool of processes and the results
+# are merged into one summary table. It is run as a script from the
+# main folder:
+#     python -m automat.Batch [folder] [number of processes]
+
+# library/modules from python:
+import concurrent.futures
+import glob
+import os
+import sys
+import time
+import numpy as np
+from openpyxl import Workbook, load_workbook
+
+# own scripts:
+import automat.Dictionary as Dictionary
+
+# number of columns of the sections "Process setup" and "Raw Data Processing" (see Excel_Functions.create_excel)
+evaluation_columns = 11
+
+summary_header = ["File", "Process Points", "Q_A [W]", "Q_B [W]", "Q_Out [W]", "Qpre [W] - cp flux", "QSE,pre [W]", "Qr1 [W]", "Qr2 [W]", "dHr [kJ/mol]"]
+timing_header = ["File", "Process Points", "Load Time [s]", "Calculation Time [s]", "Error"]
+
+def find_files(folder = "Calorimetry", pattern = "strategy_ocae*.xlsx"):
+    """This function returns the archived workbooks in the given folder, sorted by name. The raw data exports next to them (see Strategy_OCAE.get_finish_instruction) are left out."""
+    return sorted(path for path in glob.glob(os.path.join(folder, pattern)) if not path.endswith("_raw_data.xlsx"))
+
+def read_evaluation(path):
+    """This function returns the rows of the sections "Process setup" and "Raw Data Processing" of the evaluation sheet, or None if the workbook has no evaluation sheet. The raw data sheet is not loaded."""
+    wb = load_workbook(path, read_only=True, data_only=True)
+    if "Evaluation" not in wb.sheetnames:
+        wb.close()
+        return None
+    sections = {"Process setup": [], "Raw Data Processing": []}
+    cur = None
+    for row in wb["Evaluation"].iter_rows(max_col=evaluation_columns, values_only=True):
+        if row[0] == "Calculation":
+            break
+        if row[0] in sections:
+            cur = sections[row[0]]
+        elif cur is not None and isinstance(row[0], (int, float)):
+            cur.append(row)
+    wb.close()
+
+    setup = np.array(sections["Process setup"], dtype=float)
+    means = np.array(sections["Raw Data Processing"], dtype=float)
+    if not len(setup) == len(means):
+        raise Exception("The process setup and the raw data processing of {} do not match".format(path))
+    return setup, means
+
+def recalculate(setup, means):
+    """This function returns the rows of the calculation section (see summary_header without the file) for the given process setup and mean values."""
+    water_concentration = Dictionary.calculation_data["concentration"]
+    cp = Dictionary.calculation_data["cp"]
+
+    # columns of the process setup: V_A,act, n_A,act, V_B,act
+    volume = setup[:, [4, 8]]
+    molar = setup[:, 5]
+    water = volume.sum(axis=1) * water_concentration / 6E4
+
+    # The temperature of the point is the mean temperature plus its difference.
+    temp_difference = means[:, 7:10]
+    temperature = means[:, 1] + temp_difference[:, 0]
+
+    heat_flux_outside = volume * water_concentration * cp * temp_difference[:, 0:2] / 6E4
+    heat_flux_out = water * cp * temp_difference[:, 2]
+
+    rows = []
+    for idx in range(len(setup)):
+        calorimeter_calibration = Dictionary.calorimeter_thermostat["{:d}".format(int(round(temperature[idx])))]
+        heat_flux_reactor = calorimeter_calibration.forward(list(means[idx, 4:7]))
+        heat_flux_reactor.insert(1, heat_flux_reactor[0]-sum(heat_flux_outside[idx]))
+        enthalpy_difference = (sum(heat_flux_reactor[1:])+heat_flux_out[idx]) / (molar[idx]*1000)
+        rows.append([int(setup[idx, 0])] + list(heat_flux_outside[idx]) + [heat_flux_out[idx]] + heat_flux_reactor + [enthalpy_difference])
+    return rows
+
+def process_file(path):
+    """This function reprocesses one workbook and returns its rows and timings, or None if it is no result workbook. It is run in the processes of the pool."""
+    t0 = time.perf_counter()
+    try:
+        tmp = read_evaluation(path)
+        if tmp is None:
+            return None
+        setup, means = tmp
+        t1 = time.perf_counter()
+        rows = recalculate(setup, means)
+    except Exception as e:
+        return [], [path, 0, time.perf_counter() - t0, 0, str(e)]
+    t2 = time.perf_counter()
+    return [[path, row[0]] + [float(val) for val in row[1:]] for row in rows], [path, len(rows), t1 - t0, t2 - t1, None]
+
+def run(paths, max_workers = None):
+    """This function reprocesses the given workbooks in a pool of processes and returns the merged summary and the timing of each file, both in the order of the given paths. Workbooks without an evaluation sheet are skipped."""
+    summary = []
+    timings = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for ret in executor.map(process_file, paths):
+            if ret is None:
+                continue
+            rows, timing = ret
+            summary += rows
+            timings.append(timing)
+    return summary, timings
+
+def write_summary(summary, timings, file_name):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Summary"
+    ws.append(summary_header)
+    for row in summary:
+        ws.append(row)
+
+    ws = wb.create_sheet("Timings")
+    ws.append(timing_header)
+    for row in timings:
+        ws.append(row)
+    wb.save("Calorimetry\{0}.xlsx".format(file_name))
+
+if __name__ == "__main__":
+    folder = sys.argv[1] if len(sys.argv) > 1 else "Calorimetry"
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    paths = find_files(folder)
+
+    t0 = time.perf_counter()
+    summary, timings = run(paths, max_workers)
+    wall_time = time.perf_counter() - t0
+
+    for path, points, load_time, calculation_time, error in timings:
+        if error is None:
+            print("{}: {:d} points, {:.3f} s loading, {:.3f} s calculation".format(path, points, load_time, calculation_time))
+        else:
+            print("{}: {}".format(path, error))
+    cpu_time = sum(itm[2] + itm[3] for itm in timings)
+    print("{:d} files in {:.2f} s ({:.2f} s in the processes, {:.1f}x)".format(len(timings), wall_time, cpu_time, cpu_time / wall_time))
+    write_summary(summary, timings, "batch_ocae")
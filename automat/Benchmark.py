@@ -0,0 +1,483 @@
+# This file contains microbenchmarks for hot paths of the automatization.
+# It is run as a script from the main folder:
+#     python -m automat.Benchmark
+# The suite of the control and evaluation hot paths (see run_suite) is
+# compared with the stored baseline (see Benchmark_Baseline), a rate that
+# dropped by more than the tolerance of the dictionary is reported as a
+# regression. After an intended change, the baseline is stored again:
+#     python -m automat.Benchmark --update
+
+# library/modules from python:
+import contextlib
+import os
+import re
+import sys
+import tempfile
+import time
+import numpy as np
+from openpyxl import Workbook
+
+# own scripts:
+import automat.Auto as Auto
+import automat.Calorimeter as Calorimeter
+import automat.Clock as Clock
+import automat.Dictionary as Dictionary
+import automat.Excel_Functions as Excel_Functions
+import automat.Fisher as Fisher
+import automat.HPLC as HPLC
+import automat.Lambda as Lambda
+import automat.LayerB as LayerB
+import automat.Protocol as Protocol
+import automat.Sample_Buffer as Sample_Buffer
+import automat.Simulator as Simulator
+import automat.Strategy_OCAE as Strategy_OCAE
+import automat.pyState as pyState
+
+# synthetic input:
+def make_frames(num_lines, num_columns = 29):
+    """This function returns calorimeter lines like they are received from the serial port."""
+    lines = []
+    for idx in range(num_lines):
+        values = [idx * 1.0, 25.0] + [25.0 + 0.01 * (col % 7) for col in range(9)] + [0.123 * col for col in range(num_columns - 11)]
+        lines.append("\t".join("{:.3f}".format(val) for val in values) + "\r\n")
+    return "".join(lines).encode("ASCII")
+
+def split_chunks(data, chunk_size):
+    return [data[idx:idx+chunk_size] for idx in range(0, len(data), chunk_size)]
+
+# calorimeter frame parsing:
+def legacy_read_data(chunks):
+    """This is the line parsing of Calorimeter.Read_Data before the frame parser (string concatenation and one regex per line)."""
+    pattern_values = re.compile(r"(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+).*[\r\n]")
+    pattern_line_complete = re.compile(r"(.+)\n")
+    datalist = []
+    current_line = ""
+    for chunk in chunks:
+        current_line = current_line + chunk.decode('utf-8')
+        tmp = pattern_line_complete.match(current_line)
+        while not tmp is None:
+            tmp_val = pattern_values.match(tmp.group(0))
+            if not tmp_val is None:
+                line = []
+                for idx in range(11):
+                    line.append(float(tmp_val.group(idx+1)))
+                datalist.append(line)
+            current_line = current_line[tmp.end():]
+            tmp = pattern_line_complete.match(current_line)
+    return datalist
+
+def frame_parser_read_data(chunks):
+    """This is the line parsing of Calorimeter.Read_Data, the lines go into a sample buffer like there."""
+    parser = Calorimeter.Frame_Parser()
+    datalist = Sample_Buffer.Buffer()
+    for chunk in chunks:
+        tmp = parser.feed(chunk)
+        if tmp is not None:
+            datalist.extend(tmp[0])
+    return datalist
+
+def best_of(func, args, repeat):
+    """This function returns the shortest duration of some calls of func and the result of the last call."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        ret = func(*args)
+        duration = time.perf_counter() - start
+        if best is None or duration < best:
+            best = duration
+    return best, ret
+
+def bench_frame_parser(num_lines = 20000, chunk_size = 256, repeat = 5):
+    """This function returns the lines per second of the legacy parsing and of the frame parser."""
+    chunks = split_chunks(make_frames(num_lines), chunk_size)
+    ret = []
+    for func in [legacy_read_data, frame_parser_read_data]:
+        duration, datalist = best_of(func, [chunks], repeat)
+        if not len(datalist) == num_lines:
+            raise Exception("Parser lost lines")
+        ret.append(num_lines / duration)
+    return ret
+
+# state machine transitions:
+class Next_State(pyState.State_Base):
+    """This state asks for the next state with every tick."""
+    def __call__(self):
+        return "next"
+
+class ring_factory:
+    def __init__(self, states):
+        self.states = states
+
+    def can_create(self, state_name):
+        return state_name in self.states
+
+    def create_state(self, state_name):
+        st = Next_State()
+        st.enter(state_name)
+        return st
+
+def make_ring_table(num_states):
+    """This function returns a table like the configuration tables of the drivers: a chain of states with an error transition each."""
+    states = ["State_{}".format(idx) for idx in range(num_states)] + ["Error"]
+    table = []
+    for idx in range(num_states):
+        table.append([states[idx], "next", states[(idx + 1) % num_states]])
+        table.append([states[idx], "error", "Error"])
+    return table, states
+
+def run_engine(engine, num_ticks):
+    for _ in range(num_ticks):
+        engine.tick()
+
+def bench_engine(num_states = 8, num_ticks = 100000, repeat = 5):
+    """This function returns the transitions per second of the linear and of the compiled table search."""
+    table, states = make_ring_table(num_states)
+    ret = []
+    for compiled in [False, True]:
+        engine = pyState.Engine(table, ring_factory(states), states[0], compiled)
+        engine.enter()
+        duration, _ = best_of(run_engine, [engine, num_ticks], repeat)
+        ret.append(num_ticks / duration)
+    return ret
+
+# state pooling:
+class polling_factory(pyState.Factory_Base):
+    """This factory builds the polling cycle of the HPLC pump in the state "Deactivated", without the waiting state."""
+    def __init__(self, com_handle):
+        self.com_handle = com_handle
+        self.flow_checker = HPLC.check_flow([0])
+
+    def create_Check_Pump_State(self, state_name):
+        st = self.reuse(LayerB.Send_And_Check, state_name)
+        st.enter(state_name, "PRESSURE?", HPLC.response_0, self.com_handle, 0)
+        return st
+
+    def create_Check_Flowrate(self, state_name):
+        st = self.reuse(LayerB.Send_And_Check, state_name)
+        st.enter(state_name, "FLOW?", self.flow_checker, self.com_handle, 0)
+        return st
+
+    def create_Error(self, state_name):
+        st = self.reuse(pyState.State_Base, state_name)
+        st.enter(state_name)
+        return st
+
+def bench_pooling(num_ticks = 100000, repeat = 5):
+    """This function returns the ticks per second without and with pooling."""
+    table = [
+        ["Check_Pump_State",    "next",     "Check_Flowrate"],
+        ["Check_Pump_State",    "error",    "Error"],
+        ["Check_Flowrate",      "next",     "Check_Pump_State"],
+        ["Check_Flowrate",      "error",    "Error"],
+        ]
+    ret = []
+    for pooled in [False, True]:
+        # the nested engines of Send_And_Check use the class default
+        default = pyState.Engine.pooled
+        pyState.Engine.pooled = pooled
+        try:
+            engine = pyState.Engine(table, polling_factory(HPLC.dummy_cmd_handle()), "Check_Pump_State")
+            engine.enter()
+            duration, _ = best_of(run_engine, [engine, num_ticks], repeat)
+            if engine.get_state() == "Error":
+                raise Exception("Polling cycle failed")
+        finally:
+            pyState.Engine.pooled = default
+        ret.append(num_ticks / duration)
+    return ret
+
+# response checkers:
+def legacy_lambda_check(ans, expected):
+    """This is the response checker of the Lambda pump before the codec (decoding and compiling the pattern with every answer)."""
+    answer = ans.decode("ASCII")
+    find_pattern = re.compile(r"<\d{4}(\w{1})(\d{3})\S*")
+    if find_pattern.match(answer) is None:
+        return False
+    lrinfo = find_pattern.match(answer).group(1)
+    ddd = int(find_pattern.match(answer).group(2))
+    return ddd == expected and lrinfo == "r"
+
+def legacy_fisher_check(ans, expected):
+    answer = ans.decode("ASCII")
+    find_pattern = re.compile(r"([\d\.]*)C")
+    if find_pattern.match(answer) is None:
+        return False
+    return float(find_pattern.match(answer).group(1)) == expected
+
+def legacy_lambda_frame(address, ddd):
+    step1 = "#{:02d}{:02d}r{:03.0f}".format(address, 1, ddd)
+    qs = sum(bytearray(step1.encode("ASCII"))) & 0xFF
+    return bytearray(("{}{:02X}".format(step1, qs) + "\r").encode("ASCII"))
+
+def run_checks(checks, num_calls):
+    for _ in range(num_calls):
+        for check, ans in checks:
+            if not check(ans):
+                raise Exception("Checker rejected a valid answer")
+
+def bench_protocol(num_calls = 20000, repeat = 5):
+    """This function returns the checked answers (and built Lambda frames) per second before and with the codec."""
+    lambda_ans = bytearray(b"<0102r1232D")
+    fisher_ans = bytearray(b"25.0C")
+    legacy = [
+        [lambda ans: legacy_lambda_check(ans, 123), lambda_ans],
+        [lambda ans: legacy_fisher_check(ans, 25.0), fisher_ans],
+        [lambda ans: legacy_lambda_frame(2, 123), None],
+        ]
+    codec = [
+        [Lambda.check_response([123]), lambda_ans],
+        [Fisher.check_set_Temp([25.0]), fisher_ans],
+        [lambda ans: Protocol.encode_command(Lambda.build_set_msg(2, 123)()), None],
+        ]
+    ret = []
+    for checks in [legacy, codec]:
+        duration, _ = best_of(run_checks, [checks, num_calls], repeat)
+        ret.append(num_calls * len(checks) / duration)
+    return ret
+
+# suite of the control and evaluation hot paths:
+@contextlib.contextmanager
+def temporary_folder():
+    """This context runs its body in an empty folder, so that the files of the strategy and of the drivers are removed afterwards."""
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as folder:
+        os.chdir(folder)
+        os.makedirs("Calorimetry")
+        try:
+            yield folder
+        finally:
+            os.chdir(cwd)
+
+def make_samples(num_samples):
+    """This function returns samples like the calorimeter driver stores them, one every 0.5 s."""
+    samples = np.empty((num_samples, len(Sample_Buffer.channels)))
+    samples[:, 0] = 0.5 * np.arange(num_samples)
+    samples[:, 1] = 25.0
+    samples[:, 2:] = 25.0 + 0.1 * np.sin(samples[:, :1] / 60 + np.arange(len(Sample_Buffer.channels) - 2))
+    return samples
+
+class chunk_handle:
+    """This class is a communication handle that returns the given chunks one after another."""
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.idx = 0
+
+    def receive(self):
+        if self.idx == len(self.chunks):
+            return bytearray()
+        self.idx += 1
+        return self.chunks[self.idx - 1]
+
+def run_drivers(drivers, clock, num_rounds, step_ns):
+    for _ in range(num_rounds):
+        for itm in drivers:
+            itm.tick()
+        clock.advance_ns(step_ns)
+
+def bench_drivers(num_rounds = 20000, repeat = 3):
+    """This function returns the driver ticks per second of the whole driver hierarchy (HPLC and Lambda pump, thermostat and calorimeter) against the simulated plant, on a simulated clock that moves by the response delay with every round."""
+    previous = Clock.install(Clock.Simulated_Clock())
+    try:
+        with temporary_folder():
+            plant = Simulator.Plant()
+            drivers = Auto.initialize_all_pumpdrivers([["HPLC A", None], ["Lambda 3", None]], plant)
+            drivers.append(Auto.initialize_thermostat([None], plant))
+            drivers.append(Auto.generate_calorimeter(None, Sample_Buffer.Buffer(), plant))
+            drivers[-1].set_target_Temp(25.0)
+
+            step_ns = plant.settings["response_delay_s"] * 1E9
+            duration, _ = best_of(run_drivers, [drivers, Clock.current, num_rounds, step_ns], repeat)
+            for itm in drivers:
+                if "Error" in itm.get_state():
+                    raise Exception("Driver {} failed".format(itm.get_name()))
+            del drivers
+    finally:
+        Clock.install(previous)
+    return num_rounds * 4 / duration
+
+def run_read_data(st, handle, num_chunks):
+    handle.idx = 0
+    for _ in range(num_chunks):
+        st()
+
+def bench_read_data(num_lines = 20000, chunk_size = 4096, repeat = 5):
+    """This function returns the lines per second that the state Read_Data receives, parses, logs and stores."""
+    chunks = split_chunks(make_frames(num_lines), chunk_size)
+    handle = chunk_handle(chunks)
+    with temporary_folder():
+        datalist = Sample_Buffer.Buffer(capacity=num_lines * repeat)
+        st = Calorimeter.Read_Data()
+        st.enter("Read_Data", "test.log", datalist, 1E6, 1E6, handle, Calorimeter.Frame_Parser())
+        duration, _ = best_of(run_read_data, [st, handle, len(chunks)], repeat)
+        if not len(datalist) == num_lines * repeat:
+            raise Exception("Read_Data lost lines")
+    return num_lines / duration
+
+def make_strategy(excel_name):
+    operation_point_list = [Strategy_OCAE.operation_point_list_entry(60000, 25, [6.1, 6.05])]
+    substance_data = Strategy_OCAE.substance_data([4, 6], [50, 50], [40.01, 60.05], ["B", "A"])
+    strategy = Strategy_OCAE.Output_Calculation_Absolute_Evaluation(operation_point_list, substance_data, 0, excel_name)
+    strategy.cur_operation_point = operation_point_list[0]
+    strategy.push_actual_flowrate([6.1, 6.05])
+    return strategy
+
+def run_push_value(strategy, samples):
+    # each call evaluates a new process point
+    strategy.state = Strategy_OCAE.Output_Calculation_Absolute_Evaluation.States.WAITING_FOR_DEADLINE
+    strategy.min_time = 0
+    strategy.waiting_counter = 0
+    for line in samples:
+        strategy.push_value(line)
+
+def bench_push_value(window_size, repeat = 3):
+    """This function returns the samples per second that the strategy stores and evaluates, with an evaluation window of the given number of samples."""
+    samples = make_samples(window_size)
+    with temporary_folder():
+        strategy = make_strategy("bench_push_value")
+        try:
+            duration, _ = best_of(run_push_value, [strategy, samples], repeat)
+        finally:
+            strategy.writer.close()
+    return window_size / duration
+
+def run_create_excel(substance_data, num_calls):
+    for idx in range(num_calls):
+        Excel_Functions.create_excel(substance_data, "bench_create_excel_{}".format(idx))
+
+def bench_create_excel(num_calls = 10, repeat = 3):
+    """This function returns the workbooks per second that are created and saved."""
+    substance_data = Strategy_OCAE.substance_data([4, 6], [50, 50], [40.01, 60.05], ["B", "A"])
+    with temporary_folder():
+        duration, _ = best_of(run_create_excel, [substance_data, num_calls], repeat)
+    return num_calls / duration
+
+def get_application():
+    # The benchmarks must not show any window, so without a display the windows are drawn offscreen.
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PySide6.QtWidgets import QApplication
+    return QApplication.instance() or QApplication([])
+
+class plot_source:
+    """This class stands for the initialization tab, from which the graph takes the samples of the running strategy."""
+    def __init__(self, samples):
+        self.samples = samples
+        self.datalist = samples
+        self.strategy = self
+        self.point_finished_list = []
+
+def run_plotter(graph, samples, new_samples):
+    # every refresh of the graph shows the samples of the last two seconds
+    for line in new_samples:
+        samples.append(line)
+        graph.real_time_plotter()
+
+def bench_plotter(num_samples, num_calls = 20, repeat = 3):
+    """This function returns the refreshes per second of the real-time plot with the given number of samples."""
+    app = get_application()
+    import Graph_Window
+
+    data = make_samples(num_samples + num_calls * repeat)
+    samples = Sample_Buffer.Buffer(capacity=len(data))
+    samples.extend(data[:num_samples])
+    graph = Graph_Window.Graph(plot_source(samples))
+    graph.timer.stop()
+    graph.real_time_plotter()
+    graph.canvas.draw()
+
+    ret = []
+    for idx in range(repeat):
+        new_samples = data[num_samples + idx * num_calls:num_samples + (idx + 1) * num_calls]
+        duration, _ = best_of(run_plotter, [graph, samples, new_samples], 1)
+        ret.append(num_calls / duration)
+    graph.close()
+    app.processEvents()
+    return max(ret)
+
+def make_output_workbook(num_rows):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Raw_Data_COM"
+    ws.append(Excel_Functions.raw_data_header)
+    for line in make_samples(num_rows).tolist():
+        ws.append(line)
+    wb.save("Calorimetry\strategy_test.xlsx")
+
+def run_load_excel(window, num_calls):
+    for _ in range(num_calls):
+        window.loadExcelData()
+
+def bench_load_excel(num_rows = 2000, num_calls = 3, repeat = 3):
+    """This function returns the rows per second that the data processing tab loads from the output workbook."""
+    app = get_application()
+    import Data_Processing
+
+    with temporary_folder():
+        make_output_workbook(num_rows)
+        window = Data_Processing.Data_Processing()
+        window.timer.stop()
+        duration, _ = best_of(run_load_excel, [window, num_calls], repeat)
+        if not window.model.rowCount() == num_rows:
+            raise Exception("Output workbook was not loaded")
+        window.close()
+    app.processEvents()
+    return num_rows * num_calls / duration
+
+def run_suite():
+    """This function runs the benchmarks of the control and evaluation hot paths and returns their rates (per second) by name."""
+    results = {}
+    results["Engine.tick, driver hierarchy [ticks/s]"] = bench_drivers()
+    results["Read_Data [lines/s]"] = bench_read_data()
+    for window_size in [100, 1000, 10000]:
+        results["push_value, window of {} samples [samples/s]".format(window_size)] = bench_push_value(window_size)
+    results["create_excel and save [workbooks/s]"] = bench_create_excel()
+    for num_samples in [1000, 10000, 100000]:
+        results["real_time_plotter, {} samples [refreshes/s]".format(num_samples)] = bench_plotter(num_samples)
+    results["loadExcelData [rows/s]"] = bench_load_excel()
+    return results
+
+def compare(results, baseline, tolerance):
+    """This function returns the names of the benchmarks whose rate dropped by more than the tolerance (share of the baseline)."""
+    ret = []
+    for name, rate in results.items():
+        if name in baseline and rate < baseline[name] * (1 - tolerance):
+            ret.append(name)
+    return ret
+
+def write_baseline(results, path = os.path.join(os.path.dirname(__file__), "Benchmark_Baseline.py")):
+    with open(path, "w") as fout:
+        fout.write("# This file contains the stored results of the benchmark suite (see\n")
+        fout.write("# Benchmark.run_suite). It is written by:\n")
+        fout.write("#     python -m automat.Benchmark --update\n")
+        fout.write("# The rates depend on the machine, so the baseline has to be stored\n")
+        fout.write("# again on the machine that checks for regressions.\n\n")
+        fout.write("baseline = {\n")
+        for name, rate in results.items():
+            fout.write("    {!r}: {:.1f},\n".format(name, rate))
+        fout.write("    }\n")
+
+if __name__ == "__main__":
+    for chunk_size in [64, 256, 4096, 65536, 1048576]:
+        before, after = bench_frame_parser(chunk_size=chunk_size)
+        print("Read_Data, chunks of {:7d} bytes: {:10.0f} lines/s before, {:10.0f} lines/s after ({:.1f}x)".format(chunk_size, before, after, after / before))
+    for num_states in [2, 8, 16]:
+        before, after = bench_engine(num_states)
+        print("Engine, table with {:2d} rows: {:10.0f} transitions/s linear, {:10.0f} transitions/s compiled ({:.1f}x)".format(2 * num_states, before, after, after / before))
+    before, after = bench_pooling()
+    print("Polling cycle: {:10.0f} ticks/s without pooling, {:10.0f} ticks/s with pooling ({:.1f}x)".format(before, after, after / before))
+    before, after = bench_protocol()
+    print("Response checkers and frames: {:10.0f} calls/s before, {:10.0f} calls/s with the codec ({:.1f}x)".format(before, after, after / before))
+
+    results = run_suite()
+    if "--update" in sys.argv:
+        write_baseline(results)
+        baseline = results
+    else:
+        import automat.Benchmark_Baseline as Benchmark_Baseline
+        baseline = Benchmark_Baseline.baseline
+    for name, rate in results.items():
+        print("{}: {:12.1f} (baseline {:12.1f})".format(name, rate, baseline.get(name, float("nan"))))
+
+    regressions = compare(results, baseline, Dictionary.benchmark["regression_tolerance"])
+    for name in regressions:
+        print("Regression:", name)
+    sys.exit(1 if len(regressions) > 0 else 0)
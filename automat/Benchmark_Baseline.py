@@ -0,0 +1,18 @@
+# This file contains the stored results of the benchmark suite (see
+# Benchmark.run_suite). It is written by:
+#     python -m automat.Benchmark --update
+# The rates depend on the machine, so the baseline has to be stored
+# again on the machine that checks for regressions.
+
+baseline = {
+    'Engine.tick, driver hierarchy [ticks/s]': 225142.7,
+    'Read_Data [lines/s]': 197741.3,
+    'push_value, window of 100 samples [samples/s]': 20291.3,
+    'push_value, window of 1000 samples [samples/s]': 17682.4,
+    'push_value, window of 10000 samples [samples/s]': 12242.1,
+    'create_excel and save [workbooks/s]': 116.8,
+    'real_time_plotter, 1000 samples [refreshes/s]': 124.2,
+    'real_time_plotter, 10000 samples [refreshes/s]': 52.1,
+    'real_time_plotter, 100000 samples [refreshes/s]': 8.3,
+    'loadExcelData [rows/s]': 2486.4,
+    }
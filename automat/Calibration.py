@@ -1,3 +1,5 @@
+import numpy as np
+
 class Pumps:
     def __init__(self, cali_val):
         self.cali_val = cali_val        
@@ -37,6 +39,13 @@ class Calorimeter:
            raise Exception("Given parameter list is incomplete")
 
     def forward(self, value_list):
+        """The values can also be an array whose last axis holds the three channels, then the heat fluxes are returned as an array of the same shape."""
+        if isinstance(value_list, np.ndarray):
+            if not value_list.shape[-1] == 3:
+                raise Exception("Given evaluation data list is incomplete")
+            coef = np.array(self.list, dtype=float)
+            return (coef[:, 0]*value_list*value_list+coef[:, 1]*value_list+coef[:, 2])*(-1)
+
         tmp = []
 
         if not len(value_list) == 3:
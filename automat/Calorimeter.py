@@ -3,56 +3,136 @@
 # and (B).
 
 # library/modules from python:
-import time
-import re
 import math
 import os
+import numpy as np
 
 # own scripts:
+import automat.Clock as Clock
+import automat.Metrics as Metrics
 import automat.pyState as pyState
 
+# frame parser:
+class Frame_Parser:
+    """This class collects the received bytes, splits off all complete lines at once and converts all columns of these lines in one step. Malformed lines are counted and skipped."""
+    def __init__(self, num_columns = 29):
+        self.num_columns = num_columns
+        self.buffer = bytearray()
+        self.line_count = 0
+        self.malformed_count = 0
+
+        # separators of a valid line, everything else is deleted from a block to compare them
+        self.line_separators = b"\t" * (num_columns - 1) + b"\n"
+        self.other_bytes = bytes(val for val in range(256) if val not in b"\t\n")
+
+    def feed(self, chunk):
+        """This function returns the converted lines as an array (one row per line) and the bytes of these lines, or None if no line is complete yet."""
+        self.buffer += chunk
+        end = self.buffer.rfind(b"\n")
+        if end == -1:
+            return None
+
+        block = bytes(memoryview(self.buffer)[:end+1])
+        del self.buffer[:end+1]
+
+        # usual case: every line has all columns, so the whole block is converted at once
+        separators = block.translate(None, self.other_bytes)
+        num_lines = len(separators) // self.num_columns
+        if separators == self.line_separators * num_lines:
+            values = convert(block, num_lines * self.num_columns)
+            if values is not None:
+                self.line_count += num_lines
+                return values.reshape(num_lines, self.num_columns), block
+
+        valid = []
+        for line in block.split(b"\n")[:-1]:
+            tabs = line.count(b"\t")
+            if tabs == self.num_columns - 1:
+                valid.append(line)
+            elif tabs >= self.num_columns:
+                # additional columns are ignored
+                valid.append(line[:find_nth(line, b"\t", self.num_columns)])
+            elif len(line.strip()) > 0:
+                self.malformed_count += 1
+
+        if len(valid) == 0:
+            return None
+
+        values = convert(b"\n".join(valid), len(valid) * self.num_columns)
+        if values is None:
+            # at least one line contains a field that is not a number, find it line by line
+            rows = []
+            good = []
+            for line in valid:
+                tmp = convert(line, self.num_columns)
+                if tmp is None:
+                    self.malformed_count += 1
+                else:
+                    rows.append(tmp)
+                    good.append(line)
+            if len(good) == 0:
+                return None
+            values = np.concatenate(rows)
+            valid = good
+
+        self.line_count += len(valid)
+        return values.reshape(len(valid), self.num_columns), b"\n".join(valid) + b"\n"
+
+def find_nth(line, sep, num):
+    idx = -1
+    for _ in range(num):
+        idx = line.index(sep, idx+1)
+    return idx
+
+def convert(block, expected_size):
+    # Fields that are not numbers stop the conversion (older numpy versions 
+    # only warn about this), so the size tells whether all lines are valid.
+    try:
+        values = np.fromstring(block, sep=" ")
+    except ValueError:
+        return None
+    if not values.size == expected_size:
+        return None
+    return values
+
 # layer (B) states:
 class Read_Data(pyState.State_Base):
     """This state queries and stores the data from the calorimeter."""
-    def enter(self, name, path, datalist, timeout_error_s, timeout_check_s, com_handle):
+    def enter(self, name, path, datalist, timeout_error_s, timeout_check_s, com_handle, parser):
         super().enter(name)
         self.com_handle = com_handle
-        self.pattern_values = re.compile(r"(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+)\t(\S+).*[\r\n]")
-        self.pattern_line_complete = re.compile(r"(.+)\n")   
+        self.parser = parser
     
         self.deadline_error_delta = timeout_error_s * 1E9
-        self.deadline_error = time.monotonic_ns() + self.deadline_error_delta
-        self.deadline_check = time.monotonic_ns() + timeout_check_s * 1E9
+        self.deadline_error = Clock.now_ns() + self.deadline_error_delta
+        self.deadline_check = Clock.now_ns() + timeout_check_s * 1E9
 
         self.datalist = datalist
         self.out_path = path
-        self.current_line = ""
 
     def __call__(self):
-        self.current_line = self.current_line + self.com_handle.receive().decode('utf-8')
-        tmp = self.pattern_line_complete.match(self.current_line)
-
-        while not tmp is None:
-            self.deadline_error = time.monotonic_ns() + self.deadline_error_delta
-            tmp_val = self.pattern_values.match(tmp.group(0))
-            if not tmp_val is None:
-                with open(self.out_path, 'a') as fout:
-                    fout.write(tmp.group(1))
-                    
-                    line = []
-                    for idx in range(11):
-                        line.append(float(tmp_val.group(idx+1)))
-                    self.datalist.append(line)
-            
-            self.current_line = self.current_line[tmp.end():]
-            tmp = self.pattern_line_complete.match(self.current_line)
-
-        if self.deadline_check < time.monotonic_ns():
+        tmp = self.parser.feed(self.com_handle.receive())
+
+        if not tmp is None:
+            self.deadline_error = Clock.now_ns() + self.deadline_error_delta
+            with open(self.out_path, 'ab') as fout:
+                fout.write(tmp[1])
+            self.datalist.extend(tmp[0])
+
+        if Metrics.enabled:
+            device = Metrics.get_device(self.com_handle)
+            Metrics.set_count(device, "lines", self.parser.line_count)
+            Metrics.set_count(device, "malformed lines", self.parser.malformed_count)
+
+        if self.deadline_check < Clock.now_ns():
             return "check"
-        if self.deadline_error < time.monotonic_ns():
+        if self.deadline_error < Clock.now_ns():
             return "error"
         return None
 
+    def get_wakeup(self):
+        return min(self.deadline_check, self.deadline_error)
+
 class Check_Set_Temp(pyState.State_Base):
     """This state checks the set temperature."""
     def enter(self, name, datalist, set_Temp):
@@ -85,41 +165,41 @@ class Clear(pyState.State_Base):
 
 class Read_And_Check(pyState.State_Base):
     """This state combines the substates "Read_Data" and "Check_Set_Temp"."""
-    class factory:
-        def __init__(self, path, datalist, set_Temp, com_handle):
+    class factory(pyState.Factory_Base):
+        def arm(self, path, datalist, set_Temp, com_handle, parser):
             self.datalist = datalist
             self.set_Temp = set_Temp
             self.com_handle = com_handle
             self.out_path = path
-
-        def create_state(self, state_name):
-            if state_name == "Read":
-                st = Read_Data()
-                st.enter(state_name, self.out_path, self.datalist, 7, 10, self.com_handle)
-                return st
-            elif state_name == "Check":
-                st = Check_Set_Temp()
-                st.enter(state_name, self.datalist, self.set_Temp)
-                return st
-            elif state_name == "Error":
-                st = pyState.State_Base()
-                st.enter(state_name)
-                return st
-            raise Exception("Unhandled State in Factory")
-
-    def enter(self, name, path, datalist, target_Temp, set_Temp, com_handle):
+            self.parser = parser
+
+        def create_Read(self, state_name):
+            st = self.reuse(Read_Data, state_name)
+            st.enter(state_name, self.out_path, self.datalist, 7, 10, self.com_handle, self.parser)
+            return st
+
+        def create_Check(self, state_name):
+            st = self.reuse(Check_Set_Temp, state_name)
+            st.enter(state_name, self.datalist, self.set_Temp)
+            return st
+
+        def create_Error(self, state_name):
+            st = self.reuse(pyState.State_Base, state_name)
+            st.enter(state_name)
+            return st
+
+    tab = [
+        ["Read",    "check",        "Check"],
+        ["Read",    "error",        "Error"],
+        ["Check",   "next",         "Read"],
+        ["Check",   "error",        "Error"],
+        ]
+
+    def enter(self, name, path, datalist, target_Temp, set_Temp, com_handle, parser):
         super().enter(name)
         self.target_Temp = target_Temp
         self.set_Temp = set_Temp
-        self.tab = [
-            ["Read",    "check",        "Check"],
-            ["Read",    "error",        "Error"],
-            ["Check",   "next",         "Read"],
-            ["Check",   "error",        "Error"],
-            ]
-        self.fac = Read_And_Check.factory(path, datalist, self.set_Temp, com_handle)
-        self.en = pyState.Engine(self.tab, self.fac, "Read")
-        self.en.enter()
+        self.enter_engine(Read_And_Check.factory, "Read", path, datalist, self.set_Temp, com_handle, parser)
 
     def __call__(self):
         self.en.tick()
@@ -157,7 +237,7 @@ class Set_Temp(pyState.State_Base):
 # driver class for the calorimeter:
 class Driver:
 
-    class factory:
+    class factory(pyState.Factory_Base):
         def __init__(self, datalist, target_Temp, set_Temp, com_handle):
             self.target_Temp = target_Temp
             self.set_Temp = set_Temp
@@ -165,39 +245,44 @@ class Driver:
 
             self.datalist = datalist
             self.out_path = "test.log"
-
-        def create_state(self, state_name):
-            if state_name == "Clear":
-                st = Clear()
-                st.enter(state_name, self.out_path, self.com_handle)
-                return st
-            elif state_name == "Read_And_Check":
-                st = Read_And_Check()
-                st.enter(state_name, self.out_path, self.datalist, self.target_Temp, self.set_Temp, self.com_handle)
-                return st
-            elif state_name == "Set_Temp":
-                st = Set_Temp()
-                st.enter(state_name, self.set_Temp, self.com_handle)
-                return st
-            elif state_name == "Error":
-                st = pyState.State_Base()
-                st.enter(state_name)
-                return st
-            raise Exception("Unhandled State in Factory")
+            self.parser = Frame_Parser()
+
+        def create_Clear(self, state_name):
+            st = self.reuse(Clear, state_name)
+            st.enter(state_name, self.out_path, self.com_handle)
+            return st
+
+        def create_Read_And_Check(self, state_name):
+            st = self.reuse(Read_And_Check, state_name)
+            st.enter(state_name, self.out_path, self.datalist, self.target_Temp, self.set_Temp, self.com_handle, self.parser)
+            return st
+
+        def create_Set_Temp(self, state_name):
+            st = self.reuse(Set_Temp, state_name)
+            st.enter(state_name, self.set_Temp, self.com_handle)
+            return st
+
+        def create_Error(self, state_name):
+            st = self.reuse(pyState.State_Base, state_name)
+            st.enter(state_name)
+            return st
+
+    tab = [
+        ["Clear",           "next",          "Read_And_Check"],
+        ["Read_And_Check",  "new_set_Temp",  "Set_Temp"],
+        ["Read_And_Check",  "error",         "Error"],
+        ["Set_Temp",        "next",          "Read_And_Check"],
+        ]
 
     def __init__(self, name, datalist, com_handle):
         self.name = name
-        self.tab = [
-            ["Clear",           "next",          "Read_And_Check"],
-            ["Read_And_Check",  "new_set_Temp",  "Set_Temp"],
-            ["Read_And_Check",  "error",         "Error"],
-            ["Set_Temp",        "next",          "Read_And_Check"],
-            ]
+        self.com_handle = com_handle
+        Metrics.register_device(com_handle, name)
         self.target_Temp = [float("nan")]
         self.set_Temp = [float("nan")]
 
         self.fac = Driver.factory(datalist, self.target_Temp, self.set_Temp, com_handle)
-        self.en = pyState.Engine(self.tab, self.fac, "Clear")
+        self.en = pyState.Engine(self.tab, self.fac, "Clear", path=name)
         self.en.enter()
 
     def tick(self):
@@ -212,6 +297,15 @@ class Driver:
     def get_name(self):
         return self.name
 
+    def get_com_handle(self):
+        return self.com_handle
+
+    def get_wakeup(self):
+        return self.en.get_wakeup()
+
+    def get_parser(self):
+        return self.fac.parser
+
     # In the following, the functions are defined to obtain the settings for the calorimeter (from outside).
     def set_target_Temp(self, val):
         self.target_Temp[0] = val
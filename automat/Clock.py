@@ -0,0 +1,56 @@
+# This file contains the clocks of the automatization. All deadlines of
+# the states, the strategies and the simulated plant are taken from
+# the installed clock ("now_ns"). The real clock is the monotonic clock
+# of the system. The simulated clock only moves when the runner lets
+# it jump to the next wake-up time, so that a campaign against the
+# simulated plant (see Simulator) runs as fast as the state machines
+# can be ticked.
+
+# library/modules from python:
+import threading
+import time
+
+class Real_Clock:
+    simulated = False
+
+    def now_ns(self):
+        return time.monotonic_ns()
+
+class Simulated_Clock:
+    """This class is a clock that is moved forward by the runner. Instead of sleeping, the runner lets the clock jump forward."""
+    simulated = True
+
+    def __init__(self, start_ns = 0):
+        self.now = start_ns
+        self.lock = threading.Lock()
+
+    def now_ns(self):
+        return self.now
+
+    def advance_ns(self, delta_ns):
+        with self.lock:
+            self.now += max(int(delta_ns), 0)
+
+    def advance_to(self, wakeup_ns):
+        with self.lock:
+            self.now = max(self.now, int(wakeup_ns))
+
+# the installed clock
+current = Real_Clock()
+
+def now_ns():
+    return current.now_ns()
+
+def install(clock):
+    """This function installs a clock for all state machines and returns the clock that was installed before."""
+    global current
+    previous = current
+    current = clock
+    return previous
+
+def jump(wakeup_ns, max_step_s, min_step_s = 0.001):
+    """This function lets a simulated clock jump to the given wake-up time. Without a wake-up time it is moved by max_step_s, and it is always moved by at least min_step_s, so that a runner can not get stuck."""
+    if wakeup_ns is None:
+        current.advance_ns(max_step_s * 1E9)
+        return
+    current.advance_to(max(wakeup_ns, current.now_ns() + min_step_s * 1E9))
@@ -1,26 +1,164 @@
-# This file contains the serial interface. For this purpose, the 
-# library "serial" is used and adapted in the class "Handle" for 
-# the own application.
+# This file contains the serial interface. For this purpose, the
+# library "serial" is used and adapted in the class "Handle" for
+# the own application. In the reader mode, each port is read by its
+# own thread, which stores the received bytes in a ring buffer, so
+# that "receive" never blocks the state machines. The class 
+# "Async_Handle" additionally wakes up an asyncio event loop when 
+# new bytes have arrived.
 
 # library/modules from python:
+import threading
 import serial
 
+# own scripts:
+import automat.Dictionary as Dictionary
+
+class Ring_Buffer:
+    """This class stores the received bytes of a port. If it is full, the oldest bytes are overwritten."""
+    def __init__(self, size):
+        self.size = size
+        self.data = bytearray(size)
+        self.start = 0
+        self.length = 0
+        self.overflow = 0
+        self.lock = threading.Lock()
+
+    def write(self, chunk):
+        with self.lock:
+            num = len(chunk)
+            if num >= self.size:
+                self.overflow += self.length + num - self.size
+                self.data[:] = chunk[num-self.size:]
+                self.start = 0
+                self.length = self.size
+                return
+
+            end = (self.start + self.length) % self.size
+            first = min(num, self.size - end)
+            self.data[end:end+first] = chunk[:first]
+            self.data[:num-first] = chunk[first:]
+            self.length += num
+
+            if self.length > self.size:
+                drop = self.length - self.size
+                self.overflow += drop
+                self.start = (self.start + drop) % self.size
+                self.length = self.size
+
+    def read(self):
+        with self.lock:
+            if self.length == 0:
+                return b""
+            end = self.start + self.length
+            if end <= self.size:
+                ret = bytes(self.data[self.start:end])
+            else:
+                ret = bytes(self.data[self.start:]) + bytes(self.data[:end-self.size])
+            self.start = 0
+            self.length = 0
+            return ret
+
+    def clear(self):
+        with self.lock:
+            self.start = 0
+            self.length = 0
+
+    def __len__(self):
+        return self.length
+
 class Handle:
     PARITY_NONE = serial.PARITY_NONE
     PARITY_EVEN = serial.PARITY_EVEN
     PARITY_ODD = serial.PARITY_ODD
-    
-    def __init__(self, port, baudrate, parity, stopbits):
-        self.com = serial.Serial(port, baudrate, 8, parity, stopbits)# , timeout=0) 
+
+    def __init__(self, port, baudrate, parity, stopbits, reader_thread = None):
+        if reader_thread is None:
+            reader_thread = Dictionary.communication["reader_thread"]
+
+        self.port = port
+        self.notify = None
+        self.reader = None
+        self.error = None
+
+        if not reader_thread:
+            self.com = serial.Serial(port, baudrate, 8, parity, stopbits)# , timeout=0)
+            return
+
+        # The timeout only limits how long the reader thread waits for a
+        # byte, so that it can be stopped again.
+        self.com = serial.Serial(port, baudrate, 8, parity, stopbits, timeout=Dictionary.communication["read_timeout_s"])
+        self.buffer = Ring_Buffer(Dictionary.communication["ring_buffer_size"])
+        self.running = True
+        self.reader = threading.Thread(target=self.read_loop, name="Reader_{}".format(port), daemon=True)
+        self.reader.start()
+
+    def read_loop(self):
+        while self.running:
+            try:
+                chunk = self.com.read(max(1, self.com.in_waiting))
+            except serial.SerialException as exc:
+                # The state machines notice the missing data through their timeouts.
+                self.error = exc
+                print("reader of port", self.port, "stopped:", exc)
+                return
+            if chunk:
+                self.buffer.write(chunk)
+                if self.notify is not None:
+                    self.notify()
+
+    def set_notifier(self, notify):
+        """The given function is called by the reader thread whenever new bytes have arrived."""
+        self.notify = notify
 
     def clear_input_buffer(self):
         self.com.reset_input_buffer()
+        if self.reader is not None:
+            self.buffer.clear()
 
     def send(self, msg):
         # print(msg.decode("ASCII"))
         self.com.write(msg)
-    
+
     def receive(self):
+        if self.reader is not None:
+            return self.buffer.read()
         ans = self.com.read_until()
         # print(ans.decode("ASCII"))
-        return ans
\ No newline at end of file
+        return ans
+
+    def close(self):
+        if self.reader is not None:
+            self.running = False
+            self.reader.join()
+            self.reader = None
+        self.com.close()
+
+class Async_Handle(Handle):
+    """This handle always uses the reader thread and signals new bytes to an asyncio event loop. The transactions themselves are the Send_And_Check states of the drivers, which are ticked by the loop."""
+    def __init__(self, port, baudrate, parity, stopbits):
+        super().__init__(port, baudrate, parity, stopbits, reader_thread=True)
+        self.loop = None
+        self.wakeup = None
+
+    def attach(self, loop, wakeup = None):
+        """The event "wakeup" is shared by all handles, so that a runner can wait for any port."""
+        self.loop = loop
+        self.wakeup = wakeup
+        self.set_notifier(lambda: loop.call_soon_threadsafe(self.data_ready))
+
+    def detach(self):
+        self.set_notifier(None)
+        self.loop = None
+        self.wakeup = None
+
+    def data_ready(self):
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+def open_handle(port, baudrate, parity, stopbits):
+    """This function opens a port with the backend given in the dictionary."""
+    if Dictionary.communication["backend"] == "asyncio":
+        return Async_Handle(port, baudrate, parity, stopbits)
+    if Dictionary.communication["backend"] == "serial":
+        return Handle(port, baudrate, parity, stopbits)
+    raise Exception("Unknown communication backend")
@@ -0,0 +1,37 @@
+# This file contains the decimation of long sample series for the live
+# plots. The samples are divided into buckets of equal size and only
+# the minimum and the maximum of each bucket are kept, in the order in
+# which they occur. With one bucket per pixel, the decimated line looks
+# like the full one, but the drawing cost only depends on the width of
+# the plot.
+
+# library/modules from python:
+import numpy as np
+
+def min_max(x, y, num_buckets):
+    """This function returns at most two samples per bucket. Short series are returned unchanged."""
+    num = len(x)
+    if num <= 2 * num_buckets:
+        return x, y
+
+    size = -(-num // num_buckets)
+    num_full = num // size
+    offsets = np.arange(num_full) * size
+    # a column of the sample buffer is strided, one copy makes both passes faster
+    buckets = np.ascontiguousarray(y[:num_full*size]).reshape(num_full, size)
+    idx_min = buckets.argmin(axis=1) + offsets
+    idx_max = buckets.argmax(axis=1) + offsets
+
+    if num_full * size < num:
+        tail = y[num_full*size:]
+        idx_min = np.append(idx_min, tail.argmin() + num_full * size)
+        idx_max = np.append(idx_max, tail.argmax() + num_full * size)
+
+    idx = np.column_stack([np.minimum(idx_min, idx_max), np.maximum(idx_min, idx_max)]).ravel()
+    return x[idx], y[idx]
+
+def visible_range(x, lower, upper):
+    """This function returns the start and stop index of the samples between lower and upper, including one neighbour on each side. x has to be sorted."""
+    start = max(int(np.searchsorted(x, lower)) - 1, 0)
+    stop = int(np.searchsorted(x, upper, side="right")) + 1
+    return start, stop
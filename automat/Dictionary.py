@@ -36,3 +36,62 @@ calculation_data = {
     "concentration": 0.997/18.015*1000,       # mol/l
     "cp": 75.336,                             # J/(molK)
     }
+
+excel = {
+    "save_interval_s": 60,                    # s, the workbook is saved in the background
+    "journal_interval_s": 1,                  # s, raw data is journaled in between
+    "summary_every": 10,                      # only every n-th raw data line is written to the workbook
+    "chart_rows": 2000,                       # the charts are drawn from at most this many raw data lines
+    "raw_export": True,                       # all raw data lines are exported into a second workbook at the end
+    "sheet_rows": 1048576,                    # rows per sheet of the export, Excel's limit
+    }
+
+communication = {
+    "backend": "asyncio",                     # "serial" or "asyncio"
+    "reader_thread": True,                    # each port is read by its own thread
+    "ring_buffer_size": 65536,                # bytes per port
+    "read_timeout_s": 0.1,                    # s, only used by the reader thread
+    }
+
+automatization = {
+    "driver_threads": False,                  # each device is ticked by its own thread
+    "driver_max_sleep_s": 0.05,               # s, a driver thread is ticked at least this often
+    }
+
+simulator = {
+    "sample_period_s": 0.5,                   # s, the simulated calorimeter sends one line per period
+    "response_delay_s": 0.01,                 # s, until a simulated device answers a command
+    "ambient_temp": 22.0,                     # °C, also the temperature of the feeds
+    "bath_tau_s": 60.0,                       # s, time constant of the thermostat bath
+    "zone_tau_s": 10.0,                       # s, time constant of the reactor zones
+    "zone_conductance": 50.0,                 # mW/K, between a zone and the bath
+    "heater_max_mW": 5000.0,                  # mW, the Peltier elements can heat and cool
+    "heater_resistance": 100.0,               # Ohm
+    "flow_heat_capacity": 69.7,               # mW/K per ml/min of feed (water)
+    "reaction_heat": 150.0,                   # mW per ml/min of the smaller feed
+    "reaction_decay": 0.5,                    # share of the reaction heat that is left for the next zone
+    "pressure_per_flow": 5.0,                 # bar per ml/min of a HPLC pump
+    "noise_temp": 0.002,                      # K, standard deviation of the temperatures
+    "seed": 0,
+    }
+
+benchmark = {
+    "regression_tolerance": 0.3,              # a rate more than this share below the baseline is a regression
+    }
+
+metrics = {
+    "enabled": False,                         # latencies of the ticks and of the transactions are recorded
+    "file_name": "metrics",                   # written to Calorimetry\metrics.txt
+    "interval_s": 10,                         # s, the file is written this often
+    "http_port": 8765,                        # the metrics are served on localhost, None: no endpoint
+    }
+
+samples = {
+    "window_rows": 20000,                     # samples kept in memory per buffer, all of them are in the raw data store
+    }
+
+trace = {
+    "enabled": False,                         # transitions of the engines are recorded in a ring buffer
+    "capacity": 65536,                        # records, 16 bytes each
+    "file_name": "trace",                     # written to Calorimetry\trace_<time>.trace
+    }
@@ -0,0 +1,160 @@
+# This file contains the worker class, which runs a driver (HPLC pump,
+# Lambda pump, thermostat or calorimeter) in its own thread. Thus, a
+# slow device does not delay the other devices. The setters are put
+# into a queue and executed by the thread of the driver, the state of
+# the driver is published after every tick. The worker offers the
+# same functions as the drivers, so that the states of the
+# automatization can use both.
+
+# library/modules from python:
+import concurrent.futures
+import queue
+import threading
+
+# own scripts:
+import automat.Communication as Communication
+import automat.Dictionary as Dictionary
+import automat.pyState as pyState
+
+class Worker:
+    """This class ticks a driver in its own thread until the worker is stopped."""
+    def __init__(self, driver, max_sleep_s = None):
+        if max_sleep_s is None:
+            max_sleep_s = Dictionary.automatization["driver_max_sleep_s"]
+
+        self.driver = driver
+        self.name = driver.get_name()
+        self.com_handle = driver.get_com_handle()
+        self.max_sleep_s = max_sleep_s
+
+        self.commands = queue.SimpleQueue()
+        self.wakeup = threading.Event()
+        self.lock = threading.Lock()
+        self.notify = None
+        self.error = None
+
+        # Until the thread has executed all submitted commands and ticked the
+        # driver afterwards, the published state is outdated.
+        self.submitted = 0
+        self.executed = 0
+        self.published = 0
+        self.state = driver.get_state()
+
+        if isinstance(self.com_handle, Communication.Handle) and self.com_handle.reader is not None:
+            self.com_handle.set_notifier(self.wakeup.set)
+
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="Driver_{}".format(self.name), daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while self.running:
+            self.wakeup.clear()
+            self.execute_commands()
+            if self.error is not None:
+                # the driver is not ticked anymore, but the commands are still answered
+                self.publish("Error")
+                self.wakeup.wait(self.max_sleep_s)
+                continue
+            try:
+                pyState.tick_until_idle(self.driver)
+            except Exception as exc:
+                self.error = exc
+                print("driver", self.name, "stopped:", exc)
+                continue
+            self.publish(self.driver.get_state())
+            self.wakeup.wait(pyState.get_sleep_s(self.driver, self.max_sleep_s))
+
+        # commands that were submitted after the last loop are not executed anymore
+        while True:
+            try:
+                func, args, future = self.commands.get_nowait()
+            except queue.Empty:
+                return
+            future.cancel()
+
+    def execute_commands(self):
+        while True:
+            try:
+                func, args, future = self.commands.get_nowait()
+            except queue.Empty:
+                return
+            self.executed += 1
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(func(*args))
+            except Exception as exc:
+                future.set_exception(exc)
+
+    def publish(self, state):
+        with self.lock:
+            changed = not state == self.state
+            self.state = state
+            self.published = self.executed
+            notify = self.notify
+        if changed and notify is not None:
+            notify()
+
+    def submit(self, func, *args):
+        """This function queues a call for the thread of the driver and returns a future for its result."""
+        if not self.running:
+            raise Exception("Worker of {} is stopped".format(self.name))
+        future = concurrent.futures.Future()
+        with self.lock:
+            self.submitted += 1
+        self.commands.put((func, args, future))
+        self.wakeup.set()
+        return future
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
+        self.thread.join()
+        if isinstance(self.com_handle, Communication.Handle) and self.com_handle.notify == self.wakeup.set:
+            self.com_handle.set_notifier(None)
+
+    def set_notifier(self, notify):
+        """The given function is called by the thread of the driver whenever the published state has changed."""
+        with self.lock:
+            self.notify = notify
+
+    # The driver is ticked by its own thread.
+    def tick(self):
+        return
+
+    def get_state(self):
+        with self.lock:
+            if self.published < self.submitted:
+                return "Pending"
+            return self.state
+
+    def get_name(self):
+        return self.name
+
+    def get_com_handle(self):
+        return self.com_handle
+
+    # The thread of the driver sleeps until the wake-up time itself.
+    def get_wakeup(self):
+        return None
+
+    def get_error(self):
+        return self.error
+
+    # In the following, the setters of the drivers are forwarded to the thread of the driver.
+    def set_target_flowrate(self, val):
+        # the actual flowrate is needed by the strategy, so this call waits for the thread
+        return self.submit(self.driver.set_target_flowrate, val).result()
+
+    def activate_pump(self):
+        self.submit(self.driver.activate_pump)
+
+    def deactivate_pump(self):
+        self.submit(self.driver.deactivate_pump)
+
+    def set_target_temp(self, val):
+        self.submit(self.driver.set_target_temp, val)
+
+    def set_target_Temp(self, val):
+        self.submit(self.driver.set_target_Temp, val)
@@ -1,9 +1,78 @@
 # library/modules from python:
+import os
+import threading
+import time
+import numpy as np
 from openpyxl import Workbook
 
 # own scripts:
 import automat.Dictionary as Dictionary
 
+raw_data_header = ["Elapsed_Time", "T_set", "T_pre", "T_r1", "T_r2", "T_r3", "T_r4", "T_r5", "T_A", "T_B", "T_out", "U_pre", "U_r1", "U_r2", "U_r3", "U_r4", "U_r5", "PWM_pre", "PWM_r1", "PWM_r2", "PWM_r3", "PWM_r4", "PWM_r5", "mW_pre", "mW_r1", "mW_r2", "mW_r3", "mW_r4", "mW_r5"]
+
+evaluation_titles = ["Substance Data", "Process setup", "Raw Data Processing", "Calculation"]
+evaluation_header = [["Substance", "Molar Mass [g/mol]", "Weighing [g]", "Volume [ml]", "Concentration [mol/l]"], 
+                     ["Process Points", "Evaluation Start Time", "Evaluation End Time", "V_A [ml/min]", "V_A,act [ml/min]", "n_A,act [mol/s]", "n_A,act,water [mol/s]", "V_B [ml/min]", "V_B,act [ml/min]", "n_B,act [mol/s]", "n_B,act,water [mol/s]"],
+                     ["Process Points", "T_A [°C]", "T_B [°C]", "T_out [°C]", "Upre [V]", "Ur1 [V]", "Ur2 [V]", "dT_A [°C]", "dT_B [°C]", "dT_out [°C]", "Q_Out [W]"],
+                     ["Process Points", "Q_A [W]", "Q_B [W]", "Qpre [W] - cp flux", "QSE,pre [W]", "Qr1 [W]", "Qr2 [W]", "dHr [kJ/mol]"]]
+
+class Evaluation_Report:
+    """This class keeps the entries of the evaluation sheet per process point. The sheet is laid out in one pass when it is written, so that no rows have to be inserted while the points are added."""
+    def __init__(self, substance_data):
+        self.substance_data = substance_data
+        self.points = {}                    # process point: [process setup row, raw data processing row, calculation row]
+        self.width = max(len(itm) for itm in evaluation_header)
+
+    def get_point(self, process_point):
+        """This function returns the rows of a process point, their values can be changed until the sheet is written. The first entry of each row is the process point."""
+        tmp = self.points.get(process_point)
+        if tmp is None:
+            tmp = self.points[process_point] = [[process_point] + [None] * (len(evaluation_header[idx]) - 1) for idx in range(1, 4)]
+        return tmp
+
+    def copy(self):
+        """This function returns a copy of the report, whose rows are not changed by the strategy anymore."""
+        ret = Evaluation_Report(self.substance_data)
+        ret.points = {process_point: [list(row) for row in rows] for process_point, rows in self.points.items()}
+        return ret
+
+    def get_rows(self):
+        """This function returns the rows of the sheet and, for each section, the row of the title, the row after its last entry and its number of columns."""
+        rows = []
+        counter = []
+
+        # substance data and additional data
+        rows.append([evaluation_titles[0]])
+        rows.append(evaluation_header[0] + [None, None, "Additional data"])
+        additional_data = [["concentration [mol/l]", Dictionary.calculation_data["concentration"]], ["cp [J/(molK)]", Dictionary.calculation_data["cp"]]]
+        for idx in range(2):
+            rows.append([chr(idx+97), self.substance_data.get_molar_mass()[idx], self.substance_data.get_weighing()[idx], self.substance_data.get_volume()[idx], self.substance_data.get_concentration()[idx], None, None] + additional_data[idx])
+        rows.append([])
+        counter.append([1, 5, len(evaluation_header[0])])
+
+        # process setup, raw data processing and calculation, separated by an empty row
+        for idx in range(1, 4):
+            counter.append([len(rows)+1, 0, len(evaluation_header[idx])])
+            rows.append([evaluation_titles[idx]])
+            rows.append(evaluation_header[idx])
+            for process_point in sorted(self.points):
+                rows.append(self.points[process_point][idx-1])
+            counter[idx][1] = len(rows)+1
+            rows.append([])
+        return rows, counter
+
+    def write(self, sheet):
+        """This function writes all sections into the sheet and returns their positions (see get_rows). The sheet only grows, so every cell of the previous layout is overwritten. Empty cells are left alone, they may be merged."""
+        rows, counter = self.get_rows()
+        for idx in range(len(rows)):
+            row = rows[idx]
+            for jdx in range(self.width):
+                value = row[jdx] if jdx < len(row) else None
+                cell = sheet.cell(row=idx+1, column=jdx+1)
+                if value is not None or cell.value is not None:
+                    cell.value = value
+        return counter
+
 def create_excel(substance_data, file_name):   
     wb = Workbook()
 
@@ -15,51 +84,183 @@ def create_excel(substance_data, file_name):
     sheet[0].title = sheet_names[0]
     sheet.append(wb.create_sheet(sheet_names[1]))
 
-    # setup the evaluation sheet
-    counter = 1
-    ret_counter = []
-
-    title = [["Substance Data"], ["Process setup"], ["Raw Data Processing"], ["Calculation"]]
-    data = [["Substance", "Molar Mass [g/mol]", "Weighing [g]", "Volume [ml]", "Concentration [mol/l]"], 
-            ["Process Points", "Evaluation Start Time", "Evaluation End Time", "V_A [ml/min]", "V_A,act [ml/min]", "n_A,act [mol/s]", "n_A,act,water [mol/s]", "V_B [ml/min]", "V_B,act [ml/min]", "n_B,act [mol/s]", "n_B,act,water [mol/s]"],
-            ["Process Points", "T_A [°C]", "T_B [°C]", "T_out [°C]", "Upre [V]", "Ur1 [V]", "Ur2 [V]", "dT_A [°C]", "dT_B [°C]", "dT_out [°C]", "Q_Out [W]"],
-            ["Process Points", "Q_A [W]", "Q_B [W]", "Qpre [W] - cp flux", "QSE,pre [W]", "Qr1 [W]", "Qr2 [W]", "dHr [kJ/mol]"]]
-
-    for idx in range(4):
-        sheet[0].append(title[idx])
-        sheet[0].append(data[idx])
-        counter += 2
-        ret_counter.append([counter-2, counter, len(data[idx])])
-
-    # insert substance data to the evaluation sheet
-    sheet[0].insert_rows(idx=3, amount = 3)
-    for idx in range(2):
-        sheet[0].cell(row=idx+3, column=1).value = chr(idx+97)
-        sheet[0].cell(row=idx+3, column=2).value = substance_data.get_molar_mass()[idx]
-        sheet[0].cell(row=idx+3, column=3).value = substance_data.get_weighing()[idx]
-        sheet[0].cell(row=idx+3, column=4).value = substance_data.get_volume()[idx]
-        sheet[0].cell(row=idx+3, column=5).value = substance_data.get_concentration()[idx]
-
-    sheet[0].cell(row=2, column=8).value = "Additional data"
-    sheet[0].cell(row=3, column=8).value = "concentration [mol/l]"
-    sheet[0].cell(row=3, column=9).value = Dictionary.calculation_data["concentration"]
-    sheet[0].cell(row=4, column=8).value = "cp [J/(molK)]"
-    sheet[0].cell(row=4, column=9).value = Dictionary.calculation_data["cp"]
-
-    # remember at which position the titles are and where rows have to be inserted later 
-    sheet[0].insert_rows(idx=8, amount=1)
-    sheet[0].insert_rows(idx=11, amount=1)
-
-    val = 3
-    for idx in range(1,4):
-        ret_counter[idx][0] += val
-        ret_counter[idx][1] += val
-        val += 1  
-    ret_counter[0][1] = 5
-
-    # setup the evaluation sheet
-    sheet[1].append(["Elapsed_Time", "T_set", "T_pre", "T_r1", "T_r2", "T_r3", "T_r4", "T_r5", "T_A", "T_B", "T_out", "U_pre", "U_r1", "U_r2", "U_r3", "U_r4", "U_r5", "PWM_pre", "PWM_r1", "PWM_r2", "PWM_r3", "PWM_r4", "PWM_r5", "mW_pre", "mW_r1", "mW_r2", "mW_r3", "mW_r4", "mW_r5"])
+    # setup the evaluation sheet, the process points are added to the report
+    report = Evaluation_Report(substance_data)
+    report.write(sheet[0])
+
+    # setup the raw data sheet
+    sheet[1].append(raw_data_header)
 
     wb.save("Calorimetry\{0}.xlsx".format(file_name))
 
-    return wb, sheet, ret_counter
\ No newline at end of file
+    return wb, sheet, report
+
+def reference_raw_data_store(sheet, path):
+    """The raw data sheet only holds a summary, this function notes where all rows are stored."""
+    sheet.cell(row=1, column=len(raw_data_header)+2).value = "Raw data store"
+    sheet.cell(row=2, column=len(raw_data_header)+2).value = path
+
+def reference_raw_data_export(sheet, path):
+    """This function notes where the raw data workbook is exported to (below the raw data store)."""
+    sheet.cell(row=3, column=len(raw_data_header)+2).value = "Raw data workbook"
+    sheet.cell(row=4, column=len(raw_data_header)+2).value = path
+
+# export of the raw data store:
+# Excel does not open sheets with more rows than this
+max_sheet_rows = 1048576
+
+def raw_sheet_name(sheet_idx):
+    """This function returns the name of the n-th raw data sheet of an export, the first one is "Raw_Data_COM"."""
+    if sheet_idx == 0:
+        return "Raw_Data_COM"
+    return "Raw_Data_COM_{:d}".format(sheet_idx+1)
+
+def to_rows(chunk):
+    # empty cells instead of NaN, which is not a valid value in a workbook
+    rows = chunk.tolist()
+    if np.isnan(chunk).any():
+        rows = [[None if val != val else val for val in row] for row in rows]
+    return rows
+
+def export_raw_data(store, file_name, sheet_rows = max_sheet_rows):
+    """This function streams all lines of a raw data store (or its reader) into a write-only workbook and returns its path. The lines never have to be in memory completely. Before a sheet exceeds the given number of rows (header included), the next sheet is started."""
+    if not 1 < sheet_rows <= max_sheet_rows:
+        raise Exception("A sheet has to hold between 2 and {:d} rows".format(max_sheet_rows))
+    wb = Workbook(write_only=True)
+    ws = None
+    sheet_idx = 0
+    free = 0
+    for chunk in store.chunks():
+        for row in to_rows(chunk):
+            if free == 0:
+                ws = wb.create_sheet(raw_sheet_name(sheet_idx))
+                ws.append(raw_data_header)
+                sheet_idx += 1
+                free = sheet_rows - 1
+            ws.append(row)
+            free -= 1
+    if ws is None:
+        ws = wb.create_sheet(raw_sheet_name(0))
+        ws.append(raw_data_header)
+
+    path = "Calorimetry\{0}.xlsx".format(file_name)
+    wb.save(path)
+    return path
+
+def decimate_raw_data(store, num_rows):
+    """This function returns every n-th line of a raw data store, so that at most num_rows lines are left. The chunks are decimated one after another."""
+    step = max(-(-len(store) // num_rows), 1)
+    pieces = []
+    offset = 0
+    for chunk in store.chunks():
+        pieces.append(np.array(chunk[(-offset) % step::step]))
+        offset += len(chunk)
+    if len(pieces) == 0:
+        return np.empty((0, len(raw_data_header)))
+    return np.concatenate(pieces)
+
+class Write_Behind:
+    """This class saves the workbook in a background thread. Changes are merged and saved after the save interval or when a flush is requested, e.g. at the end of a point. Until then, the raw data lines are appended to a journal every journal interval, so that a crash loses at most one journal interval. The workbook belongs to the background thread: the other threads only hand over cells (set_row) and a snapshot function, which is called under the lock and returns a function that writes the copied values into the workbook. So the lock is never held while the workbook is saved."""
+    def __init__(self, workbook, file_name, save_interval_s, journal_interval_s, raw_store = None, snapshot = None):
+        self.workbook = workbook
+        self.raw_store = raw_store
+        self.snapshot = snapshot
+        self.path = "Calorimetry\{0}.xlsx".format(file_name)
+        self.journal_path = "Calorimetry\{0}.journal".format(file_name)
+        self.save_interval_s = save_interval_s
+        self.journal_interval_s = journal_interval_s
+
+        # Everybody who hands over changes has to hold this lock.
+        self.lock = threading.RLock()
+        self.journal_lock = threading.Lock()
+        self.pending = []
+        self.rows = []              # [sheet, row, values] that are not in the workbook yet
+        self.dirty = False
+
+        self.flush_request = threading.Event()
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="Write_Behind_{}".format(file_name), daemon=True)
+        self.thread.start()
+
+    def journal(self, line):
+        with self.journal_lock:
+            self.pending.append(line)
+
+    def set_row(self, sheet, row, values):
+        """This function hands over the values of a row, starting with the first column."""
+        with self.lock:
+            self.rows.append([sheet, row, values])
+            self.dirty = True
+
+    def mark_dirty(self):
+        with self.lock:
+            self.dirty = True
+
+    def flush(self):
+        """This function requests a save without waiting for it."""
+        self.flush_request.set()
+
+    def run(self):
+        next_save = time.monotonic() + self.save_interval_s
+        while self.running:
+            requested = self.flush_request.wait(self.journal_interval_s)
+            self.write_journal()
+            if requested or next_save < time.monotonic():
+                self.flush_request.clear()
+                self.save()
+                next_save = time.monotonic() + self.save_interval_s
+
+    def write_journal(self):
+        with self.journal_lock:
+            lines = self.pending
+            self.pending = []
+        if len(lines) == 0:
+            return
+
+        with open(self.journal_path, "a") as fout:
+            for line in lines:
+                fout.write("\t".join(str(val) for val in line) + "\n")
+            fout.flush()
+            os.fsync(fout.fileno())
+
+    def save(self, finish = None):
+        # only the hand-over takes the lock
+        with self.lock:
+            if not self.dirty:
+                return
+            self.dirty = False
+            rows = self.rows
+            self.rows = []
+            apply = None
+            if self.snapshot is not None:
+                apply = self.snapshot()
+
+        for sheet, row, values in rows:
+            for idx in range(len(values)):
+                sheet.cell(row=row, column=idx+1).value = values[idx]
+        if apply is not None:
+            apply()
+        if finish is not None:
+            finish()
+        try:
+            self.workbook.save(self.path)
+        except OSError as exc:
+            # e.g. the file is opened in Excel, the next interval tries again
+            print("workbook could not be saved:", exc)
+            self.mark_dirty()
+            return
+
+        # everything in the journal is part of the saved workbook and the raw data store now
+        if self.raw_store is not None:
+            self.raw_store.flush()
+        if os.path.isfile(self.journal_path):
+            os.remove(self.journal_path)
+
+    def close(self, finish = None):
+        """This function stops the background thread and saves the workbook a last time. The function "finish" is called before, when the workbook belongs to the calling thread."""
+        self.running = False
+        self.flush_request.set()
+        self.thread.join()
+        self.write_journal()
+        self.mark_dirty()
+        self.save(finish)
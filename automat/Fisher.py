@@ -5,10 +5,11 @@
 
 # library/modules from python:
 import time
-import re
 import math
 
 # own scripts:
+import automat.Metrics as Metrics
+import automat.Protocol as Protocol
 import automat.pyState as pyState
 import automat.LayerB as LayerB
 
@@ -75,10 +76,10 @@ class dummy_cmd_handle():
 class check_response_base:
     """This class forms the basis for all other response checkers."""
     def __init__(self, resp):
-        self.resp = resp
+        self.resp = resp.encode("ASCII")
 
     def __call__(self, ans):
-        if ans.decode("ASCII") == self.resp:
+        if ans == self.resp:
             return True
         return False
 
@@ -95,51 +96,69 @@ class check_1(check_response_base):
         super().__init__("1")
 
 class check_set_Temp(check_response_base):
+    """The temperature is a one-element list, it is read when the answer is checked."""
     def __init__(self, resp):
-        self.resp = float(resp)
+        self.resp = resp
     
     def __call__(self, ans):
-        answer = ans.decode("ASCII")
-        find_pattern = re.compile(r"([\d\.]*)C")
-        if not find_pattern.match(answer) is None:
-            value = float(find_pattern.match(answer).group(1))
-        else:
+        resp = Protocol.parse_fisher_temp(ans)
+        if resp is None:
             return False
 
-        if value == self.resp:
+        if resp.value == float(self.resp[0]):
             return True
         return False
 
+# The checkers do not change, so all states share them.
+response_OK = check_OK()
+response_0 = check_0()
+response_1 = check_1()
+response_C = check_response_base("C")
+
 # layer (A) states:
 class Deactivated(pyState.State_Base):
     """This state checks whether the pump of the thermostat is still switched off and whether the set temperature is correct. A different set temperature can be set and the pump can be activated from outside."""
-    class factory:
-        def __init__(self, set_temp, com_handle):
+    class factory(pyState.Factory_Base):
+        def arm(self, set_temp, com_handle):
             self.set_temp = set_temp
             self.com_handle = com_handle
-
-        def create_state(self, state_name):
-            if state_name == "Check_Pump_State":
-                st = LayerB.Send_And_Check()
-                st.enter(state_name, "RO", check_0(), self.com_handle, 3)
-                return st
-            elif state_name == "Set_Temp":
-                st = LayerB.Send_And_Check()
-                st.enter(state_name, "SS {:.1f}".format(self.set_temp[0]), check_OK(), self.com_handle, 3)
-                return st
-            elif state_name == "Check_Temp":
-                st = LayerB.Send_And_Check()
-                st.enter(state_name, "RS", check_set_Temp(self.set_temp[0]), self.com_handle, 3)
-                return st
-            elif state_name == "Waiting":
-                st = LayerB.Delay_State()
-                st.enter(state_name, 500, "next")
-                return st
-            elif state_name == "Error":
-                st = pyState.State_Base()
-                st.enter(state_name)
-                return st
-            raise Exception("Unhandled State in Factory")
+            self.temp_checker = check_set_Temp(set_temp)
+
+        def create_Check_Pump_State(self, state_name):
+            st = self.reuse(LayerB.Send_And_Check, state_name)
+            st.enter(state_name, "RO", response_0, self.com_handle, 3)
+            return st
+
+        def create_Set_Temp(self, state_name):
+            st = self.reuse(LayerB.Send_And_Check, state_name)
+            st.enter(state_name, "SS {:.1f}".format(self.set_temp[0]), response_OK, self.com_handle, 3)
+            return st
+
+        def create_Check_Temp(self, state_name):
+            st = self.reuse(LayerB.Send_And_Check, state_name)
+            st.enter(state_name, "RS", self.temp_checker, self.com_handle, 3)
+            return st
+
+        def create_Waiting(self, state_name):
+            st = self.reuse(LayerB.Delay_State, state_name)
+            st.enter(state_name, 500, "next")
+            return st
+
+        def create_Error(self, state_name):
+            st = self.reuse(pyState.State_Base, state_name)
+            st.enter(state_name)
+            return st
+
+    tab = [
+        ["Check_Pump_State",    "next",         "Waiting"],
+        ["Check_Pump_State",    "error",        "Error"],
+        ["Waiting",             "next",         "Check_Pump_State"],
+        ["Waiting",             "new_temp",     "Set_Temp"],
+        ["Set_Temp",            "next",         "Check_Temp"],
+        ["Set_Temp",            "error",        "Error"],
+        ["Check_Temp",          "next",         "Check_Pump_State"],
+        ["Check_Temp",          "error",        "Error"],
+        ]
 
     def enter(self, name, target_temp, set_temp, com_handle):
         super().enter(name)
@@ -147,19 +166,7 @@ class Deactivated(pyState.State_Base):
         self.set_temp = set_temp
         self.pump_on_flag = False
 
-        self.tab = [
-            ["Check_Pump_State",    "next",         "Waiting"],
-            ["Check_Pump_State",    "error",        "Error"],
-            ["Waiting",             "next",         "Check_Pump_State"],
-            ["Waiting",             "new_temp",     "Set_Temp"],
-            ["Set_Temp",            "next",         "Check_Temp"],
-            ["Set_Temp",            "error",        "Error"],
-            ["Check_Temp",          "next",         "Check_Pump_State"],
-            ["Check_Temp",          "error",        "Error"],
-            ]
-        self.fac = Deactivated.factory(set_temp, com_handle)
-        self.en = pyState.Engine(self.tab, self.fac, "Check_Pump_State")
-        self.en.enter()
+        self.enter_engine(Deactivated.factory, "Check_Pump_State", set_temp, com_handle)
 
     def __call__(self):
         self.en.tick()
@@ -189,33 +196,47 @@ class Deactivated(pyState.State_Base):
 
 class Activated(pyState.State_Base):
     """This state checks whether the pump of the thermostat is still switched on and whether the set temperature is correct. A different set temperature can be set and the pump can be deactivated from outside."""
-    class factory:
-        def __init__(self, set_temp, com_handle):
+    class factory(pyState.Factory_Base):
+        def arm(self, set_temp, com_handle):
             self.set_temp = set_temp
             self.com_handle = com_handle
-
-        def create_state(self, state_name):
-            if state_name == "Check_Pump_State":
-                st = LayerB.Send_And_Check()
-                st.enter(state_name, "RO", check_1(), self.com_handle, 3)
-                return st
-            elif state_name == "Set_Temp":
-                st = LayerB.Send_And_Check()
-                st.enter(state_name, "SS {:.1f}".format(self.set_temp[0]), check_OK(), self.com_handle, 3)
-                return st
-            elif state_name == "Check_Temp":
-                st = LayerB.Send_And_Check()
-                st.enter(state_name, "RS", check_set_Temp(self.set_temp[0]), self.com_handle, 3)
-                return st
-            elif state_name == "Waiting":
-                st = LayerB.Delay_State()
-                st.enter(state_name, 500, "next")
-                return st
-            elif state_name == "Error":
-                st = pyState.State_Base()
-                st.enter(state_name)
-                return st
-            raise Exception("Unhandled State in Factory")
+            self.temp_checker = check_set_Temp(set_temp)
+
+        def create_Check_Pump_State(self, state_name):
+            st = self.reuse(LayerB.Send_And_Check, state_name)
+            st.enter(state_name, "RO", response_1, self.com_handle, 3)
+            return st
+
+        def create_Set_Temp(self, state_name):
+            st = self.reuse(LayerB.Send_And_Check, state_name)
+            st.enter(state_name, "SS {:.1f}".format(self.set_temp[0]), response_OK, self.com_handle, 3)
+            return st
+
+        def create_Check_Temp(self, state_name):
+            st = self.reuse(LayerB.Send_And_Check, state_name)
+            st.enter(state_name, "RS", self.temp_checker, self.com_handle, 3)
+            return st
+
+        def create_Waiting(self, state_name):
+            st = self.reuse(LayerB.Delay_State, state_name)
+            st.enter(state_name, 500, "next")
+            return st
+
+        def create_Error(self, state_name):
+            st = self.reuse(pyState.State_Base, state_name)
+            st.enter(state_name)
+            return st
+
+    tab = [
+        ["Check_Pump_State",    "next",     "Waiting"],
+        ["Check_Pump_State",    "error",    "Error"],
+        ["Waiting",             "next",     "Check_Temp"],
+        ["Waiting",             "new_temp", "Set_Temp"],
+        ["Set_Temp",            "next",     "Check_Temp"],
+        ["Set_Temp",            "error",    "Error"],
+        ["Check_Temp",          "next",     "Check_Pump_State"],
+        ["Check_Temp",          "error",    "Error"],
+        ]
 
     def enter(self, name, target_temp, set_temp, com_handle):
         super().enter(name)
@@ -223,19 +244,7 @@ class Activated(pyState.State_Base):
         self.set_temp = set_temp
         self.pump_off_flag = False
 
-        self.tab = [
-            ["Check_Pump_State",    "next",     "Waiting"],
-            ["Check_Pump_State",    "error",    "Error"],
-            ["Waiting",             "next",     "Check_Temp"],
-            ["Waiting",             "new_temp", "Set_Temp"],
-            ["Set_Temp",            "next",     "Check_Temp"],
-            ["Set_Temp",            "error",    "Error"],
-            ["Check_Temp",          "next",     "Check_Pump_State"],
-            ["Check_Temp",          "error",    "Error"],
-            ]
-        self.fac = Activated.factory(set_temp, com_handle)
-        self.en = pyState.Engine(self.tab, self.fac, "Check_Pump_State")
-        self.en.enter()
+        self.enter_engine(Activated.factory, "Check_Pump_State", set_temp, com_handle)
 
     def __call__(self):
         self.en.tick()
@@ -265,40 +274,40 @@ class Activated(pyState.State_Base):
 
 class Activating(pyState.State_Base):
     """This state activates the pump of the thermostat and checks whether the switch-on has worked."""
-    class factory:
-        def __init__(self, com_handle):
+    class factory(pyState.Factory_Base):
+        def arm(self, com_handle):
             self.com_handle = com_handle
 
-        def create_state(self, state_name):
-            if state_name == "Pump_On":
-                st = LayerB.Send_And_Check()
-                st.enter(state_name, "SO 1", check_OK(), self.com_handle, 3)
-                return st
-            elif state_name == "Check_Pump_State":
-                st = LayerB.Send_And_Check()
-                st.enter(state_name, "RO", check_1(), self.com_handle, 3)
-                return st
-            elif state_name == "Finished":
-                st = pyState.State_Base()
-                st.enter(state_name)
-                return st
-            elif state_name == "Error":
-                st = pyState.State_Base()
-                st.enter(state_name)
-                return st
-            raise Exception("Unhandled State in Factory")
+        def create_Pump_On(self, state_name):
+            st = self.reuse(LayerB.Send_And_Check, state_name)
+            st.enter(state_name, "SO 1", response_OK, self.com_handle, 3)
+            return st
+
+        def create_Check_Pump_State(self, state_name):
+            st = self.reuse(LayerB.Send_And_Check, state_name)
+            st.enter(state_name, "RO", response_1, self.com_handle, 3)
+            return st
+
+        def create_Finished(self, state_name):
+            st = self.reuse(pyState.State_Base, state_name)
+            st.enter(state_name)
+            return st
+
+        def create_Error(self, state_name):
+            st = self.reuse(pyState.State_Base, state_name)
+            st.enter(state_name)
+            return st
+
+    tab = [
+        ["Pump_On",            "next",     "Check_Pump_State"],
+        ["Pump_On",            "error",    "Error"],
+        ["Check_Pump_State",   "next",     "Finished"],
+        ["Check_Pump_State",   "error",    "Error"],
+        ]
 
     def enter(self, name, com_handle):
         super().enter(name)
-        self.tab = [
-            ["Pump_On",            "next",     "Check_Pump_State"],
-            ["Pump_On",            "error",    "Error"],
-            ["Check_Pump_State",   "next",     "Finished"],
-            ["Check_Pump_State",   "error",    "Error"],
-            ]
-        self.fac = Activating.factory(com_handle)
-        self.en = pyState.Engine(self.tab, self.fac, "Pump_On")
-        self.en.enter()
+        self.enter_engine(Activating.factory, "Pump_On", com_handle)
 
     def __call__(self):
         self.en.tick()
@@ -314,40 +323,40 @@ class Activating(pyState.State_Base):
 
 class Deactivating(pyState.State_Base):
     """This state deactivates the pump of the thermostat and checks whether the shutdown has worked."""
-    class factory:
-        def __init__(self, com_handle):
+    class factory(pyState.Factory_Base):
+        def arm(self, com_handle):
             self.com_handle = com_handle
 
-        def create_state(self, state_name):
-            if state_name == "Pump_Off":
-                st = LayerB.Send_And_Check()
-                st.enter( state_name, "SO 0", check_OK(), self.com_handle, 3)
-                return st
-            elif state_name == "Check_Pump_State":
-                st = LayerB.Send_And_Check()
-                st.enter( state_name, "RO", check_0(), self.com_handle, 3)
-                return st
-            elif state_name == "Finished":
-                st = pyState.State_Base()
-                st.enter(state_name)
-                return st
-            elif state_name == "Error":
-                st = pyState.State_Base()
-                st.enter(state_name)
-                return st
-            raise Exception("Unhandled State in Factory")
+        def create_Pump_Off(self, state_name):
+            st = self.reuse(LayerB.Send_And_Check, state_name)
+            st.enter( state_name, "SO 0", response_OK, self.com_handle, 3)
+            return st
+
+        def create_Check_Pump_State(self, state_name):
+            st = self.reuse(LayerB.Send_And_Check, state_name)
+            st.enter( state_name, "RO", response_0, self.com_handle, 3)
+            return st
+
+        def create_Finished(self, state_name):
+            st = self.reuse(pyState.State_Base, state_name)
+            st.enter(state_name)
+            return st
+
+        def create_Error(self, state_name):
+            st = self.reuse(pyState.State_Base, state_name)
+            st.enter(state_name)
+            return st
+
+    tab = [
+        ["Pump_Off",           "next",     "Check_Pump_State"],
+        ["Pump_Off",           "error",    "Error"],
+        ["Check_Pump_State",   "next",     "Finished"],
+        ["Check_Pump_State",   "error",    "Error"],
+        ]
 
     def enter(self, name, com_handle):
         super().enter(name)
-        self.tab = [
-            ["Pump_Off",           "next",     "Check_Pump_State"],
-            ["Pump_Off",           "error",    "Error"],
-            ["Check_Pump_State",   "next",     "Finished"],
-            ["Check_Pump_State",   "error",    "Error"],
-            ]
-        self.fac = Deactivating.factory(com_handle)
-        self.en = pyState.Engine(self.tab, self.fac, "Pump_Off")
-        self.en.enter()
+        self.enter_engine(Deactivating.factory, "Pump_Off", com_handle)
 
     def __call__(self):
         self.en.tick()
@@ -363,77 +372,85 @@ class Deactivating(pyState.State_Base):
 
 class Configuration(pyState.State_Base):
     """This state deactivates the pump of the thermostat and adjusts all initial settings."""
-    class factory:
-        def __init__(self, settings, com_handle):
+    class factory(pyState.Factory_Base):
+        def arm(self, settings, com_handle):
             self.settings = settings
             self.com_handle = com_handle
-
-        def create_state(self, state_name):
-            if state_name == "Pump_Off":
-                st = LayerB.Send_And_Check()
-                st.enter(state_name, "SO 0", check_OK(), self.com_handle, 3)
-                return st
-            elif state_name == "Check_Pump_State":
-                st = LayerB.Send_And_Check()
-                st.enter(state_name, "RO", check_0(), self.com_handle, 3)
-                return st
-            elif state_name == "Set_Temp_Unit":
-                st = LayerB.Send_And_Check()
-                st.enter(state_name, "STU C", check_OK(), self.com_handle, 3)
-                return st
-            elif state_name == "Check_Temp_Unit":
-                st = LayerB.Send_And_Check()
-                st.enter(state_name, "RTU", check_response_base("C") , self.com_handle, 3)
-                return st
-            elif state_name == "Set_Pump_Speed":
-                st = LayerB.Send_And_Check()
-                st.enter(state_name, "SPS {}".format(self.settings.get_pump_speed()),  check_OK(), self.com_handle, 3)
-                return st
-            elif state_name == "Check_Pump_Speed":
-                st = LayerB.Send_And_Check()
-                st.enter(state_name, "RPS", check_response_base(self.settings.get_pump_speed()), self.com_handle, 3)
-                return st
-            elif state_name == "Set_External_Probe":
-                st = LayerB.Send_And_Check()
-                st.enter(state_name, "SE {}".format(self.settings.get_external_probe()), check_OK(), self.com_handle, 3)
-                return st
-            elif state_name == "Check_External_Probe":
-                st = LayerB.Send_And_Check()
-                st.enter(state_name, "RE", check_response_base("{}".format(self.settings.get_external_probe())), self.com_handle, 3)
-                return st
-            elif state_name == "Finished":
-                st = pyState.State_Base()
-                st.enter(state_name)
-                return st
-            elif state_name == "Error":
-                st = pyState.State_Base()
-                st.enter(state_name)
-                return st
-            raise Exception("Unhandled State in Factory")
+            self.pump_speed_checker = check_response_base(settings.get_pump_speed())
+            self.external_probe_checker = check_response_base("{}".format(settings.get_external_probe()))
+
+        def create_Pump_Off(self, state_name):
+            st = self.reuse(LayerB.Send_And_Check, state_name)
+            st.enter(state_name, "SO 0", response_OK, self.com_handle, 3)
+            return st
+
+        def create_Check_Pump_State(self, state_name):
+            st = self.reuse(LayerB.Send_And_Check, state_name)
+            st.enter(state_name, "RO", response_0, self.com_handle, 3)
+            return st
+
+        def create_Set_Temp_Unit(self, state_name):
+            st = self.reuse(LayerB.Send_And_Check, state_name)
+            st.enter(state_name, "STU C", response_OK, self.com_handle, 3)
+            return st
+
+        def create_Check_Temp_Unit(self, state_name):
+            st = self.reuse(LayerB.Send_And_Check, state_name)
+            st.enter(state_name, "RTU", response_C, self.com_handle, 3)
+            return st
+
+        def create_Set_Pump_Speed(self, state_name):
+            st = self.reuse(LayerB.Send_And_Check, state_name)
+            st.enter(state_name, "SPS {}".format(self.settings.get_pump_speed()),  response_OK, self.com_handle, 3)
+            return st
+
+        def create_Check_Pump_Speed(self, state_name):
+            st = self.reuse(LayerB.Send_And_Check, state_name)
+            st.enter(state_name, "RPS", self.pump_speed_checker, self.com_handle, 3)
+            return st
+
+        def create_Set_External_Probe(self, state_name):
+            st = self.reuse(LayerB.Send_And_Check, state_name)
+            st.enter(state_name, "SE {}".format(self.settings.get_external_probe()), response_OK, self.com_handle, 3)
+            return st
+
+        def create_Check_External_Probe(self, state_name):
+            st = self.reuse(LayerB.Send_And_Check, state_name)
+            st.enter(state_name, "RE", self.external_probe_checker, self.com_handle, 3)
+            return st
+
+        def create_Finished(self, state_name):
+            st = self.reuse(pyState.State_Base, state_name)
+            st.enter(state_name)
+            return st
+
+        def create_Error(self, state_name):
+            st = self.reuse(pyState.State_Base, state_name)
+            st.enter(state_name)
+            return st
+
+    tab = [
+        ["Pump_Off",            "next",     "Check_Pump_State"],
+        ["Pump_Off",            "error",    "Error"],
+        ["Check_Pump_State",    "next",     "Set_Temp_Unit"],
+        ["Check_Pump_State",    "error",    "Error"],
+        ["Set_Temp_Unit",       "next",     "Check_Temp_Unit"],
+        ["Set_Temp_Unit",       "error",    "Error"],
+        ["Check_Temp_Unit",     "next",     "Set_Pump_Speed"],
+        ["Check_Temp_Unit",     "error",    "Error"],
+        ["Set_Pump_Speed",      "next",     "Check_Pump_Speed"],
+        ["Set_Pump_Speed",      "error",    "Error"],
+        ["Check_Pump_Speed",    "next",     "Set_External_Probe"],
+        ["Check_Pump_Speed",    "error",    "Error"],
+        ["Set_External_Probe",  "next",     "Check_External_Probe"],
+        ["Set_External_Probe",  "error",    "Error"],
+        ["Check_External_Probe","next",     "Finished"],
+        ["Check_External_Probe","error",    "Error"],
+        ]
 
     def enter(self, name, settings, com_handle):
         super().enter(name)
-        self.tab = [
-            ["Pump_Off",            "next",     "Check_Pump_State"],
-            ["Pump_Off",            "error",    "Error"],
-            ["Check_Pump_State",    "next",     "Set_Temp_Unit"],
-            ["Check_Pump_State",    "error",    "Error"],
-            ["Set_Temp_Unit",       "next",     "Check_Temp_Unit"],
-            ["Set_Temp_Unit",       "error",    "Error"],
-            ["Check_Temp_Unit",     "next",     "Set_Pump_Speed"],
-            ["Check_Temp_Unit",     "error",    "Error"],
-            ["Set_Pump_Speed",      "next",     "Check_Pump_Speed"],
-            ["Set_Pump_Speed",      "error",    "Error"],
-            ["Check_Pump_Speed",    "next",     "Set_External_Probe"],
-            ["Check_Pump_Speed",    "error",    "Error"],
-            ["Set_External_Probe",  "next",     "Check_External_Probe"],
-            ["Set_External_Probe",  "error",    "Error"],
-            ["Check_External_Probe","next",     "Finished"],
-            ["Check_External_Probe","error",    "Error"],
-            ]
-        self.fac = Configuration.factory(settings, com_handle)
-        self.en = pyState.Engine(self.tab, self.fac, "Pump_Off")
-        self.en.enter()
+        self.enter_engine(Configuration.factory, "Pump_Off", settings, com_handle)
 
     def __call__(self):
         self.en.tick()
@@ -470,61 +487,67 @@ class Driver:
                 return
             raise Exception("Invalid value (0, 1)")
 
-    class factory:
+    class factory(pyState.Factory_Base):
         def __init__(self, settings, target_temp, set_temp, com_handle):
             self.settings = settings
             self.target_temp = target_temp
             self.set_temp = set_temp
             self.com_handle = com_handle
 
-        def create_state(self, state_name):
-            if state_name == "Configuration":
-                st = Configuration()
-                st.enter(state_name, self.settings, self.com_handle)
-                return st
-            elif state_name == "Deactivated":
-                st = Deactivated()
-                st.enter(state_name, self.target_temp, self.set_temp, self.com_handle)
-                return st
-            elif state_name == "Activated":
-                st = Activated()
-                st.enter(state_name, self.target_temp, self.set_temp, self.com_handle)
-                return st
-            elif state_name == "Deactivating":
-                st = Deactivating()
-                st.enter(state_name, self.com_handle)
-                return st
-            elif state_name == "Activating":
-                st = Activating()
-                st.enter(state_name, self.com_handle)
-                return st
-            elif state_name == "Error":
-                st = pyState.State_Base()
-                st.enter(state_name)
-                return st
-            raise Exception("Unhandled State in Factory")
+        def create_Configuration(self, state_name):
+            st = self.reuse(Configuration, state_name)
+            st.enter(state_name, self.settings, self.com_handle)
+            return st
+
+        def create_Deactivated(self, state_name):
+            st = self.reuse(Deactivated, state_name)
+            st.enter(state_name, self.target_temp, self.set_temp, self.com_handle)
+            return st
+
+        def create_Activated(self, state_name):
+            st = self.reuse(Activated, state_name)
+            st.enter(state_name, self.target_temp, self.set_temp, self.com_handle)
+            return st
+
+        def create_Deactivating(self, state_name):
+            st = self.reuse(Deactivating, state_name)
+            st.enter(state_name, self.com_handle)
+            return st
+
+        def create_Activating(self, state_name):
+            st = self.reuse(Activating, state_name)
+            st.enter(state_name, self.com_handle)
+            return st
+
+        def create_Error(self, state_name):
+            st = self.reuse(pyState.State_Base, state_name)
+            st.enter(state_name)
+            return st
+
+    tab = [
+        ["Configuration",           "next",         "Deactivated"],
+        ["Configuration",           "error",        "Error"],
+        ["Deactivated",             "pump_on",      "Activating"],
+        ["Deactivated",             "error",        "Error"],
+        ["Activating",              "next",         "Activated"],
+        ["Activating",              "error",        "Error"],
+        ["Activated",               "pump_off",     "Deactivating"],
+        ["Activated",               "error",        "Error"],
+        ["Deactivating",            "next",         "Deactivated"],
+        ["Deactivating",            "error",        "Error"],
+        ]
 
     def __init__(self, name, settings, com_handle):
         self.name = name
-        self.tab = [
-            ["Configuration",           "next",         "Deactivated"],
-            ["Configuration",           "error",        "Error"],
-            ["Deactivated",             "pump_on",      "Activating"],
-            ["Deactivated",             "error",        "Error"],
-            ["Activating",              "next",         "Activated"],
-            ["Activating",              "error",        "Error"],
-            ["Activated",               "pump_off",     "Deactivating"],
-            ["Activated",               "error",        "Error"],
-            ["Deactivating",            "next",         "Deactivated"],
-            ["Deactivating",            "error",        "Error"],
-            ]
+        self.com_handle = com_handle
+        Metrics.register_device(com_handle, name)
         self.target_temp = [float("nan")]
         self.set_temp = [float("nan")]
 
         self.target_pump_state = False
 
         self.fac = Driver.factory(settings, self.target_temp, self.set_temp, com_handle)
-        self.en = pyState.Engine(self.tab, self.fac, "Configuration")
+        self.en = pyState.Engine(self.tab, self.fac, "Configuration", path=name)
         self.en.enter()
 
     def tick(self):
@@ -550,6 +573,12 @@ class Driver:
     def get_name(self):
         return self.name 
 
+    def get_com_handle(self):
+        return self.com_handle
+
+    def get_wakeup(self):
+        return self.en.get_wakeup()
+
     # In the following, the functions are defined to obtain the settings for the Fisher thermostat (from outside).
     def set_target_temp(self, val):
         self.target_temp[0] = val
@@ -5,11 +5,12 @@
 # checkers and all layer (A) states.
 
 # library/modules from python:
-import time
-import re
 import statistics 
 
 # own scripts:
+import automat.Clock as Clock
+import automat.Metrics as Metrics
+import automat.Protocol as Protocol
 import automat.pyState as pyState
 import automat.LayerC as LayerC
 import automat.LayerB as LayerB
@@ -72,7 +73,7 @@ class Save_Answer(pyState.State_Base):
     def enter(self, name, timeout_ms, com_handle, datalist, boundaries, next_event, timeout_event, done_event):
         super().enter(name)
         self.com_handle = com_handle
-        self.deadline = time.monotonic_ns() + timeout_ms * 1000000
+        self.deadline = Clock.now_ns() + timeout_ms * 1000000
         
         self.next_event = next_event
         self.timeout_event = timeout_event
@@ -83,12 +84,13 @@ class Save_Answer(pyState.State_Base):
         self.response = bytearray()
 
     def __call__(self):
-        end_of_frame = '\r'.encode("ASCII")
         tmp = self.com_handle.receive()
         for chr in tmp:
-            if chr == end_of_frame[0]:    
-                str_ans = find_pattern(self.response)
-                self.datalist.append(float(str_ans))
+            if chr == Protocol.end_of_frame[0]:    
+                resp = Protocol.parse_hplc(self.response)
+                if resp is None:
+                    return self.timeout_event
+                self.datalist.append(float(resp.value))
                 if len(self.datalist) < 10:
                     return self.next_event
                 # calculation of the mean and standard deviation
@@ -97,55 +99,59 @@ class Save_Answer(pyState.State_Base):
                 return self.done_event
             self.response.append(chr)
 
-        if time.monotonic_ns() > self.deadline:
+        if Clock.now_ns() > self.deadline:
             return self.timeout_event
         return None
 
+    def get_wakeup(self):
+        return self.deadline
+
 class Send_And_Save_Data(pyState.State_Base):
     """This layer (B) state combines the substates sending a command and waiting and saving the response."""
-    class factory:
-        def __init__(self, datalist, boundaries, com_handle):
+    class factory(pyState.Factory_Base):
+        def arm(self, datalist, boundaries, com_handle):
             self.datalist = datalist
             self.boundaries = boundaries
             self.com_handle = com_handle
 
-        def create_state(self, state_name):
-            if state_name == "Send":
-                st = LayerC.Send_Command()
-                st.enter(state_name, "PRESSURE?", self.com_handle, "next")
-                return st
-            elif state_name == "Save":
-                st = Save_Answer()
-                st.enter(state_name, 1000, self.com_handle, self.datalist, self.boundaries, "next", "timeout", "done")
-                return st
-            elif state_name == "Waiting":
-                st = LayerB.Delay_State()
-                st.enter(state_name, 500, "next")
-                return st
-            elif state_name == "Finished":
-                st = pyState.State_Base()
-                st.enter(state_name)
-                return st
-            elif state_name == "Error":
-                st = pyState.State_Base()
-                st.enter(state_name)
-                return st
-            raise Exception("Unhandled State in Factory")
+        def create_Send(self, state_name):
+            st = self.reuse(LayerC.Send_Command, state_name)
+            st.enter(state_name, "PRESSURE?", self.com_handle, "next")
+            return st
+
+        def create_Save(self, state_name):
+            st = self.reuse(Save_Answer, state_name)
+            st.enter(state_name, 1000, self.com_handle, self.datalist, self.boundaries, "next", "timeout", "done")
+            return st
+
+        def create_Waiting(self, state_name):
+            st = self.reuse(LayerB.Delay_State, state_name)
+            st.enter(state_name, 500, "next")
+            return st
+
+        def create_Finished(self, state_name):
+            st = self.reuse(pyState.State_Base, state_name)
+            st.enter(state_name)
+            return st
+
+        def create_Error(self, state_name):
+            st = self.reuse(pyState.State_Base, state_name)
+            st.enter(state_name)
+            return st
+
+    tab = [
+        ["Send",            "next",         "Save"],
+        ["Save",            "next",         "Waiting"],
+        ["Save",            "timeout",      "Error"],
+        ["Save",            "done",         "Finished"],
+        ["Waiting",         "next",         "Send"],
+        ]
 
     def enter(self, name, boundaries, com_handle):
         super().enter(name)
-        self.tab = [
-            ["Send",            "next",         "Save"],
-            ["Save",            "next",         "Waiting"],
-            ["Save",            "timeout",      "Error"],
-            ["Save",            "done",         "Finished"],
-            ["Waiting",         "next",         "Send"],
-            ]
         self.datalist = []
 
-        self.fac = Send_And_Save_Data.factory(self.datalist, boundaries, com_handle)
-        self.en = pyState.Engine(self.tab, self.fac, "Send")
-        self.en.enter()
+        self.enter_engine(Send_And_Save_Data.factory, "Send", self.datalist, boundaries, com_handle)
 
     def __call__(self):
         self.en.tick()
@@ -160,42 +166,36 @@ class Send_And_Save_Data(pyState.State_Base):
         super().exit()
 
 # response checkers:
-def find_pattern(ans):
-    answer = ans.decode("ASCII")
-    find_pattern = re.compile(r"\w*:(.*)")
-    if not find_pattern.match(answer) is None:
-        str_ans = find_pattern.match(answer).group(1)
-        return str_ans
-    else:
-        return False
-
+# The answers are parsed by the codec (Protocol.parse_hplc), an answer 
+# that does not fit the protocol is never accepted.
 class check_response_base:
     """This class forms the basis for all other response checkers."""
     def __init__(self, resp):
-        self.resp = resp
+        self.resp = str(resp).encode("ASCII")
 
     def __call__(self, ans):
-        # step 1: find pattern
-        str_ans = find_pattern(ans)
+        # step 1: parse the answer
+        resp = Protocol.parse_hplc(ans)
+        if resp is None:
+            return False
 
-        # step 2: compare pattern
-        if str_ans == self.resp:
-            return True
-        return False
+        # step 2: compare the value
+        return resp.value == self.resp
 
 class check_ok(check_response_base):
     def __init__(self):
         super().__init__("OK")
 
 class check_flow(check_response_base):
-    def __init__(self, val):
-        self.val = val
+    """The flow rate is a one-element list, it is read when the answer is checked."""
+    def __init__(self, flow):
+        self.flow = flow
 
     def __call__(self, ans):
-        str_ans = find_pattern(ans)
-        if int(str_ans) == self.val:
-            return True
-        return False
+        resp = Protocol.parse_hplc(ans)
+        if resp is None:
+            return False
+        return int(resp.value) == self.flow[0]
 
 # Die Ueberpruefung auf den Druck wird noch verbessert. Zur Zeit entsteht 
 # der Fehler sobald man einmal außerhalb der Schranken liegt. Spaeter soll 
@@ -207,8 +207,10 @@ class check_boundaries(check_response_base):
         self.upper = 220 # [0] + 20 * boundaries[1]
 
     def __call__(self, ans):
-        str_ans = find_pattern(ans)
-        val = float(str_ans) 
+        resp = Protocol.parse_hplc(ans)
+        if resp is None:
+            return False
+        val = float(resp.value)
         if val <= self.upper and val >= self.lower:
             return True
         return False
@@ -218,75 +220,87 @@ class check_0(check_response_base):
         super().__init__(0)
 
     def __call__(self, ans):
-        str_ans = find_pattern(ans)
-        val = float(str_ans)
+        resp = Protocol.parse_hplc(ans)
+        if resp is None:
+            return False
+        val = float(resp.value)
         if val <= 40:
             return True
         return False 
 
+# The checkers do not change, so all states share them.
+response_ok = check_ok()
+response_0 = check_0()
+
 # layer (A) states:
 class Configuration(pyState.State_Base):
     """This state deactivates the HPLC pump and adjusts all initial settings."""
-    class factory:
-        def __init__(self, settings, com_handle):
+    class factory(pyState.Factory_Base):
+        def arm(self, settings, com_handle):
             self.head = settings.get_head()
             self.settings = settings
             self.com_handle = com_handle
-
-        def create_state(self, state_name):
-            if state_name == "Pump_Off":
-                st = LayerB.Send_And_Check()
-                st.enter(state_name, "OFF", check_ok(), self.com_handle, 0)
-                return st
-            elif state_name == "Check_Pump_State":
-                st = LayerB.Send_And_Check()
-                st.enter(state_name, "PRESSURE?", check_0(), self.com_handle, 0)
-                return st
-            elif state_name == "Set_PMin":
-                st = LayerB.Send_And_Check()
-                st.enter(state_name, "PMIN{:.2}: {:.0f}".format(str(self.head), self.settings.get_PMin()), check_ok(), self.com_handle, 0)
-                return st
-            elif state_name == "Check_PMin":
-                st = LayerB.Send_And_Check()
-                st.enter(state_name, "PMIN{:.2}?".format(str(self.head)), check_response_base("{:.0f}".format(self.settings.get_PMin())) , self.com_handle, 0)
-                return st
-            elif state_name == "Set_PMax":
-                st = LayerB.Send_And_Check()
-                st.enter(state_name, "PMAX{:.2}: {:.0f}".format(str(self.head), self.settings.get_PMax()), check_ok(), self.com_handle, 0)
-                return st
-            elif state_name == "Check_PMax":
-                st = LayerB.Send_And_Check()
-                st.enter(state_name, "PMAX{:.2}?".format(str(self.head)), check_response_base("{:.0f}".format(self.settings.get_PMax())), self.com_handle, 0)
-                return st
-            elif state_name == "Finished":              
-                st = pyState.State_Base()
-                st.enter(state_name)
-                return st
-            elif state_name == "Error":
-                st = pyState.State_Base()
-                st.enter(state_name)
-                return st
-            raise Exception("Unhandled State in Factory")
+            self.pmin_checker = check_response_base("{:.0f}".format(settings.get_PMin()))
+            self.pmax_checker = check_response_base("{:.0f}".format(settings.get_PMax()))
+
+        def create_Pump_Off(self, state_name):
+            st = self.reuse(LayerB.Send_And_Check, state_name)
+            st.enter(state_name, "OFF", response_ok, self.com_handle, 0)
+            return st
+
+        def create_Check_Pump_State(self, state_name):
+            st = self.reuse(LayerB.Send_And_Check, state_name)
+            st.enter(state_name, "PRESSURE?", response_0, self.com_handle, 0)
+            return st
+
+        def create_Set_PMin(self, state_name):
+            st = self.reuse(LayerB.Send_And_Check, state_name)
+            st.enter(state_name, "PMIN{:.2}: {:.0f}".format(str(self.head), self.settings.get_PMin()), response_ok, self.com_handle, 0)
+            return st
+
+        def create_Check_PMin(self, state_name):
+            st = self.reuse(LayerB.Send_And_Check, state_name)
+            st.enter(state_name, "PMIN{:.2}?".format(str(self.head)), self.pmin_checker, self.com_handle, 0)
+            return st
+
+        def create_Set_PMax(self, state_name):
+            st = self.reuse(LayerB.Send_And_Check, state_name)
+            st.enter(state_name, "PMAX{:.2}: {:.0f}".format(str(self.head), self.settings.get_PMax()), response_ok, self.com_handle, 0)
+            return st
+
+        def create_Check_PMax(self, state_name):
+            st = self.reuse(LayerB.Send_And_Check, state_name)
+            st.enter(state_name, "PMAX{:.2}?".format(str(self.head)), self.pmax_checker, self.com_handle, 0)
+            return st
+
+        def create_Finished(self, state_name):
+            st = self.reuse(pyState.State_Base, state_name)
+            st.enter(state_name)
+            return st
+
+        def create_Error(self, state_name):
+            st = self.reuse(pyState.State_Base, state_name)
+            st.enter(state_name)
+            return st
+
+    tab = [
+        ["Pump_Off",            "next",     "Check_Pump_State"],
+        ["Pump_Off",            "error",    "Error"],
+        ["Check_Pump_State",    "next",     "Set_PMin"],
+        ["Check_Pump_State",    "error",    "Error"],
+        ["Set_PMin",            "next",     "Check_PMin"],
+        ["Set_PMin",            "error",    "Error"],
+        ["Check_PMin",          "next",     "Set_PMax"],
+        ["Check_PMin",          "error",    "Error"],
+        ["Set_PMax",            "next",     "Check_PMax"],
+        ["Set_PMax",            "error",    "Error"],
+        ["Check_PMax",          "next",     "Finished"],
+        ["Check_PMax",          "error",    "Error"],
+        ]
 
     def enter(self, name, settings, com_handle):
         super().enter(name)
-        self.tab = [
-            ["Pump_Off",            "next",     "Check_Pump_State"],
-            ["Pump_Off",            "error",    "Error"],
-            ["Check_Pump_State",    "next",     "Set_PMin"],
-            ["Check_Pump_State",    "error",    "Error"],
-            ["Set_PMin",            "next",     "Check_PMin"],
-            ["Set_PMin",            "error",    "Error"],
-            ["Check_PMin",          "next",     "Set_PMax"],
-            ["Check_PMin",          "error",    "Error"],
-            ["Set_PMax",            "next",     "Check_PMax"],
-            ["Set_PMax",            "error",    "Error"],
-            ["Check_PMax",          "next",     "Finished"],
-            ["Check_PMax",          "error",    "Error"],
-            ]
-        self.fac = Configuration.factory(settings, com_handle)
-        self.en = pyState.Engine(self.tab, self.fac, "Pump_Off")
-        self.en.enter()
+        self.enter_engine(Configuration.factory, "Pump_Off", settings, com_handle)
 
     def __call__(self):
         self.en.tick()
@@ -302,52 +316,54 @@ class Configuration(pyState.State_Base):
 
 class Deactivated(pyState.State_Base):
     """This state checks whether the HPLC pump is still switched off and whether anything has changed in the settings and adjusts them if necessary."""
-    class factory:
-        def __init__(self, set_flowrate, com_handle):
+    class factory(pyState.Factory_Base):
+        def arm(self, set_flowrate, com_handle):
             self.set_flow = set_flowrate
             self.com_handle = com_handle
-
-        def create_state(self, state_name):
-            if state_name == "Check_Pump_State":
-                st = LayerB.Send_And_Check()
-                st.enter(state_name, "PRESSURE?", check_0(), self.com_handle, 0)
-                return st
-            elif state_name == "Set_Flowrate":
-                st = LayerB.Send_And_Check()
-                st.enter(state_name, "FLOW: {:05.0f}".format(self.set_flow[0]), check_ok(), self.com_handle, 0)
-                return st
-            elif state_name == "Check_Flowrate":
-                st = LayerB.Send_And_Check()
-                st.enter(state_name, "FLOW?", check_flow(self.set_flow[0]), self.com_handle, 0)
-                return st
-            elif state_name == "Waiting":
-                st = LayerB.Delay_State()
-                st.enter(state_name, 500, "next")
-                return st
-            elif state_name == "Error":
-                st = pyState.State_Base()
-                st.enter(state_name)
-                return st
-            raise Exception("Unhandled State in Factory")
+            self.flow_checker = check_flow(set_flowrate)
+
+        def create_Check_Pump_State(self, state_name):
+            st = self.reuse(LayerB.Send_And_Check, state_name)
+            st.enter(state_name, "PRESSURE?", response_0, self.com_handle, 0)
+            return st
+
+        def create_Set_Flowrate(self, state_name):
+            st = self.reuse(LayerB.Send_And_Check, state_name)
+            st.enter(state_name, "FLOW: {:05.0f}".format(self.set_flow[0]), response_ok, self.com_handle, 0)
+            return st
+
+        def create_Check_Flowrate(self, state_name):
+            st = self.reuse(LayerB.Send_And_Check, state_name)
+            st.enter(state_name, "FLOW?", self.flow_checker, self.com_handle, 0)
+            return st
+
+        def create_Waiting(self, state_name):
+            st = self.reuse(LayerB.Delay_State, state_name)
+            st.enter(state_name, 500, "next")
+            return st
+
+        def create_Error(self, state_name):
+            st = self.reuse(pyState.State_Base, state_name)
+            st.enter(state_name)
+            return st
+
+    tab = [
+        ["Check_Pump_State",  "next",         "Waiting"],
+        ["Check_Pump_State",  "error",        "Error"],
+        ["Waiting",           "next",         "Check_Pump_State"],
+        ["Waiting",           "new_flowrate", "Set_Flowrate"],
+        ["Set_Flowrate",      "next",         "Check_Flowrate"],
+        ["Set_Flowrate",      "error",        "Error"],
+        ["Check_Flowrate",    "next",         "Check_Pump_State"],
+        ["Check_Flowrate",    "error",        "Error"],
+        ]
 
     def enter(self, name, target_flowrate, set_flowrate, com_handle):
         super().enter(name)
         self.target_flowrate = target_flowrate
         self.set_flowrate = set_flowrate
         self.pump_on_flag = False
-        self.tab = [
-            ["Check_Pump_State",  "next",         "Waiting"],
-            ["Check_Pump_State",  "error",        "Error"],
-            ["Waiting",           "next",         "Check_Pump_State"],
-            ["Waiting",           "new_flowrate", "Set_Flowrate"],
-            ["Set_Flowrate",      "next",         "Check_Flowrate"],
-            ["Set_Flowrate",      "error",        "Error"],
-            ["Check_Flowrate",    "next",         "Check_Pump_State"],
-            ["Check_Flowrate",    "error",        "Error"],
-            ]
-        self.fac = Deactivated.factory(set_flowrate, com_handle)
-        self.en = pyState.Engine(self.tab, self.fac, "Check_Pump_State")
-        self.en.enter()
+        self.enter_engine(Deactivated.factory, "Check_Pump_State", set_flowrate, com_handle)
 
     def __call__(self):
         self.en.tick()
@@ -377,42 +393,63 @@ class Deactivated(pyState.State_Base):
 
 class Activated(pyState.State_Base):
     """This state checks whether the HPLC pump is still running at the correct flow rate and whether anything has changed in the settings and adjusts them if necessary."""
-    class factory:
-        def __init__(self, set_flowrate, com_handle):
+    class factory(pyState.Factory_Base):
+        def arm(self, set_flowrate, com_handle):
             self.set_flow = set_flowrate
             self.com_handle = com_handle
+            self.flow_checker = check_flow(set_flowrate)
             self.boundaries = [0,0]
-
-        def create_state(self, state_name):
-            if state_name == "Get_Boundaries":
-                st = Send_And_Save_Data()
-                st.enter(state_name, self.boundaries, self.com_handle)
-                return st
-            elif state_name == "Check_Pump_State":
-                st = LayerB.Send_And_Check()
-                st.enter(state_name, "PRESSURE?", check_boundaries(self.boundaries), self.com_handle, 0)
-                return st
-            elif state_name == "Set_Flowrate":
-                st = LayerB.Send_And_Check()
-                st.enter(state_name, "FLOW: {:05.0f}".format(self.set_flow[0]), check_ok(), self.com_handle, 0)
-                return st
-            elif state_name == "Check_Flowrate":
-                st = LayerB.Send_And_Check()
-                st.enter(state_name, "FLOW?", check_flow(self.set_flow[0]), self.com_handle, 0)
-                return st
-            elif state_name == "Check_New_Flowrate":
-                st = LayerB.Send_And_Check()
-                st.enter(state_name, "FLOW?", check_flow(self.set_flow[0]), self.com_handle, 0)
-                return st
-            elif state_name == "Waiting":
-                st = LayerB.Delay_State()
-                st.enter(state_name, 500, "next")
-                return st
-            elif state_name == "Error":
-                st = pyState.State_Base()
-                st.enter(state_name)
-                return st
-            raise Exception("Unhandled State in Factory")
+            self.boundaries_checker = check_boundaries(self.boundaries)
+
+        def create_Get_Boundaries(self, state_name):
+            st = self.reuse(Send_And_Save_Data, state_name)
+            st.enter(state_name, self.boundaries, self.com_handle)
+            return st
+
+        def create_Check_Pump_State(self, state_name):
+            st = self.reuse(LayerB.Send_And_Check, state_name)
+            st.enter(state_name, "PRESSURE?", self.boundaries_checker, self.com_handle, 0)
+            return st
+
+        def create_Set_Flowrate(self, state_name):
+            st = self.reuse(LayerB.Send_And_Check, state_name)
+            st.enter(state_name, "FLOW: {:05.0f}".format(self.set_flow[0]), response_ok, self.com_handle, 0)
+            return st
+
+        def create_Check_Flowrate(self, state_name):
+            st = self.reuse(LayerB.Send_And_Check, state_name)
+            st.enter(state_name, "FLOW?", self.flow_checker, self.com_handle, 0)
+            return st
+
+        def create_Check_New_Flowrate(self, state_name):
+            st = self.reuse(LayerB.Send_And_Check, state_name)
+            st.enter(state_name, "FLOW?", self.flow_checker, self.com_handle, 0)
+            return st
+
+        def create_Waiting(self, state_name):
+            st = self.reuse(LayerB.Delay_State, state_name)
+            st.enter(state_name, 500, "next")
+            return st
+
+        def create_Error(self, state_name):
+            st = self.reuse(pyState.State_Base, state_name)
+            st.enter(state_name)
+            return st
+
+    tab = [
+        ["Get_Boundaries",      "next",         "Check_Pump_State"],
+        ["Get_Boundaries",      "error",        "Error"],
+        ["Check_Pump_State",    "next",         "Waiting"],
+        ["Check_Pump_State",    "error",        "Error"],
+        ["Waiting",             "next",         "Check_Flowrate"],
+        ["Waiting",             "new_flowrate", "Set_Flowrate"],
+        ["Set_Flowrate",        "next",         "Check_New_Flowrate"],
+        ["Set_Flowrate",        "error",        "Error"],
+        ["Check_New_Flowrate",  "next",         "Get_Boundaries"],
+        ["Check_New_Flowrate",  "error",        "Error"],
+        ["Check_Flowrate",      "next",         "Check_Pump_State"],
+        ["Check_Flowrate",      "error",        "Error"],
+        ]
 
     def enter(self, name, target_flowrate, set_flowrate, com_handle):
         super().enter(name)
@@ -420,23 +457,7 @@ class Activated(pyState.State_Base):
         self.set_flowrate = set_flowrate
         self.pump_off_flag = False
 
-        self.tab = [
-            ["Get_Boundaries",      "next",         "Check_Pump_State"],
-            ["Get_Boundaries",      "error",        "Error"],
-            ["Check_Pump_State",    "next",         "Waiting"],
-            ["Check_Pump_State",    "error",        "Error"],
-            ["Waiting",             "next",         "Check_Flowrate"],
-            ["Waiting",             "new_flowrate", "Set_Flowrate"],
-            ["Set_Flowrate",        "next",         "Check_New_Flowrate"],
-            ["Set_Flowrate",        "error",        "Error"],
-            ["Check_New_Flowrate",  "next",         "Get_Boundaries"],
-            ["Check_New_Flowrate",  "error",        "Error"],
-            ["Check_Flowrate",      "next",         "Check_Pump_State"],
-            ["Check_Flowrate",      "error",        "Error"],
-            ]
-        self.fac = Activated.factory(set_flowrate, com_handle)
-        self.en = pyState.Engine(self.tab, self.fac, "Get_Boundaries")
-        self.en.enter()
+        self.enter_engine(Activated.factory, "Get_Boundaries", set_flowrate, com_handle)
 
     def __call__(self):
         self.en.tick()
@@ -466,40 +487,40 @@ class Activated(pyState.State_Base):
 
 class Deactivating(pyState.State_Base):
     """This state deactivates the HPLC pump and checks whether the shutdown has worked."""
-    class factory:
-        def __init__(self, com_handle):
+    class factory(pyState.Factory_Base):
+        def arm(self, com_handle):
             self.com_handle = com_handle
 
-        def create_state(self, state_name):
-            if state_name == "Pump_Off":
-                st = LayerB.Send_And_Check()
-                st.enter(state_name, "OFF", check_ok(), self.com_handle, 0)
-                return st
-            elif state_name == "Check_Pump_State":
-                st = LayerB.Send_And_Check()
-                st.enter(state_name, "PRESSURE?", check_0(), self.com_handle, 0)
-                return st
-            elif state_name == "Finished":
-                st = pyState.State_Base()
-                st.enter(state_name)
-                return st
-            elif state_name == "Error":
-                st = pyState.State_Base()
-                st.enter(state_name)
-                return st
-            raise Exception("Unhandled State in Factory")
+        def create_Pump_Off(self, state_name):
+            st = self.reuse(LayerB.Send_And_Check, state_name)
+            st.enter(state_name, "OFF", response_ok, self.com_handle, 0)
+            return st
+
+        def create_Check_Pump_State(self, state_name):
+            st = self.reuse(LayerB.Send_And_Check, state_name)
+            st.enter(state_name, "PRESSURE?", response_0, self.com_handle, 0)
+            return st
+
+        def create_Finished(self, state_name):
+            st = self.reuse(pyState.State_Base, state_name)
+            st.enter(state_name)
+            return st
+
+        def create_Error(self, state_name):
+            st = self.reuse(pyState.State_Base, state_name)
+            st.enter(state_name)
+            return st
+
+    tab = [
+        ["Pump_Off",           "next",     "Check_Pump_State"],
+        ["Pump_Off",           "error",    "Error"],
+        ["Check_Pump_State",   "next",     "Finished"],
+        ["Check_Pump_State",   "error",    "Error"],
+        ]
 
     def enter(self, name, com_handle):
         super().enter(name)
-        self.tab = [
-            ["Pump_Off",           "next",     "Check_Pump_State"],
-            ["Pump_Off",           "error",    "error"],
-            ["Check_Pump_State",   "next",     "Finished"],
-            ["Check_Pump_State",   "error",    "Error"],
-            ]
-        self.fac = Deactivating.factory(com_handle)
-        self.en = pyState.Engine(self.tab, self.fac, "Pump_Off")
-        self.en.enter()
+        self.enter_engine(Deactivating.factory, "Pump_Off", com_handle)
 
     def __call__(self):
         self.en.tick()
@@ -544,54 +565,60 @@ class Driver:
             self._PMin_ = pmin
             self._PMax_ = pmax
 
-    class factory:
+    class factory(pyState.Factory_Base):
         def __init__(self, settings, target_flowrate, set_flowrate, com_handle):
             self.settings = settings
             self.target_flowrate = target_flowrate
             self.set_flowrate = set_flowrate
             self.com_handle = com_handle
 
-        def create_state(self, state_name):
-            if state_name == "Configuration":
-                st = Configuration()
-                st.enter(state_name, self.settings, self.com_handle)
-                return st
-            elif state_name == "Deactivated":
-                st = Deactivated()
-                st.enter(state_name, self.target_flowrate, self.set_flowrate, self.com_handle)
-                return st
-            elif state_name == "Activated":
-                st = Activated()
-                st.enter(state_name, self.target_flowrate, self.set_flowrate, self.com_handle)
-                return st
-            elif state_name == "Deactivating":
-                st = Deactivating()
-                st.enter(state_name, self.com_handle)
-                return st
-            if state_name == "Activating":
-                st = LayerB.Send_And_Check()
-                st.enter(state_name, "ON", check_ok(), self.com_handle, 0)
-                return st
-            elif state_name == "Error":
-                st = pyState.State_Base()
-                st.enter(state_name)
-                return st
-            raise Exception("Unhandled State in Factory")
+        def create_Configuration(self, state_name):
+            st = self.reuse(Configuration, state_name)
+            st.enter(state_name, self.settings, self.com_handle)
+            return st
+
+        def create_Deactivated(self, state_name):
+            st = self.reuse(Deactivated, state_name)
+            st.enter(state_name, self.target_flowrate, self.set_flowrate, self.com_handle)
+            return st
+
+        def create_Activated(self, state_name):
+            st = self.reuse(Activated, state_name)
+            st.enter(state_name, self.target_flowrate, self.set_flowrate, self.com_handle)
+            return st
+
+        def create_Deactivating(self, state_name):
+            st = self.reuse(Deactivating, state_name)
+            st.enter(state_name, self.com_handle)
+            return st
+
+        def create_Activating(self, state_name):
+            st = self.reuse(LayerB.Send_And_Check, state_name)
+            st.enter(state_name, "ON", response_ok, self.com_handle, 0)
+            return st
+
+        def create_Error(self, state_name):
+            st = self.reuse(pyState.State_Base, state_name)
+            st.enter(state_name)
+            return st
+
+    tab = [
+        ["Configuration",           "next",         "Deactivated"],
+        ["Configuration",           "error",        "Error"],
+        ["Deactivated",             "pump_on",      "Activating"],
+        ["Deactivated",             "error",        "Error"],
+        ["Activating",              "next",         "Activated"],
+        ["Activating",              "error",        "Error"],
+        ["Activated",               "pump_off",     "Deactivating"],
+        ["Activated",               "error",        "Error"],
+        ["Deactivating",            "next",         "Deactivated"],
+        ["Deactivating",            "error",        "Error"],
+        ]
 
     def __init__(self, name, settings, calibration_func, com_handle):
         self.name = name
-        self.tab = [
-            ["Configuration",           "next",         "Deactivated"],
-            ["Configuration",           "error",        "Error"],
-            ["Deactivated",             "pump_on",      "Activating"],
-            ["Deactivated",             "error",        "Error"],
-            ["Activating",              "next",         "Activated"],
-            ["Activating",              "error",        "Error"],
-            ["Activated",               "pump_off",     "Deactivating"],
-            ["Activated",               "error",        "Error"],
-            ["Deactivating",            "next",         "Deactivated"],
-            ["Deactivating",            "error",        "Error"],
-            ]
+        self.com_handle = com_handle
+        Metrics.register_device(com_handle, name)
         self.calibration_func = calibration_func
         self.target_flowrate = [0]
         self.set_flowrate = [float("nan")]
@@ -599,7 +626,7 @@ class Driver:
         self.target_pump_state = False
 
         self.fac = Driver.factory(settings, self.target_flowrate, self.set_flowrate, com_handle)
-        self.en = pyState.Engine(self.tab, self.fac, "Configuration")
+        self.en = pyState.Engine(self.tab, self.fac, "Configuration", path=name)
         self.en.enter()
 
     def tick(self):
@@ -625,6 +652,12 @@ class Driver:
     def get_name(self):
         return self.name
 
+    def get_com_handle(self):
+        return self.com_handle
+
+    def get_wakeup(self):
+        return self.en.get_wakeup()
+
     # In the following, the functions are defined to obtain the settings for the HPLC pump (from outside).
     def set_target_flowrate(self, val):
         self.target_flowrate[0] = round(self.calibration_func.forward(val))
@@ -6,9 +6,10 @@
 
 # library/modules from python:
 import time
-import re
 
 # own scripts:
+import automat.Metrics as Metrics
+import automat.Protocol as Protocol
 import automat.pyState as pyState
 import automat.LayerB as LayerB
 
@@ -36,6 +37,7 @@ class dummy_cmd_handle:
         return bytearray(self.resp.encode("ASCII"))
 
 # generation of the commands that will later be sent to the pump:
+# The frames are built and cached by the codec (Protocol).
 class build_set_msg:
     """This class builds the command with the checksum for setting a flow rate."""
     def __init__(self, address, ddd):
@@ -43,12 +45,7 @@ class build_set_msg:
         self.ddd = ddd
 
     def __call__(self):
-        mm = 1
-        step1 = "#{:02d}{:02d}r{:03.0f}".format(self.address, mm, self.ddd)
-        qs = sum(bytearray(step1.encode("ASCII"))) & 0xFF
-        msg = "{}{:02X}".format(step1, qs)
-        
-        return msg
+        return Protocol.lambda_set_frame(self.address, self.ddd)
 
 class build_read_msg:
     """This class builds the command with the checksum for the query which flow rate is set."""
@@ -56,72 +53,66 @@ class build_read_msg:
         self.address = address
 
     def __call__(self):
-        mm = 1
-        step1 = "#{:02d}{:02d}G".format(self.address, mm)
-        qs = sum(bytearray(step1.encode("ASCII"))) & 0xFF
-        msg = "{}{:02X}".format(step1, qs)
-        
-        return msg
+        return Protocol.lambda_read_frame(self.address)
 
 # response checker:
 class check_response:
-    """This class compares the received answer "ans" with the expected answer "resp"."""
+    """This class compares the received answer "ans" with the expected answer "resp", a one-element list that is read when the answer is checked."""
     def __init__(self, resp):
         self.resp = resp
 
     def __call__(self, ans):
-        # step 1: find pattern
-        answer = ans.decode("ASCII")
-        find_pattern = re.compile(r"<\d{4}(\w{1})(\d{3})\S*")
-        if not find_pattern.match(answer) is None:
-            lrinfo = find_pattern.match(answer).group(1)
-            ddd = int(find_pattern.match(answer).group(2))
-        else:
+        # step 1: parse the answer
+        resp = Protocol.parse_lambda(ans)
+        if resp is None:
             return False
 
-        # step 2: compare pattern
-        if ddd == self.resp and lrinfo == "r":
+        # step 2: compare the value
+        if resp.value == self.resp[0] and resp.mode == b"r":
             return True
         else:
             return False
 
+# the pump is switched off when it answers 0
+response_0 = check_response([0])
+
 # layer (A) states:
 class Deactivating(pyState.State_Base):
     """This state deactivates the Lambda pump and checks whether the shutdown has worked."""
-    class factory:
-        def __init__(self, address, com_handle):
+    class factory(pyState.Factory_Base):
+        def arm(self, address, com_handle):
             self.address = address
             self.com_handle = com_handle
 
-        def create_state(self, state_name):
-            if state_name == "Pump_Off":
-                st = LayerB.Send()
-                st.enter(state_name, build_set_msg(self.address, 0)(), self.com_handle, "next")
-                return st
-            elif state_name == "Check_Pump_State":
-                st = LayerB.Send_And_Check()
-                st.enter(state_name, build_read_msg(self.address)(), check_response(0), self.com_handle, 0)
-                return st
-            elif state_name == "Finished":
-                st = pyState.State_Base()
-                st.enter(state_name)
-                return st
-            elif state_name == "Error":
-                st = pyState.State_Base()
-                st.enter(state_name)
-                return st
-            raise Exception("Unhandled State in Factory")
+        def create_Pump_Off(self, state_name):
+            st = self.reuse(LayerB.Send, state_name)
+            st.enter(state_name, build_set_msg(self.address, 0)(), self.com_handle, "next")
+            return st
+
+        def create_Check_Pump_State(self, state_name):
+            st = self.reuse(LayerB.Send_And_Check, state_name)
+            st.enter(state_name, build_read_msg(self.address)(), response_0, self.com_handle, 0)
+            return st
+
+        def create_Finished(self, state_name):
+            st = self.reuse(pyState.State_Base, state_name)
+            st.enter(state_name)
+            return st
+
+        def create_Error(self, state_name):
+            st = self.reuse(pyState.State_Base, state_name)
+            st.enter(state_name)
+            return st
+
+    tab = [
+        ["Pump_Off",           "next",     "Check_Pump_State"],
+        ["Check_Pump_State",   "next",     "Finished"],
+        ["Check_Pump_State",   "error",    "Error"],
+        ]
 
     def enter(self, name, address, com_handle):
         super().enter(name)
-        self.tab = [
-            ["Pump_Off",           "next",     "Check_Pump_State"],
-            ["Check_Pump_State",   "next",     "Finished"],
-            ["Check_Pump_State",   "error",    "Error"],
-            ]
-        self.fac = Deactivating.factory(address, com_handle)
-        self.en = pyState.Engine(self.tab, self.fac, "Pump_Off")
-        self.en.enter()
+        self.enter_engine(Deactivating.factory, "Pump_Off", address, com_handle)
 
     def __call__(self):
         self.en.tick()
@@ -137,37 +128,36 @@ class Deactivating(pyState.State_Base):
 
 class Deactivated(pyState.State_Base):
     """This state checks whether the Lambda pump is still switched off and waits whether the pump should be switched on again."""
-    class factory:
-        def __init__(self, address, com_handle):
+    class factory(pyState.Factory_Base):
+        def arm(self, address, com_handle):
             self.address = address
             self.com_handle = com_handle
 
-        def create_state(self, state_name):
-            if state_name == "Check_Pump_State":
-                st = LayerB.Send_And_Check()
-                st.enter(state_name, build_read_msg(self.address)(), check_response(0), self.com_handle, 0)
-                return st
-            elif state_name == "Waiting":
-                st = LayerB.Delay_State()
-                st.enter(state_name, 500, "next")
-                return st
-            elif state_name == "Error":
-                st = pyState.State_Base()
-                st.enter(state_name)
-                return st
-            raise Exception("Unhandled State in Factory")
+        def create_Check_Pump_State(self, state_name):
+            st = self.reuse(LayerB.Send_And_Check, state_name)
+            st.enter(state_name, build_read_msg(self.address)(), response_0, self.com_handle, 0)
+            return st
+
+        def create_Waiting(self, state_name):
+            st = self.reuse(LayerB.Delay_State, state_name)
+            st.enter(state_name, 500, "next")
+            return st
+
+        def create_Error(self, state_name):
+            st = self.reuse(pyState.State_Base, state_name)
+            st.enter(state_name)
+            return st
+
+    tab = [
+        ["Check_Pump_State",  "next",   "Waiting"],
+        ["Check_Pump_State",  "error",  "Error"],
+        ["Waiting",           "next",   "Check_Pump_State"],
+        ]
 
     def enter(self, name, address, com_handle):
         super().enter(name)
         self.pump_on_flag = False
-        self.tab = [
-            ["Check_Pump_State",  "next",   "Waiting"],
-            ["Check_Pump_State",  "error",  "Error"],
-            ["Waiting",           "next",   "Check_Pump_State"],
-            ]
-        self.fac = Deactivated.factory(address, com_handle)
-        self.en = pyState.Engine(self.tab, self.fac, "Check_Pump_State")
-        self.en.enter()
+        self.enter_engine(Deactivated.factory, "Check_Pump_State", address, com_handle)
 
     def __call__(self):
         self.en.tick()
@@ -193,42 +183,43 @@ class Deactivated(pyState.State_Base):
 
 class Activating(pyState.State_Base):
     """This state activates the Lambda pump and checks whether the switch-on has worked."""
-    class factory:
-        def __init__(self, set_flowrate, address, com_handle):
+    class factory(pyState.Factory_Base):
+        def arm(self, set_flowrate, address, com_handle):
             self.flow = set_flowrate
             self.address = address
             self.com_handle = com_handle
-
-        def create_state(self, state_name):
-            if state_name == "Pump_On":
-                st = LayerB.Send()
-                st.enter(state_name, build_set_msg(self.address, self.flow[0])(), self.com_handle, "next")
-                return st
-            elif state_name == "Check_Pump_State":
-                st = LayerB.Send_And_Check()
-                st.enter(state_name, build_read_msg(self.address)(), check_response(self.flow[0]), self.com_handle, 0)
-                return st
-            elif state_name == "Finished":
-                st = pyState.State_Base()
-                st.enter(state_name)
-                return st
-            elif state_name == "Error":
-                st = pyState.State_Base()
-                st.enter(state_name)
-                return st
-            raise Exception("Unhandled State in Factory")
+            self.flow_checker = check_response(set_flowrate)
+
+        def create_Pump_On(self, state_name):
+            st = self.reuse(LayerB.Send, state_name)
+            st.enter(state_name, build_set_msg(self.address, self.flow[0])(), self.com_handle, "next")
+            return st
+
+        def create_Check_Pump_State(self, state_name):
+            st = self.reuse(LayerB.Send_And_Check, state_name)
+            st.enter(state_name, build_read_msg(self.address)(), self.flow_checker, self.com_handle, 0)
+            return st
+
+        def create_Finished(self, state_name):
+            st = self.reuse(pyState.State_Base, state_name)
+            st.enter(state_name)
+            return st
+
+        def create_Error(self, state_name):
+            st = self.reuse(pyState.State_Base, state_name)
+            st.enter(state_name)
+            return st
+
+    tab = [
+        ["Pump_On",            "next",     "Check_Pump_State"],
+        ["Check_Pump_State",   "next",     "Finished"],
+        ["Check_Pump_State",   "error",    "Error"],
+        ]
 
     def enter(self, name, target_flowrate, set_flowrate, address, com_handle):
         super().enter(name)
-        self.tab = [
-            ["Pump_On",            "next",     "Check_Pump_State"],
-            ["Check_Pump_State",   "next",     "Finished"],
-            ["Check_Pump_State",   "error",    "Error"],
-            ]
         set_flowrate[0] = target_flowrate[0]
-        self.fac = Activating.factory(set_flowrate, address, com_handle)
-        self.en = pyState.Engine(self.tab, self.fac, "Pump_On")
-        self.en.enter()
+        self.enter_engine(Activating.factory, "Pump_On", set_flowrate, address, com_handle)
 
     def __call__(self):
         self.en.tick()
@@ -244,30 +235,40 @@ class Activating(pyState.State_Base):
 
 class Activated(pyState.State_Base):
     """This state checks whether the Lambda pump is still running at the correct flow rate and whether anything has changed in the settings and adjusts them if necessary."""
-    class factory:
-        def __init__(self, set_flowrate, address, com_handle):
+    class factory(pyState.Factory_Base):
+        def arm(self, set_flowrate, address, com_handle):
             self.flow = set_flowrate
             self.address = address
             self.com_handle = com_handle
-
-        def create_state(self, state_name):
-            if state_name == "Check_Pump_State":
-                st = LayerB.Send_And_Check()
-                st.enter(state_name, build_read_msg(self.address)(), check_response(self.flow[0]), self.com_handle, 0)
-                return st
-            elif state_name == "Waiting":
-                st = LayerB.Delay_State()
-                st.enter(state_name, 500, "next")
-                return st
-            elif state_name == "Set_Flowrate":
-                st = LayerB.Send()
-                st.enter(state_name, build_set_msg(self.address, self.flow[0])(), self.com_handle, "next")
-                return st
-            elif state_name == "Error":
-                st = pyState.State_Base()
-                st.enter(state_name)
-                return st
-            raise Exception("Unhandled State in Factory")
+            self.flow_checker = check_response(set_flowrate)
+
+        def create_Check_Pump_State(self, state_name):
+            st = self.reuse(LayerB.Send_And_Check, state_name)
+            st.enter(state_name, build_read_msg(self.address)(), self.flow_checker, self.com_handle, 0)
+            return st
+
+        def create_Waiting(self, state_name):
+            st = self.reuse(LayerB.Delay_State, state_name)
+            st.enter(state_name, 500, "next")
+            return st
+
+        def create_Set_Flowrate(self, state_name):
+            st = self.reuse(LayerB.Send, state_name)
+            st.enter(state_name, build_set_msg(self.address, self.flow[0])(), self.com_handle, "next")
+            return st
+
+        def create_Error(self, state_name):
+            st = self.reuse(pyState.State_Base, state_name)
+            st.enter(state_name)
+            return st
+
+    tab = [
+        ["Check_Pump_State",    "next",         "Waiting"],
+        ["Check_Pump_State",    "error",        "Error"],
+        ["Waiting",             "next",         "Check_Pump_State"],
+        ["Waiting",             "new_flowrate", "Set_Flowrate"],
+        ["Set_Flowrate",        "next",         "Check_Pump_State"],
+        ]
 
     def enter(self, name, target_flowrate, set_flowrate, address, com_handle):
         super().enter(name)
@@ -275,16 +276,7 @@ class Activated(pyState.State_Base):
         self.set_flowrate = set_flowrate
         self.pump_off_flag = False
 
-        self.tab = [
-            ["Check_Pump_State",    "next",         "Waiting"],
-            ["Check_Pump_State",    "error",        "Error"],
-            ["Waiting",             "next",         "Check_Pump_State"],
-            ["Waiting",             "new_flowrate", "Set_Flowrate"],
-            ["Set_Flowrate",        "next",         "Check_Pump_State"],
-            ]
-        self.fac = Activated.factory(set_flowrate, address, com_handle)
-        self.en = pyState.Engine(self.tab, self.fac, "Check_Pump_State")
-        self.en.enter()
+        self.enter_engine(Activated.factory, "Check_Pump_State", set_flowrate, address, com_handle)
 
     def __call__(self):
         self.en.tick()
@@ -315,48 +307,53 @@ class Activated(pyState.State_Base):
 # driver class for the Lambda pump:
 class Driver:
     
-    class factory:
+    class factory(pyState.Factory_Base):
         def __init__(self, address, target_flowrate, set_flowrate, com_handle):
             self.address = address
             self.target_flowrate = target_flowrate
             self.set_flowrate = set_flowrate
             self.com_handle = com_handle
 
-        def create_state(self, state_name):
-            if state_name == "Deactivating":
-                st = Deactivating()
-                st.enter(state_name, self.address, self.com_handle)
-                return st
-            elif state_name == "Deactivated":
-                st = Deactivated()
-                st.enter(state_name, self.address, self.com_handle)
-                return st
-            elif state_name == "Activated":
-                st = Activated()
-                st.enter(state_name, self.target_flowrate, self.set_flowrate, self.address, self.com_handle)
-                return st
-            elif state_name == "Activating":
-                st = Activating()
-                st.enter(state_name, self.target_flowrate, self.set_flowrate, self.address, self.com_handle)
-                return st
-            elif state_name == "Error":
-                st = pyState.State_Base()
-                st.enter(state_name)
-                return st
-            raise Exception("Unhandled State in Factory")
+        def create_Deactivating(self, state_name):
+            st = self.reuse(Deactivating, state_name)
+            st.enter(state_name, self.address, self.com_handle)
+            return st
+
+        def create_Deactivated(self, state_name):
+            st = self.reuse(Deactivated, state_name)
+            st.enter(state_name, self.address, self.com_handle)
+            return st
+
+        def create_Activated(self, state_name):
+            st = self.reuse(Activated, state_name)
+            st.enter(state_name, self.target_flowrate, self.set_flowrate, self.address, self.com_handle)
+            return st
+
+        def create_Activating(self, state_name):
+            st = self.reuse(Activating, state_name)
+            st.enter(state_name, self.target_flowrate, self.set_flowrate, self.address, self.com_handle)
+            return st
+
+        def create_Error(self, state_name):
+            st = self.reuse(pyState.State_Base, state_name)
+            st.enter(state_name)
+            return st
+
+    tab = [
+        ["Deactivating",            "next",     "Deactivated"],
+        ["Deactivating",            "error",    "Error"],
+        ["Deactivated",             "pump_on",  "Activating"],
+        ["Deactivated",             "error",    "Error"],
+        ["Activating",              "next",     "Activated"],
+        ["Activating",              "error",    "Error"],
+        ["Activated",               "pump_off", "Deactivating"],
+        ["Activated",               "error",    "Error"],
+        ]
 
     def __init__(self, name, address, calibration_func, com_handle):
         self.name = name
-        self.tab = [
-            ["Deactivating",            "next",     "Deactivated"],
-            ["Deactivating",            "error",    "Error"],
-            ["Deactivated",             "pump_on",  "Activating"],
-            ["Deactivated",             "error",    "Error"],
-            ["Activating",              "next",     "Activated"],
-            ["Activating",              "error",    "Error"],
-            ["Activated",               "pump_off", "Deactivating"],
-            ["Activated",               "error",    "Error"],
-            ]
+        self.com_handle = com_handle
+        Metrics.register_device(com_handle, name)
         self.calibration_func = calibration_func
         self.target_flowrate = [0]
         self.set_flowrate = [-1]
@@ -364,7 +361,7 @@ class Driver:
         self.target_pump_state = False
 
         self.fac = Driver.factory(address, self.target_flowrate, self.set_flowrate, com_handle)
-        self.en = pyState.Engine(self.tab, self.fac, "Deactivating")
+        self.en = pyState.Engine(self.tab, self.fac, "Deactivating", path=name)
         self.en.enter()
 
     def tick(self):
@@ -387,6 +384,12 @@ class Driver:
     def get_name(self):
         return self.name
 
+    def get_com_handle(self):
+        return self.com_handle
+
+    def get_wakeup(self):
+        return self.en.get_wakeup()
+
     # In the following, the functions are defined to obtain the settings for the Lambda pump (from outside).
     def set_target_flowrate(self, val):
         self.target_flowrate[0] = round(self.calibration_func.forward(val))
@@ -3,62 +3,87 @@
 # possible states on the middle (second) layer (B). Higher layers (A) 
 # can be built from these classes.
 
-# library/modules from python:
-import time
-
 # own scripts:
+import automat.Clock as Clock
+import automat.Metrics as Metrics
+import automat.Protocol as Protocol
 import automat.pyState as pyState
 import automat.LayerC as LayerC
 
 class Send_And_Check(pyState.State_Base):
     """This state combines the substates sending a command, waiting for the response and checking the response."""
-    class factory:
-        def __init__(self, msg, checker, com_handle, retry_count):
+    class factory(pyState.Factory_Base):
+        def arm(self, msg, checker, com_handle, retry_count):
             self.msg = msg
             self.checker = checker
             self.com_handle = com_handle
             self.retry_count = [retry_count]
 
-        def create_state(self, state_name):
-            if state_name == "Send":
-                st = LayerC.Send_Command()
-                st.enter(state_name, self.msg, self.com_handle, "next")
-                return st
-            elif state_name == "Check":
-                st = LayerC.Wait_For_Answer()
-                st.enter(state_name, 1000, self.com_handle, self.checker, "next", "timeout", self.retry_count, "retry", "error")
-                return st
-            elif state_name == "Finished":
-                st = pyState.State_Base()
-                st.enter(state_name)
-                return st
-            elif state_name == "Error":
-                st = pyState.State_Base()
-                st.enter(state_name)
-                return st
-            raise Exception("Unhandled State in Factory")
+        def create_Send(self, state_name):
+            st = self.reuse(LayerC.Send_Command, state_name)
+            st.enter(state_name, self.msg, self.com_handle, "next")
+            return st
+
+        def create_Check(self, state_name):
+            st = self.reuse(LayerC.Wait_For_Answer, state_name)
+            st.enter(state_name, 1000, self.com_handle, self.checker, "next", "timeout", self.retry_count, "retry", "error")
+            return st
+
+        def create_Finished(self, state_name):
+            st = self.reuse(pyState.State_Base, state_name)
+            st.enter(state_name)
+            return st
+
+        create_Timeout = create_Finished
+        create_Error = create_Finished
+
+    tab = [
+        ["Send",  "next",    "Check"],
+        ["Check", "next",    "Finished"],
+        ["Check", "retry",   "Send"],
+        ["Check", "timeout", "Timeout"],
+        ["Check", "error",   "Error"],
+        ]
 
     def enter(self, name, msg, checker, com_handle, retry_count):
         super().enter(name)
-        self.tab = [
-            ["Send",  "next",    "Check"],
-            ["Check", "next",    "Finished"],
-            ["Check", "retry",   "Send"],
-            ["Check", "timeout", "Error"],
-            ["Check", "error",   "Error"],
-            ]
-        self.fac = Send_And_Check.factory(msg, checker, com_handle, retry_count)
-        self.en = pyState.Engine(self.tab, self.fac, "Send")
-        self.en.enter()
+        # for the metrics: start of the transaction and the retries it was armed with
+        self.start = None
+        self.retry_count = retry_count
+        self.recorded = False
+        self.enter_engine(Send_And_Check.factory, "Send", msg, checker, com_handle, retry_count)
 
     def __call__(self):
+        if Metrics.enabled and self.start is None:
+            self.start = Clock.now_ns()
         self.en.tick()
 
         if self.en.get_state() == "Finished":
+            if Metrics.enabled:
+                self.record()
             return "next"
-        if self.en.get_state() == "Error":
+        if self.en.get_state() == "Timeout" or self.en.get_state() == "Error":
+            if Metrics.enabled:
+                self.record()
             return "error"
 
+    def record(self):
+        """This function records the round trip of a finished transaction and the retries, timeouts and errors (see Metrics)."""
+        if self.recorded:
+            return
+        self.recorded = True
+        device = Metrics.get_device(self.fac.com_handle)
+        command = Protocol.command_name(self.fac.msg)
+        retries = self.retry_count - self.fac.retry_count[0]
+        if self.en.get_state() == "Finished":
+            if self.start is not None:
+                Metrics.record_round_trip(device, command, Clock.now_ns() - self.start)
+            Metrics.count_transaction(device, command, retries=retries)
+        elif self.en.get_state() == "Timeout":
+            Metrics.count_transaction(device, command, retries=retries, timeouts=1)
+        else:
+            Metrics.count_transaction(device, command, retries=retries, errors=1)
+
     def exit(self):
         self.en.exit()
         super().exit()
@@ -67,14 +92,17 @@ class Delay_State(pyState.State_Base):
     """This state waits for the given time."""
     def enter(self, name, delay_time_ms, next_event):
         super().enter(name)
-        self.deadline = time.monotonic_ns() + delay_time_ms * 1000000
+        self.deadline = Clock.now_ns() + delay_time_ms * 1000000
         self.next_event = next_event
     
     def __call__(self):
-        if time.monotonic_ns() > self.deadline:
+        if Clock.now_ns() > self.deadline:
             return self.next_event
         return None
 
+    def get_wakeup(self):
+        return self.deadline
+
 # Special case for the Lambda pump: In case no response is expected to 
 # a sent command, Send_And_Check cannot be used on layer (B), instead 
 # Send_Command from layer (C) is used.
@@ -3,17 +3,16 @@
 # possible states on the lowest (third) layer (C). Higher layers (A) 
 # and (B) can be built from these classes.
 
-# library/modules from python:
-import time 
-
 # own scripts:
+import automat.Clock as Clock
+import automat.Protocol as Protocol
 import automat.pyState as pyState
 
 class Send_Command(pyState.State_Base):
     """This state sends a command to a device."""
     def enter(self, name, msg, com_handle, next_event):
         super().enter(name)
-        self.msg = bytearray((msg + "\r").encode("ASCII"))
+        self.msg = Protocol.encode_command(msg)
         self.com_handle = com_handle
         self.next_event = next_event
 
@@ -27,7 +26,7 @@ class Wait_For_Answer(pyState.State_Base):
     def enter(self, name, timeout_ms, com_handle, response_checker, next_event, timeout_event, retry_count, retry_event, error_event):
         super().enter(name)
         self.com_handle = com_handle
-        self.deadline = time.monotonic_ns() + timeout_ms * 1000000
+        self.deadline = Clock.now_ns() + timeout_ms * 1000000
         
         self.response_checker = response_checker
         
@@ -40,10 +39,9 @@ class Wait_For_Answer(pyState.State_Base):
         self.response = bytearray()
 
     def __call__(self):
-        end_of_frame = '\r'.encode("ASCII")
         tmp = self.com_handle.receive()
         for chr in tmp:
-            if chr == end_of_frame[0]:
+            if chr == Protocol.end_of_frame[0]:
                 if self.response_checker(self.response):
                     return self.next_event
                 if self.retry_count[0] > 0:
@@ -53,8 +51,11 @@ class Wait_For_Answer(pyState.State_Base):
                 return self.error_event
             self.response.append(chr)
 
-        if time.monotonic_ns() > self.deadline:
+        if Clock.now_ns() > self.deadline:
             return self.timeout_event
         return None
 
+    def get_wakeup(self):
+        return self.deadline
+
         
\ No newline at end of file
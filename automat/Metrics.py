@@ -0,0 +1,221 @@
+# This file contains the instrumentation of the hot paths. If it is
+# enabled in the dictionary, the engines record how long each tick of a
+# state takes, Send_And_Check records the round trip of every
+# transaction per device and command together with its retries and
+# timeouts, and the calorimeter driver reports the received and the
+# malformed lines. The latencies are collected in histograms with fixed
+# buckets, so that recording a value stays cheap. While a runner is active,
+# the reporter writes the metrics periodically into a text file and
+# serves the same text on a local HTTP endpoint.
+
+# library/modules from python:
+import bisect
+import http.server
+import threading
+import time
+import weakref
+
+# own scripts:
+import automat.Dictionary as Dictionary
+
+enabled = Dictionary.metrics["enabled"]
+
+# upper bounds of the buckets: 1 µs to about 8 s, doubled from bucket to bucket
+bucket_bounds_ns = [1000 * 2**idx for idx in range(24)]
+
+class Histogram:
+    """This class counts values in buckets with fixed bounds and keeps their sum and maximum. Quantiles are given as the upper bound of the bucket that contains them."""
+    def __init__(self):
+        self.counts = [0] * (len(bucket_bounds_ns) + 1)
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def add(self, value_ns):
+        self.counts[bisect.bisect_left(bucket_bounds_ns, value_ns)] += 1
+        self.count += 1
+        self.sum += value_ns
+        if value_ns > self.max:
+            self.max = value_ns
+
+    def get_mean(self):
+        if self.count == 0:
+            return 0
+        return self.sum / self.count
+
+    def get_quantile(self, q):
+        limit = q * self.count
+        total = 0
+        for idx in range(len(self.counts)):
+            total += self.counts[idx]
+            if total >= limit and total > 0:
+                if idx == len(bucket_bounds_ns):
+                    return self.max
+                return min(bucket_bounds_ns[idx], self.max)
+        return 0
+
+# recorded values, they are changed by several threads (see Driver_Worker)
+lock = threading.Lock()
+tick_latency = {}           # state name: Histogram
+round_trip = {}             # (device, command): Histogram
+transaction_counts = {}     # (device, command): [retries, timeouts, errors]
+counters = {}               # (device, counter): value
+
+# names of the devices by their communication handle
+device_names = weakref.WeakKeyDictionary()
+
+def enable(flag = True):
+    global enabled
+    enabled = flag
+
+def reset():
+    with lock:
+        tick_latency.clear()
+        round_trip.clear()
+        transaction_counts.clear()
+        counters.clear()
+
+def register_device(com_handle, name):
+    """This function gives the handle of a device the name under which its transactions are recorded."""
+    try:
+        device_names[com_handle] = name
+    except TypeError:
+        pass
+
+def get_device(com_handle):
+    try:
+        return device_names.get(com_handle, "unknown")
+    except TypeError:
+        return "unknown"
+
+# In the following, the functions are defined which are called on the hot paths, but only if the metrics are enabled.
+def record_tick(state_name, duration_ns):
+    with lock:
+        hist = tick_latency.get(state_name)
+        if hist is None:
+            hist = tick_latency[state_name] = Histogram()
+        hist.add(duration_ns)
+
+def record_round_trip(device, command, duration_ns):
+    with lock:
+        hist = round_trip.get((device, command))
+        if hist is None:
+            hist = round_trip[(device, command)] = Histogram()
+        hist.add(duration_ns)
+
+def count_transaction(device, command, retries = 0, timeouts = 0, errors = 0):
+    with lock:
+        tmp = transaction_counts.get((device, command))
+        if tmp is None:
+            tmp = transaction_counts[(device, command)] = [0, 0, 0]
+        tmp[0] += retries
+        tmp[1] += timeouts
+        tmp[2] += errors
+
+def count(device, counter, num = 1):
+    with lock:
+        counters[(device, counter)] = counters.get((device, counter), 0) + num
+
+def set_count(device, counter, value):
+    with lock:
+        counters[(device, counter)] = value
+
+# report:
+def report(rates = None):
+    """This function returns all metrics as text. The rates of the counters (per second) are given by the reporter."""
+    if rates is None:
+        rates = {}
+    lines = []
+    with lock:
+        lines.append("# tick latency per state [us]")
+        lines.append("state\tcount\tmean\tp50\tp99\tmax")
+        for name in sorted(tick_latency):
+            hist = tick_latency[name]
+            lines.append("{}\t{:d}\t{:.1f}\t{:.1f}\t{:.1f}\t{:.1f}".format(name, hist.count, hist.get_mean() / 1E3, hist.get_quantile(0.5) / 1E3, hist.get_quantile(0.99) / 1E3, hist.max / 1E3))
+
+        lines.append("")
+        lines.append("# round trip per device and command [ms]")
+        lines.append("device\tcommand\tcount\tmean\tp50\tp99\tmax\tretries\ttimeouts\terrors")
+        for key in sorted(set(round_trip) | set(transaction_counts)):
+            hist = round_trip.get(key, Histogram())
+            retries, timeouts, errors = transaction_counts.get(key, [0, 0, 0])
+            lines.append("{}\t{}\t{:d}\t{:.2f}\t{:.2f}\t{:.2f}\t{:.2f}\t{:d}\t{:d}\t{:d}".format(key[0], key[1], hist.count, hist.get_mean() / 1E6, hist.get_quantile(0.5) / 1E6, hist.get_quantile(0.99) / 1E6, hist.max / 1E6, retries, timeouts, errors))
+
+        lines.append("")
+        lines.append("# counters")
+        lines.append("device\tcounter\tvalue\trate [1/s]")
+        for device, counter in sorted(counters):
+            lines.append("{}\t{}\t{:d}\t{:.2f}".format(device, counter, counters[(device, counter)], rates.get((device, counter), 0.0)))
+    return "\n".join(lines) + "\n"
+
+class Reporter:
+    """This class writes the report into a file every interval and serves it on a local HTTP endpoint (GET on any path)."""
+    def __init__(self, file_name, interval_s, http_port = None):
+        self.path = "Calorimetry\{0}.txt".format(file_name)
+        self.interval_s = interval_s
+        self.rates = {}
+        self.last_counters = {}
+        self.last_time = time.monotonic()
+
+        self.stop_request = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="Metrics_Reporter", daemon=True)
+        self.thread.start()
+
+        self.server = None
+        if http_port is not None:
+            reporter = self
+
+            class handler(http.server.BaseHTTPRequestHandler):
+                def do_GET(self):
+                    body = report(reporter.rates).encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; charset=utf-8")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, format, *args):
+                    return
+
+            self.server = http.server.ThreadingHTTPServer(("127.0.0.1", http_port), handler)
+            self.server_thread = threading.Thread(target=self.server.serve_forever, name="Metrics_HTTP", daemon=True)
+            self.server_thread.start()
+
+    def get_url(self):
+        if self.server is None:
+            return None
+        return "http://127.0.0.1:{}/".format(self.server.server_address[1])
+
+    def update_rates(self):
+        now = time.monotonic()
+        with lock:
+            current = dict(counters)
+        duration = max(now - self.last_time, 1E-9)
+        self.rates = {key: (value - self.last_counters.get(key, 0)) / duration for key, value in current.items()}
+        self.last_counters = current
+        self.last_time = now
+
+    def write(self):
+        self.update_rates()
+        with open(self.path, "w") as fout:
+            fout.write(report(self.rates))
+
+    def run(self):
+        while not self.stop_request.wait(self.interval_s):
+            self.write()
+
+    def stop(self):
+        """This function stops the reporter and writes the file a last time."""
+        self.stop_request.set()
+        self.thread.join()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        self.write()
+
+def start_reporter():
+    """This function starts the reporter with the settings of the dictionary, or returns None if the metrics are not enabled."""
+    if not enabled:
+        return None
+    settings = Dictionary.metrics
+    return Reporter(settings["file_name"], settings["interval_s"], settings["http_port"])
@@ -1,3 +1,4 @@
+import asyncio
 import Auto
 import Strategy_OPL
 
@@ -20,11 +21,6 @@ strategy = Strategy_OPL.Operation_Point_List(operation_point_list)
 # Setting up the automatization
 automat = Auto.matization(strategy, User_Pumps, User_Fisher, Portname_Calorimeter)
 
-# Automatization is called until the end state is reached
-while(True):
-    automat.tick()
-    if automat.get_state() == "Finished":
-        break
-    if automat.get_state() == "Error_Thermostat" or automat.get_state() == "Error_Pump" or automat.get_state() == "Error_Calorimeter" or automat.get_state() == "Error":
-        break
+# Automatization is run in an event loop until the end state is reached
+asyncio.run(Auto.run_async(automat))
 print("Done")
@@ -0,0 +1,86 @@
+# This file contains the codecs of the serial protocols of the HPLC
+# pump, the Lambda pump and the Fisher thermostat. The patterns are
+# compiled once and applied to the received bytes directly, so that
+# the responses are not decoded first. The frames that are sent are
+# built once and cached, because the drivers send the same few
+# commands over and over again. The parsers return typed responses
+# (or None if the answer does not fit the protocol) instead of
+# strings, which the response checkers of the drivers compare.
+
+# library/modules from python:
+import collections
+import functools
+import re
+
+# frames of all devices:
+end_of_frame = b"\r"
+
+@functools.lru_cache(maxsize=256)
+def encode_command(msg):
+    """This function returns the bytes of a command including the end of frame."""
+    return (msg + "\r").encode("ASCII")
+
+@functools.lru_cache(maxsize=256)
+def command_name(msg):
+    """This function returns the name under which a command is counted: the key of settings like "FLOW: 06000" or "SS 25.0", the mode of the Lambda frames ("r" or "G") and the whole command for queries like "FLOW?" or "RO"."""
+    if msg.startswith("#"):
+        return msg[5:6]
+    for sep in [":", " "]:
+        if sep in msg:
+            return msg.split(sep, 1)[0]
+    return msg
+
+# HPLC pump: commands and responses look like "FLOW: 06000" and "FLOW:OK"
+HPLC_Response = collections.namedtuple("HPLC_Response", ["key", "value"])
+
+hplc_pattern = re.compile(rb"(\w*):(.*)")
+
+def parse_hplc(ans):
+    tmp = hplc_pattern.match(ans)
+    if tmp is None:
+        return None
+    return HPLC_Response(tmp.group(1), tmp.group(2))
+
+# Lambda pump: commands and responses look like "#0201r123EE" and "<0102r1232D",
+# the last two characters are the checksum in hexadecimal
+Lambda_Response = collections.namedtuple("Lambda_Response", ["mode", "value"])
+
+lambda_pattern = re.compile(rb"<\d{4}(\w)(\d{3})\S*")
+
+def lambda_checksum(frame):
+    return sum(frame.encode("ASCII")) & 0xFF
+
+@functools.lru_cache(maxsize=1024)
+def lambda_set_frame(address, ddd):
+    """This function returns the command for setting a flow rate (ddd in per mille of the maximum flow rate)."""
+    mm = 1
+    step1 = "#{:02d}{:02d}r{:03.0f}".format(address, mm, ddd)
+    return "{}{:02X}".format(step1, lambda_checksum(step1))
+
+@functools.lru_cache(maxsize=16)
+def lambda_read_frame(address):
+    """This function returns the command for the query which flow rate is set."""
+    mm = 1
+    step1 = "#{:02d}{:02d}G".format(address, mm)
+    return "{}{:02X}".format(step1, lambda_checksum(step1))
+
+def parse_lambda(ans):
+    tmp = lambda_pattern.match(ans)
+    if tmp is None:
+        return None
+    return Lambda_Response(tmp.group(1), int(tmp.group(2)))
+
+# Fisher thermostat: the responses are plain values like "1", "OK" or "25.0C"
+Fisher_Temp = collections.namedtuple("Fisher_Temp", ["value", "unit"])
+
+fisher_temp_pattern = re.compile(rb"([\d\.]*)(C)")
+
+def parse_fisher_temp(ans):
+    tmp = fisher_temp_pattern.match(ans)
+    if tmp is None:
+        return None
+    try:
+        value = float(tmp.group(1))
+    except ValueError:
+        return None
+    return Fisher_Temp(value, tmp.group(2))
@@ -0,0 +1,141 @@
+# This file contains the store for the raw data of the calorimeter. The
+# lines are collected in chunks of a fixed number of rows with one
+# float column per channel. Each chunk is written as a .npy file into
+# the store directory and listed in a small index file. The chunks are
+# read back via memory mapping, so that the raw data of long runs never
+# has to be kept in memory completely.
+
+# library/modules from python:
+import os
+import threading
+import numpy as np
+
+index_name = "index.txt"
+
+def chunk_name(chunk_idx):
+    return "chunk_{:05d}.npy".format(chunk_idx)
+
+class Reader:
+    """This class reads a store from the disk. The chunks are memory mapped."""
+    def __init__(self, path):
+        self.path = path
+        self.index = []
+
+        with open(os.path.join(self.path, index_name), "r") as fin:
+            self.columns = fin.readline().rstrip("\n").split("\t")
+            for line in fin:
+                entry = line.rstrip("\n").split("\t")
+                self.index.append([entry[0], int(entry[1]), float(entry[2]), float(entry[3])])
+
+    def __len__(self):
+        return sum(entry[1] for entry in self.index)
+
+    def chunks(self):
+        """This function yields the chunks one after another as read-only arrays."""
+        for entry in self.index:
+            yield np.load(os.path.join(self.path, entry[0]), mmap_mode="r")
+
+    def read(self, start = 0, stop = None):
+        """This function returns the rows start to stop (excluded) as one array."""
+        return read_range(self.chunks(), len(self.columns), start, stop)
+
+    def column(self, name):
+        return self.read()[:, self.columns.index(name)]
+
+class Store:
+    """This class appends the raw data lines to the disk chunk by chunk. Lines that are shorter than the number of columns are filled up with NaN."""
+    def __init__(self, path, columns, chunk_rows = 4096):
+        self.path = path
+        self.columns = list(columns)
+        self.chunk_rows = chunk_rows
+        self.lock = threading.Lock()
+
+        # a store of a previous run with the same name is replaced, like the workbook
+        os.makedirs(self.path, exist_ok=True)
+        for name in os.listdir(self.path):
+            if name == index_name or (name.startswith("chunk_") and name.endswith(".npy")):
+                os.remove(os.path.join(self.path, name))
+
+        self.index = []
+        self.chunk = np.full((self.chunk_rows, len(self.columns)), np.nan)
+        self.chunk_len = 0
+        self.written_len = 0
+        self.length = 0
+        self.write_index()
+
+    def append(self, line):
+        with self.lock:
+            num = min(len(line), len(self.columns))
+            self.chunk[self.chunk_len, :num] = line[:num]
+            self.chunk_len += 1
+            self.length += 1
+
+            if self.chunk_len == self.chunk_rows:
+                self.write_chunk()
+                self.chunk = np.full((self.chunk_rows, len(self.columns)), np.nan)
+                self.chunk_len = 0
+                self.written_len = 0
+
+    def flush(self):
+        """This function also writes the incomplete chunk. It is written again as soon as it is complete."""
+        with self.lock:
+            if self.chunk_len > self.written_len:
+                self.write_chunk()
+                self.written_len = self.chunk_len
+
+    def write_chunk(self):
+        chunk_idx = (self.length - 1) // self.chunk_rows
+        name = chunk_name(chunk_idx)
+        np.save(os.path.join(self.path, name), self.chunk[:self.chunk_len])
+
+        entry = [name, self.chunk_len, self.chunk[0, 0], self.chunk[self.chunk_len-1, 0]]
+        if chunk_idx < len(self.index):
+            self.index[chunk_idx] = entry
+        else:
+            self.index.append(entry)
+        self.write_index()
+
+    def write_index(self):
+        tmp_path = os.path.join(self.path, index_name + ".tmp")
+        with open(tmp_path, "w") as fout:
+            fout.write("\t".join(self.columns) + "\n")
+            for entry in self.index:
+                fout.write("{}\t{}\t{!r}\t{!r}\n".format(entry[0], entry[1], float(entry[2]), float(entry[3])))
+        os.replace(tmp_path, os.path.join(self.path, index_name))
+
+    def __len__(self):
+        return self.length
+
+    def chunks(self):
+        """This function yields all complete chunks memory mapped and the current chunk from memory."""
+        with self.lock:
+            complete = (self.length - self.chunk_len) // self.chunk_rows
+            pending = self.chunk[:self.chunk_len].copy()
+        for chunk_idx in range(complete):
+            yield np.load(os.path.join(self.path, chunk_name(chunk_idx)), mmap_mode="r")
+        if len(pending) > 0:
+            yield pending
+
+    def read(self, start = 0, stop = None):
+        """This function returns the rows start to stop (excluded) as one array."""
+        return read_range(self.chunks(), len(self.columns), start, stop)
+
+    def get_path(self):
+        return self.path
+
+def read_range(chunks, num_columns, start, stop):
+    pieces = []
+    offset = 0
+    for chunk in chunks:
+        end = offset + len(chunk)
+        if stop is not None and offset >= stop:
+            break
+        if end > start:
+            lower = max(start - offset, 0)
+            upper = len(chunk) if stop is None else min(stop - offset, len(chunk))
+            pieces.append(chunk[lower:upper])
+        offset = end
+
+    if len(pieces) == 0:
+        return np.empty((0, num_columns))
+    return np.concatenate(pieces)
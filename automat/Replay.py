@@ -0,0 +1,204 @@
+# This file contains the offline evaluation of recorded runs. The
+# samples of a run (the calorimeter log "test.log", the raw data store
+# or the workbook with the sheet "Raw_Data_COM") are evaluated like
+# in the strategy "Output_Calculation_Absolute_Evaluation", but without
+# any device and without waiting. The evaluation windows of all
+# process points are taken from prefix sums of the samples, so that a
+# whole set of dead times, evaluation windows and calorimeter
+# calibrations is evaluated in one vectorised pass.
+
+# library/modules from python:
+import os
+import numpy as np
+from openpyxl import load_workbook
+
+# own scripts:
+import automat.Calorimeter as Calorimeter
+import automat.Dictionary as Dictionary
+import automat.Excel_Functions as Excel_Functions
+import automat.Raw_Data_Store as Raw_Data_Store
+
+# channels of the running statistics of the strategy: the first three are
+# compared with the temperature of the point, the last three are passed
+# to the calorimeter calibration
+statistics_channels = list(range(5, 11))
+
+sweep_header = ["Process Points", "Dead Time [ms]", "Evaluation Window [ms]", "Calibration", "dHr [kJ/mol]"]
+
+# loading of recorded runs:
+def load_samples(path):
+    """This function returns the samples of a recorded run as an array with one row per sample."""
+    if os.path.isdir(path):
+        return Raw_Data_Store.Reader(path).read()
+    if path.endswith(".xlsx"):
+        return load_workbook_samples(path)
+
+    parser = Calorimeter.Frame_Parser()
+    with open(path, "rb") as fin:
+        tmp = parser.feed(fin.read() + b"\n")
+    if tmp is None:
+        raise Exception("No samples in {}".format(path))
+    return tmp[0]
+
+def load_workbook_samples(path):
+    # The sheet only holds a summary if the workbook refers to a raw data store.
+    wb = load_workbook(path, read_only=True)
+    sheet = wb[Excel_Functions.raw_sheet_name(0)]
+    num = len(Excel_Functions.raw_data_header)
+    rows = sheet.iter_rows(values_only=True)
+    header = next(rows)
+    if len(header) > num + 1 and header[num + 1] == "Raw data store":
+        store_path = next(rows)[num + 1]
+        wb.close()
+        return Raw_Data_Store.Reader(store_path).read()
+
+    # an export continues on further sheets, empty cells at the end of a row are missing there
+    samples = [row[:num] + (None,) * (num - len(row)) for row in rows if row[0] is not None]
+    sheet_idx = 1
+    while Excel_Functions.raw_sheet_name(sheet_idx) in wb.sheetnames:
+        rows = wb[Excel_Functions.raw_sheet_name(sheet_idx)].iter_rows(min_row=2, values_only=True)
+        samples += [row[:num] + (None,) * (num - len(row)) for row in rows if row[0] is not None]
+        sheet_idx += 1
+    wb.close()
+    return np.array(samples, dtype=float)
+
+def load_process_setup(path, substance_data):
+    """This function returns the evaluation start time and the actual flow rate of each pump for each process point of the evaluation sheet of a recorded workbook. The sheet holds the actual flow rates of the substances A and B, so each substance has to be fed by one pump."""
+    pumps = [[jdx for jdx in range(len(substance_data.list)) if substance_data.list[jdx] == name] for name in ["A", "B"]]
+    if any(len(itm) > 1 for itm in pumps):
+        raise Exception("The actual flow rate of a substance can not be split between its pumps")
+
+    wb = load_workbook(path, read_only=True, data_only=True)
+    evaluation_start_s = []
+    actual_flowrates = []
+    in_section = False
+    for row in wb["Evaluation"].iter_rows(max_col=len(Excel_Functions.evaluation_header[1]), values_only=True):
+        if row[0] in Excel_Functions.evaluation_titles:
+            in_section = row[0] == Excel_Functions.evaluation_titles[1]
+        elif in_section and isinstance(row[0], (int, float)) and row[1] is not None:
+            # columns of the process setup: evaluation start time, V_A,act, V_B,act
+            flow = [0] * len(substance_data.list)
+            for kdx, column in [[0, 4], [1, 8]]:
+                for jdx in pumps[kdx]:
+                    flow[jdx] = row[column]
+            evaluation_start_s.append(row[1])
+            actual_flowrates.append(flow)
+    wb.close()
+    return np.array(evaluation_start_s, dtype=float), actual_flowrates
+
+# process points:
+def point_starts(time_s, evaluation_start_s, dead_time_ms):
+    """This function returns the start time of each process point of a recorded run. The strategy opens the evaluation window with the first sample after the dead time, so the point started after the sample before it, less the dead time."""
+    idx = np.searchsorted(time_s, evaluation_start_s, side="left") - 1
+    return time_s[np.maximum(idx, 0)] - dead_time_ms / 1E3
+
+def schedule(time_s, operation_point_list, start_s = None):
+    """This function returns the start time and the end (index after the last sample) of each process point. The strategy wakes up at the deadline of a point, so a point ends with the last sample up to its deadline and the next point starts at this deadline. The first point starts after the tenth sample, because the strategy needs ten samples for the temperature equilibration. Instead of the first start, the start of each point can be given (see point_starts)."""
+    if start_s is None:
+        start_s = time_s[min(9, len(time_s) - 1)]
+    given = np.ndim(start_s) > 0
+
+    starts = []
+    ends = []
+    start = start_s
+    for idx in range(len(operation_point_list)):
+        if given:
+            if not idx < len(start_s):
+                break
+            start = start_s[idx]
+        deadline = start + operation_point_list[idx].get_time_ms() / 1E3
+        starts.append(start)
+        ends.append(np.searchsorted(time_s, deadline, side="right"))
+        if ends[-1] >= len(time_s):
+            # the recording ends within this point
+            break
+        start = deadline
+    return np.array(starts), np.array(ends)
+
+def flowrates(operation_point_list, substance_data, actual_flowrates = None):
+    """This function returns the actual volume, molar and water molar flow rates of the substances A and B for each point, like the strategy calculates them. Without actual flow rates, the set flow rates are used."""
+    concentration = substance_data.get_concentration()
+    water_concentration = Dictionary.calculation_data["concentration"]
+
+    num = len(operation_point_list)
+    volume = np.zeros((num, 2))
+    molar = np.zeros((num, 2))
+    water = np.zeros((num, 2))
+    for idx in range(num):
+        if actual_flowrates is None:
+            flow = operation_point_list[idx].flowrate_list
+        else:
+            flow = actual_flowrates[idx]
+        for jdx in range(len(substance_data.list)):
+            kdx = 0 if substance_data.list[jdx] == "A" else 1
+            volume[idx, kdx] += flow[jdx]
+            molar[idx, kdx] += flow[jdx] * concentration[jdx] / 6E4
+            water[idx, kdx] += flow[jdx] * water_concentration / 6E4
+    return volume, molar, water
+
+def point_calibration(calibration, operation_point):
+    """This function returns the calorimeter calibration of a point. None stands for the calibration of the dictionary for the temperature of the point."""
+    if calibration is None:
+        return Dictionary.calorimeter_thermostat["{:d}".format(int(operation_point.temperature))]
+    return calibration
+
+# evaluation:
+def sweep(samples, operation_point_list, substance_data, dead_times_ms, windows_ms = [None], calibrations = [None], start_s = None, actual_flowrates = None):
+    """This function returns dHr with the shape (calibrations, process points, dead times, evaluation windows). An evaluation window of None lasts until the end of the point."""
+    time_s = samples[:, 0]
+    starts, ends = schedule(time_s, operation_point_list, start_s)
+    points = operation_point_list[:len(starts)]
+
+    # sums of the statistics channels from the first sample up to each sample
+    prefix = np.zeros((len(samples) + 1, len(statistics_channels)))
+    np.cumsum(samples[:, statistics_channels], axis=0, out=prefix[1:])
+
+    # The first sample after the dead time opens the window (shape: points, dead times, windows).
+    dead_s = np.asarray(dead_times_ms, dtype=float) / 1E3
+    window_s = np.array([np.inf if val is None else val / 1E3 for val in windows_ms])
+    first = np.searchsorted(time_s, starts[:, None] + dead_s[None, :], side="right")[:, :, None]
+    last = np.searchsorted(time_s, (starts[:, None, None] + dead_s[None, :, None] + window_s[None, None, :]).ravel(), side="right")
+    last = np.minimum(last.reshape(len(starts), len(dead_s), len(window_s)), ends[:, None, None])
+    last = np.maximum(last, first)
+    count = last - first
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = (prefix[last] - prefix[first]) / count[..., None]
+
+    volume, molar, water = flowrates(points, substance_data, actual_flowrates)
+    cp = Dictionary.calculation_data["cp"]
+    water_concentration = Dictionary.calculation_data["concentration"]
+    temperature = np.array([itm.temperature for itm in points], dtype=float)[:, None, None, None]
+
+    # outside heat fluxes of the feeds and of the outlet
+    temp_difference = temperature - mean[..., 0:3]
+    heat_flux_outside = volume[:, None, None, :] * water_concentration * cp * temp_difference[..., 0:2] / 6E4
+    heat_flux_out = water.sum(axis=1)[:, None, None] * cp * temp_difference[..., 2]
+
+    # reactor heat fluxes from the calibration (shape: calibrations, points, dead times, windows, channels),
+    # each calibration converts all dead times and windows of a point at once
+    value = mean[..., 3:6]
+    heat_flux_reactor = np.empty((len(calibrations),) + value.shape)
+    for cdx in range(len(calibrations)):
+        for idx in range(len(points)):
+            heat_flux_reactor[cdx, idx] = point_calibration(calibrations[cdx], points[idx]).forward(value[idx])
+
+    # the pre-heater flux without the heating of the feeds counts instead of the whole pre-heater flux
+    heat_sum = heat_flux_reactor.sum(axis=-1) - heat_flux_outside.sum(axis=-1) + heat_flux_out
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return heat_sum / (molar[:, 0] * 1000)[:, None, None]
+
+def sweep_table(dhr, dead_times_ms, windows_ms = [None]):
+    """This function turns the result of sweep into rows (see sweep_header)."""
+    rows = []
+    num_cal, num_points, num_dead, num_windows = dhr.shape
+    for idx in range(num_points):
+        for jdx in range(num_dead):
+            for kdx in range(num_windows):
+                for cdx in range(num_cal):
+                    rows.append([idx+1, float(dead_times_ms[jdx]), windows_ms[kdx], cdx, float(dhr[cdx, idx, jdx, kdx])])
+    return rows
+
+def evaluate(samples, operation_point_list, substance_data, dead_time_ms, start_s = None, actual_flowrates = None):
+    """This function returns dHr of each process point for a single dead time, like the strategy calculates it."""
+    return sweep(samples, operation_point_list, substance_data, [dead_time_ms], start_s=start_s, actual_flowrates=actual_flowrates)[0, :, 0, 0]
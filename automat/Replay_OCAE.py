@@ -0,0 +1,46 @@
+import numpy as np
+from openpyxl import Workbook
+import Replay
+import Strategy_OCAE
+
+# The recorded campaign of Simulation_OCAE.py is evaluated again for a set 
+# of dead times and evaluation windows, without any device. The recorded 
+# run can also be given as the calorimeter log ("test.log") or as the raw 
+# data store ("Calorimetry\simulation_ocae_raw"). A workbook also gives 
+# the actual flow rates and the start of each process point, which are 
+# taken from its evaluation start times and the dead time of the run.
+recording = "Calorimetry\simulation_ocae.xlsx"
+excel_file_name = "replay_ocae"
+operating_time = 0.3*60*1E3
+recorded_dead_time = 0.1*60*1E3
+
+# Parameters of the sweep (None: the evaluation window lasts until the end of the point)
+dead_times = list(np.arange(0, 0.25, 0.025)*60*1E3)
+evaluation_windows = [None, 0.05*60*1E3, 0.1*60*1E3]
+
+# List of operating points and substance data of the recorded campaign
+operation_point_list = [
+    Strategy_OCAE.operation_point_list_entry(operating_time, 25, [6.1, 6.05]),
+    Strategy_OCAE.operation_point_list_entry(operating_time, 25, [6.1, 6.05]),
+    Strategy_OCAE.operation_point_list_entry(operating_time, 25, [6.1, 6.05]),
+    Strategy_OCAE.operation_point_list_entry(operating_time, 25, [6.1, 6.05]),
+]
+substance_data = Strategy_OCAE.substance_data([4, 6], [50, 50], [40.01, 60.05], ["B", "A"])
+
+# Evaluation of all parameter sets
+samples = Replay.load_samples(recording)
+start_s = None
+actual_flowrates = None
+if recording.endswith(".xlsx"):
+    evaluation_start_s, actual_flowrates = Replay.load_process_setup(recording, substance_data)
+    start_s = Replay.point_starts(samples[:, 0], evaluation_start_s, recorded_dead_time)
+enthalpy_difference = Replay.sweep(samples, operation_point_list, substance_data, dead_times, evaluation_windows, start_s=start_s, actual_flowrates=actual_flowrates)
+
+wb = Workbook()
+ws = wb.active
+ws.title = "Sweep"
+ws.append(Replay.sweep_header)
+for row in Replay.sweep_table(enthalpy_difference, dead_times, evaluation_windows):
+    ws.append(row)
+wb.save("Calorimetry\{0}.xlsx".format(excel_file_name))
+print("Done")
@@ -0,0 +1,94 @@
+# This file contains the columnar buffer for the calorimeter samples.
+# The samples are stored once in a preallocated numpy array with one
+# named column per channel. The driver, the strategies and the GUI all
+# read from this buffer instead of keeping their own lists. A buffer
+# with a maximum length only keeps the latest samples, the older ones
+# are dropped (the strategy keeps all of them in the raw data store).
+
+# library/modules from python:
+import threading
+import numpy as np
+
+channels = ["Time_Data", "T_set", "T_pre", "T_r1", "T_r2", "T_r3", "T_r4", "T_r5", "T_A", "T_B", "T_out", "U_pre", "U_r1", "U_r2", "U_r3", "U_r4", "U_r5", "PWM_pre", "PWM_r1", "PWM_r2", "PWM_r3", "PWM_r4", "PWM_r5", "mW_pre", "mW_r1", "mW_r2", "mW_r3", "mW_r4", "mW_r5"]
+
+class Buffer:
+    """This class stores samples row by row in a growing numpy array. Lines that are shorter than the number of channels are filled up with NaN. With a maximum length, at least the latest max_length samples are kept; the array never grows beyond twice this length."""
+    def __init__(self, names = channels, capacity = 4096, max_length = None):
+        self.names = list(names)
+        self.index = {name: idx for idx, name in enumerate(self.names)}
+        self.max_length = max_length
+        if max_length is not None:
+            capacity = min(capacity, 2 * max_length)
+        self.data = np.full((capacity, len(self.names)), np.nan)
+        self.length = 0
+        self.dropped = 0
+        self.lock = threading.Lock()
+
+    def reserve(self, size):
+        if size <= len(self.data):
+            return
+        # Views that were handed out before keep the old array. Its rows
+        # are not changed anymore, so the views stay consistent.
+        if self.max_length is not None and size > 2 * self.max_length:
+            # the oldest samples are dropped, so that max_length samples are left
+            keep = max(min(self.length, self.max_length - (size - self.length)), 0)
+            data = np.full((max(2 * self.max_length, size - self.length + keep), len(self.names)), np.nan)
+            data[:keep] = self.data[self.length-keep:self.length]
+            self.dropped += self.length - keep
+            self.length = keep
+            self.data = data
+            return
+        new_size = max(size, 2 * len(self.data))
+        if self.max_length is not None:
+            new_size = min(new_size, 2 * self.max_length)
+        data = np.full((new_size, len(self.names)), np.nan)
+        data[:self.length] = self.data[:self.length]
+        self.data = data
+
+    def append(self, line):
+        with self.lock:
+            self.reserve(self.length + 1)
+            num = min(len(line), len(self.names))
+            self.data[self.length, :num] = line[:num]
+            self.length += 1
+
+    def extend(self, rows):
+        """This function appends a two-dimensional array with one row per sample."""
+        num = min(rows.shape[1], len(self.names))
+        with self.lock:
+            self.reserve(self.length + len(rows))
+            self.data[self.length:self.length+len(rows), :num] = rows[:, :num]
+            self.length += len(rows)
+
+    def snapshot(self):
+        """This function returns a read-only view of all samples stored so far (without the dropped ones). Samples that are appended later are not part of it."""
+        with self.lock:
+            view = self.data[:self.length]
+        view.flags.writeable = False
+        return view
+
+    def since(self, count):
+        """This function returns a read-only view of the samples that were appended after the first count samples (as far as they are kept) and the number of samples appended so far."""
+        with self.lock:
+            view = self.data[min(max(count - self.dropped, 0), self.length):self.length]
+            total = self.dropped + self.length
+        view.flags.writeable = False
+        return view, total
+
+    def get_count(self):
+        """This function returns the number of samples appended so far, the dropped ones included."""
+        return self.dropped + self.length
+
+    def column(self, name):
+        return self.snapshot()[:, self.index[name]]
+
+    def last(self, num):
+        """This function returns a read-only view of the last num samples."""
+        view = self.snapshot()
+        return view[max(len(view) - num, 0):]
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, idx):
+        return self.snapshot()[idx]
@@ -0,0 +1,41 @@
+import Auto
+import automat.Clock as Clock
+import Simulator
+import Strategy_OCAE
+
+# The same campaign as in Operating_OCAE.py, but all devices are simulated 
+# (see the simulator settings in the dictionary). The campaign runs on the 
+# simulated clock, so it only takes seconds.
+operating_time = 0.3*60*1E3
+dead_time = 0.1*60*1E3
+excel_file_name = "simulation_ocae"
+
+# List of operating points
+operation_point_list = [
+    Strategy_OCAE.operation_point_list_entry(operating_time, 25, [6.1, 6.05]),
+    Strategy_OCAE.operation_point_list_entry(operating_time, 25, [6.1, 6.05]),
+    Strategy_OCAE.operation_point_list_entry(operating_time, 25, [6.1, 6.05]),
+    Strategy_OCAE.operation_point_list_entry(operating_time, 25, [6.1, 6.05]),
+]
+
+# Substance data 
+substance_data = Strategy_OCAE.substance_data([4, 6], [50, 50], [40.01, 60.05], ["B", "A"])
+
+# Devices used, the ports are not opened
+User_Pumps = [["HPLC A", "COM12"], ["Lambda 3", "COM11"]]
+User_Fisher = ["COM8"]
+Portname_Calorimeter = "COM6"
+
+# The clock has to be installed before anything takes a deadline from it
+Clock.install(Clock.Simulated_Clock())
+
+# Setting up the strategy
+strategy = Strategy_OCAE.Output_Calculation_Absolute_Evaluation(operation_point_list, substance_data, dead_time, excel_file_name)
+
+# Setting up the simulated plant and the automatization
+plant = Simulator.Plant()
+automat = Auto.matization(strategy, User_Pumps, User_Fisher, Portname_Calorimeter, plant=plant)
+
+# Automatization is run until the end state is reached
+print(Auto.run(automat))
+print("Done")
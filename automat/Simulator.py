@@ -0,0 +1,305 @@
+# This file contains a simulated plant and the communication handles
+# of the simulated devices (HPLC pump, Lambda pump, Fisher thermostat
+# and calorimeter). The handles offer the same functions as the
+# communication handles ("send", "receive", "clear_input_buffer" and
+# "close") and speak the wire protocols of the real devices, so that
+# the drivers and the whole automatization can be run without any
+# hardware. The plant models the bath of the thermostat, the zones of
+# the calorimeter with their Peltier elements, the flow rates of the
+# pumps, the pressure of the HPLC pumps and the heat of the reaction.
+# All parameters are given in the dictionary.
+
+# library/modules from python:
+import math
+import re
+import threading
+import numpy as np
+
+# own scripts:
+import automat.Clock as Clock
+import automat.Dictionary as Dictionary
+import automat.Protocol as Protocol
+
+zones = ["pre", "r1", "r2", "r3", "r4", "r5"]
+
+class Plant:
+    """This class integrates the physical state of all simulated devices. It is advanced by the handles whenever they are used."""
+    def __init__(self, settings = None):
+        if settings is None:
+            settings = Dictionary.simulator
+        self.settings = dict(settings)
+        self.lock = threading.Lock()
+        self.rng = np.random.default_rng(self.settings["seed"])
+
+        ambient = self.settings["ambient_temp"]
+        self.bath_temp = ambient
+        self.bath_set_temp = ambient
+        self.bath_on = False
+
+        self.set_temp = ambient
+        self.zone_temp = np.full(len(zones), ambient)
+        self.zone_power = np.zeros(len(zones))
+
+        # name: [pump on, flow rate in ml/min]
+        self.pumps = {}
+
+        self.start = Clock.now_ns() / 1E9
+        self.next_sample = self.start + self.settings["sample_period_s"]
+        self.lines = bytearray()
+        self.handles = []
+
+    # handles of the simulated devices:
+    def open_hplc(self, name, calibration_func):
+        return self.add_handle(HPLC_Handle(self, name, calibration_func))
+
+    def open_lambda(self, name, calibration_func, address):
+        return self.add_handle(Lambda_Handle(self, name, calibration_func, address))
+
+    def open_fisher(self):
+        return self.add_handle(Fisher_Handle(self))
+
+    def open_calorimeter(self):
+        return Calorimeter_Handle(self)
+
+    def add_handle(self, ch):
+        self.handles.append(ch)
+        return ch
+
+    def get_wakeup(self):
+        """This function returns the time (Clock.now_ns) of the next calorimeter line or of the next answer of a device, whichever comes first."""
+        ret = self.next_sample
+        for ch in self.handles:
+            if len(ch.resp) > 0 and ch.resp_time < ret:
+                ret = ch.resp_time
+        return math.ceil(ret * 1E9)
+
+    # In the following, the functions are defined which are used by the handles to change the plant.
+    def set_pump(self, name, on, flow):
+        with self.lock:
+            self.advance()
+            self.pumps[name] = [on, flow]
+
+    def get_pump(self, name):
+        return self.pumps.get(name, [False, 0.0])
+
+    def set_bath(self, on = None, set_temp = None):
+        with self.lock:
+            self.advance()
+            if on is not None:
+                self.bath_on = on
+            if set_temp is not None:
+                self.bath_set_temp = set_temp
+
+    def set_calorimeter_temp(self, val):
+        with self.lock:
+            self.advance()
+            self.set_temp = val
+
+    def get_pressure(self, name):
+        on, flow = self.get_pump(name)
+        if not on or flow <= 0:
+            return 0.0
+        return self.settings["pressure_per_flow"] * flow * (1 + 0.01 * self.rng.standard_normal())
+
+    def take_lines(self):
+        with self.lock:
+            self.advance()
+            ret = bytes(self.lines)
+            self.lines.clear()
+            return ret
+
+    # integration:
+    def advance(self):
+        """This function integrates the plant up to now, one sample period at a time, and adds a calorimeter line for each period."""
+        now = Clock.now_ns() / 1E9
+        dt = self.settings["sample_period_s"]
+        while self.next_sample <= now:
+            self.step(dt)
+            self.lines += self.format_line(self.next_sample - self.start)
+            self.next_sample += dt
+
+    def step(self, dt):
+        cfg = self.settings
+        ambient = cfg["ambient_temp"]
+
+        # thermostat bath: circulating towards the set temperature, otherwise towards the ambient temperature
+        target = self.bath_set_temp if self.bath_on else ambient
+        tau = cfg["bath_tau_s"] if self.bath_on else 10 * cfg["bath_tau_s"]
+        self.bath_temp += (target - self.bath_temp) * (1 - math.exp(-dt / tau))
+
+        # heat that the Peltier elements have to supply to keep each zone at the set temperature
+        flows = [flow for on, flow in self.pumps.values() if on and flow > 0]
+        required = cfg["zone_conductance"] * (self.set_temp - self.bath_temp) * np.ones(len(zones))
+        required[0] += sum(flows) * cfg["flow_heat_capacity"] * (self.set_temp - ambient)
+        if len(flows) >= 2:
+            share = cfg["reaction_decay"] ** np.arange(len(zones) - 1)
+            required[1:] -= cfg["reaction_heat"] * min(flows) * share / share.sum()
+
+        # a saturated element can not hold the set temperature
+        self.zone_power = np.clip(required, -cfg["heater_max_mW"], cfg["heater_max_mW"])
+        target = self.set_temp - (required - self.zone_power) / cfg["zone_conductance"]
+        self.zone_temp += (target - self.zone_temp) * (1 - math.exp(-dt / cfg["zone_tau_s"]))
+
+    def format_line(self, time_s):
+        """This function returns a line like the calorimeter sends it (see Sample_Buffer.channels)."""
+        cfg = self.settings
+        temps = self.zone_temp + cfg["noise_temp"] * self.rng.standard_normal(len(zones))
+        feed = cfg["ambient_temp"]
+        power = self.zone_power
+        voltage = np.sign(power) * np.sqrt(np.abs(power) / 1000 * cfg["heater_resistance"])
+        pwm = np.abs(power) / cfg["heater_max_mW"] * 100
+
+        # the set temperature is sent like it was received, so that the driver can compare it
+        values = list(temps) + [feed, feed, temps[-1]] + list(voltage) + list(pwm) + list(power)
+        fields = ["{:.3f}".format(time_s), "{:.2f}".format(self.set_temp)] + ["{:.3f}".format(val) for val in values]
+        return ("\t".join(fields) + "\r\n").encode("ASCII")
+
+# simulated devices:
+class Device_Handle:
+    """This class forms the basis for the handles of the simulated pumps and the thermostat. A response can be received after the response delay and only once."""
+    def __init__(self, plant):
+        self.plant = plant
+        self.resp = b""
+        self.resp_time = 0.0
+
+    def send(self, msg):
+        frame = bytes(msg)
+        if frame.endswith(Protocol.end_of_frame):
+            frame = frame[:-1]
+        ans = self.answer(frame)
+        if ans is None:
+            return
+        self.resp = ans + Protocol.end_of_frame
+        self.resp_time = Clock.now_ns() / 1E9 + self.plant.settings["response_delay_s"]
+
+    def answer(self, frame):
+        return None
+
+    def clear_input_buffer(self):
+        self.resp = b""
+
+    def receive(self):
+        if len(self.resp) == 0 or Clock.now_ns() / 1E9 < self.resp_time:
+            return bytearray()
+        ret = bytearray(self.resp)
+        self.resp = b""
+        return ret
+
+    def close(self):
+        return
+
+class HPLC_Handle(Device_Handle):
+    """Commands are answered like "FLOW: 06000" with "FLOW:OK" and "FLOW?" with "FLOW:06000"."""
+    def __init__(self, plant, name, calibration_func):
+        super().__init__(plant)
+        self.name = name
+        self.calibration_func = calibration_func
+        self.on = False
+        self.flow = 0
+        self.limits = {}
+
+    def answer(self, frame):
+        if frame == b"ON" or frame == b"OFF":
+            self.on = frame == b"ON"
+            self.update()
+            return frame + b":OK"
+        if frame == b"PRESSURE?":
+            return b"PRESSURE:" + "{:.0f}".format(self.plant.get_pressure(self.name)).encode("ASCII")
+        if frame == b"FLOW?":
+            return b"FLOW:" + "{:05d}".format(self.flow).encode("ASCII")
+        if frame.endswith(b"?"):
+            key = frame[:-1]
+            if key in self.limits:
+                return key + b":" + self.limits[key]
+            return key + b":ERROR"
+
+        cmd = Protocol.parse_hplc(frame)
+        if cmd is None:
+            return b"ERROR"
+        if cmd.key == b"FLOW":
+            self.flow = int(cmd.value)
+            self.update()
+            return b"FLOW:OK"
+        if cmd.key.startswith(b"PMIN") or cmd.key.startswith(b"PMAX"):
+            self.limits[cmd.key] = cmd.value.strip()
+            return cmd.key + b":OK"
+        return cmd.key + b":ERROR"
+
+    def update(self):
+        self.plant.set_pump(self.name, self.on, self.calibration_func.backward(self.flow))
+
+lambda_command_pattern = re.compile(rb"#(\d{2})(\d{2})(r(\d{3})|G)([0-9A-F]{2})")
+
+class Lambda_Handle(Device_Handle):
+    """The flow rate is set with "#AAMMrDDDCS" (without answer) and read with "#AAMMGCS", which is answered with "<MMAArDDDCS"."""
+    def __init__(self, plant, name, calibration_func, address):
+        super().__init__(plant)
+        self.name = name
+        self.calibration_func = calibration_func
+        self.address = address
+        self.ddd = 0
+
+    def answer(self, frame):
+        cmd = lambda_command_pattern.fullmatch(frame)
+        if cmd is None or not int(cmd.group(1)) == self.address:
+            return None
+        # a frame with a wrong checksum is ignored by the pump
+        if not Protocol.lambda_checksum(frame[:-2].decode("ASCII")) == int(cmd.group(5), 16):
+            return None
+        if cmd.group(4) is not None:
+            self.ddd = int(cmd.group(4))
+            self.plant.set_pump(self.name, self.ddd > 0, self.calibration_func.backward(self.ddd))
+            return None
+        step1 = "<{}{:02d}r{:03d}".format(cmd.group(2).decode("ASCII"), self.address, self.ddd)
+        return "{}{:02X}".format(step1, Protocol.lambda_checksum(step1)).encode("ASCII")
+
+class Fisher_Handle(Device_Handle):
+    """Settings are answered with "OK", queries with the value (temperatures like "25.0C")."""
+    def __init__(self, plant):
+        super().__init__(plant)
+        self.settings = {b"TU": b"C", b"PS": b"L", b"E": b"0"}
+
+    def answer(self, frame):
+        if frame == b"RO":
+            return b"1" if self.plant.bath_on else b"0"
+        if frame == b"RS":
+            return "{:.1f}C".format(self.plant.bath_set_temp).encode("ASCII")
+        if frame == b"RT":
+            with self.plant.lock:
+                self.plant.advance()
+                return "{:.1f}C".format(self.plant.bath_temp).encode("ASCII")
+        if frame.startswith(b"SO "):
+            self.plant.set_bath(on=frame[3:] == b"1")
+            return b"OK"
+        if frame.startswith(b"SS "):
+            self.plant.set_bath(set_temp=float(frame[3:]))
+            return b"OK"
+        if frame[:1] == b"R" and frame[1:] in self.settings:
+            return self.settings[frame[1:]]
+        if frame[:1] == b"S" and b" " in frame:
+            key, val = frame[1:].split(b" ", 1)
+            if key in self.settings:
+                self.settings[key] = val
+                return b"OK"
+        return b"?"
+
+calorimeter_command_pattern = re.compile(rb"<1,([-\d\.]+)>")
+
+class Calorimeter_Handle:
+    """The calorimeter sends its lines without being asked, a new set temperature is sent like "<1,25.00>"."""
+    def __init__(self, plant):
+        self.plant = plant
+
+    def send(self, msg):
+        cmd = calorimeter_command_pattern.match(bytes(msg))
+        if cmd is not None:
+            self.plant.set_calorimeter_temp(float(cmd.group(1)))
+
+    def clear_input_buffer(self):
+        self.plant.take_lines()
+
+    def receive(self):
+        return self.plant.take_lines()
+
+    def close(self):
+        return
@@ -1,6 +1,6 @@
 # library/modules from python:
-import time
 import math 
+import numpy as np
 from enum import Enum
 from openpyxl import Workbook
 from openpyxl.chart import LineChart, Reference
@@ -8,8 +8,11 @@ from openpyxl.styles import Font, PatternFill, Alignment, Border, Side, colors
 
 # own scripts:
 import automat.pyStrategy as pyStrategy
+import automat.Clock as Clock
 import automat.Excel_Functions as Excel_Functions
 import automat.Dictionary as Dictionary
+import automat.Raw_Data_Store as Raw_Data_Store
+import automat.Sample_Buffer as Sample_Buffer
 
 class operation_point_list_entry:
     """This class turns the user's input into an object, making it easier to handle the operating points."""
@@ -58,6 +61,39 @@ class substance_data:
     def get_pump_substance_assignment_list(self):
         return self.list
 
+class running_statistics:
+    """This class calculates the sum, mean and variance of some channels of a data stream sample by sample, without keeping the samples (Welford's method)."""
+    def __init__(self, channels):
+        self.channels = channels
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.mean = [0.0] * len(self.channels)
+        self.m2 = [0.0] * len(self.channels)
+
+    def push(self, line):
+        self.count += 1
+        for idx in range(len(self.channels)):
+            value = line[self.channels[idx]]
+            delta = value - self.mean[idx]
+            self.mean[idx] += delta / self.count
+            self.m2[idx] += delta * (value - self.mean[idx])
+
+    def get_count(self):
+        return self.count
+
+    def get_sum(self):
+        return [mean * self.count for mean in self.mean]
+
+    def get_mean(self):
+        return list(self.mean)
+
+    def get_variance(self):
+        if self.count < 2:
+            return [0.0] * len(self.channels)
+        return [m2 / (self.count - 1) for m2 in self.m2]
+
 class Output_Calculation_Absolute_Evaluation(pyStrategy.Strategy_Base):
     class States(Enum):
         TEMPERATURE_EQUILIBRATION = 0,
@@ -75,14 +111,23 @@ class Output_Calculation_Absolute_Evaluation(pyStrategy.Strategy_Base):
         self.min_time = 0
         self.cur_operation_point = None
         self.state = Output_Calculation_Absolute_Evaluation.States.TEMPERATURE_EQUILIBRATION
-        self.datalist = []
+        self.datalist = Sample_Buffer.Buffer(max_length = Dictionary.samples["window_rows"])
         
         # variables for calculation
         self.process_point = 0
+        self.statistics = running_statistics(range(5,11))
 
         # create excel file
         self.excel_name = excel_name     
-        [self.workbook, self.sheet, self.counter] = Excel_Functions.create_excel(self.substance_data, self.excel_name)
+        [self.workbook, self.sheet, self.report] = Excel_Functions.create_excel(self.substance_data, self.excel_name)
+
+        # all raw data lines go to the store, the workbook only gets a summary
+        self.raw_store = Raw_Data_Store.Store("Calorimetry\{0}_raw".format(self.excel_name), Excel_Functions.raw_data_header)
+        self.summary_every = Dictionary.excel["summary_every"]
+        self.summary_rows = 0
+        Excel_Functions.reference_raw_data_store(self.sheet[1], self.raw_store.get_path())
+
+        self.writer = Excel_Functions.Write_Behind(self.workbook, self.excel_name, Dictionary.excel["save_interval_s"], Dictionary.excel["journal_interval_s"], self.raw_store, self.snapshot_evaluation)
 
         # sanity check
         for idx in range(len(self.list)):
@@ -105,7 +150,7 @@ class Output_Calculation_Absolute_Evaluation(pyStrategy.Strategy_Base):
 
         self.cur_operation_point = self.list[self.idx]
         if not self.cur_operation_point.get_temperature() == self.cur_temp:
-            self.cur_deadline = time.monotonic_ns() + 10 * 60 * 1E9
+            self.cur_deadline = Clock.now_ns() + 10 * 60 * 1E9
             self.state = Output_Calculation_Absolute_Evaluation.States.TEMPERATURE_EQUILIBRATION
             self.cur_temp =  self.cur_operation_point.get_temperature()
             return pyStrategy.Strategy_Base.operation_point_information(self.cur_temp, [0] * self.cur_operation_point.get_number_of_pumps())
@@ -119,36 +164,41 @@ class Output_Calculation_Absolute_Evaluation(pyStrategy.Strategy_Base):
             return
         
         self.datalist.append(line)
-        self.sheet[1].append(line)
-
+        self.raw_store.append(line)
+        self.writer.journal(line)
+
+        # the workbook itself belongs to the writer, it only gets the changes
+        with self.writer.lock:
+            if (len(self.raw_store) - 1) % self.summary_every == 0:
+                self.summary_rows += 1
+                self.writer.set_row(self.sheet[1], self.summary_rows+1, line)
+            self.update_evaluation(line)
+            self.writer.mark_dirty()
+
+    def update_evaluation(self, line):
         if not self.state == Output_Calculation_Absolute_Evaluation.States.WAITING_FOR_DEADLINE:
             return
    
         # one-time calculation
-        if self.min_time < time.monotonic_ns() and self.waiting_counter == 0:
-            self.starting_idx = len(self.datalist)-1
+        if self.min_time < Clock.now_ns() and self.waiting_counter == 0:
             self.waiting_counter = 1
 
             self.process_point += 1
-            self.evalutaion_time = [self.datalist[self.starting_idx][0], None]
+            self.evalutaion_time = [line[0], None]
             self.set_volume_flowrate = [0, 0]
             self.actual_volume_flowrate = [0, 0]
             self.actual_molar_flowrate = [0, 0]
             self.actual_water_molar_flowrate = [0, 0]
 
-            for idx in range(1,4):
-                self.sheet[0].insert_rows(idx=self.counter[idx][1], amount=1)
-                if idx == 1:
-                    for jdx in range(1,4):
-                        self.counter[jdx][1] += 1
-                        if jdx != 1:
-                            self.counter[jdx][0] += 1    
-                if idx == 2:
-                    for jdx in range(2,4):
-                        self.counter[jdx][1] += 1
-                    self.counter[3][0] += 1 
-                if idx == 3:
-                    self.counter[idx][1] += 1              
+            # rows of this point in the sections process setup, raw data processing and calculation
+            [self.setup_row, self.processing_row, self.calculation_row] = self.report.get_point(self.process_point)
+
+            # constants of this point
+            self.concentration = self.substance_data.get_concentration()
+            self.water_concentration = Dictionary.calculation_data["concentration"]
+            self.cp = Dictionary.calculation_data["cp"]
+            self.calorimeter_calibration = Dictionary.calorimeter_thermostat["{:d}".format(int(self.cur_operation_point.temperature))]
+            self.statistics.reset()
 
             for idx in range(len(self.substance_data.list)):
                 if self.substance_data.list[idx] == "A":
@@ -157,72 +207,61 @@ class Output_Calculation_Absolute_Evaluation(pyStrategy.Strategy_Base):
                     jdx = 1
                 self.set_volume_flowrate[jdx] += self.cur_operation_point.flowrate_list[idx]
                 self.actual_volume_flowrate[jdx] += self.actual_flowrate_list[idx]
-                self.actual_molar_flowrate[jdx] += self.actual_flowrate_list[idx] * self.substance_data.get_concentration()[idx] / 6E4
-                self.actual_water_molar_flowrate[jdx] += self.actual_flowrate_list[idx] * Dictionary.calculation_data["concentration"] / 6E4
-
-            # process setup entry    
-            self.sheet[0].cell(row=self.counter[1][1]-1, column=1).value = self.process_point
-            self.sheet[0].cell(row=self.counter[1][1]-1, column=2).value = self.evalutaion_time[0]
-            self.sheet[0].cell(row=self.counter[1][1]-1, column=4).value = self.set_volume_flowrate[0]
-            self.sheet[0].cell(row=self.counter[1][1]-1, column=5).value = self.actual_volume_flowrate[0]
-            self.sheet[0].cell(row=self.counter[1][1]-1, column=6).value = self.actual_molar_flowrate[0]
-            self.sheet[0].cell(row=self.counter[1][1]-1, column=7).value = self.actual_water_molar_flowrate[0]
-            self.sheet[0].cell(row=self.counter[1][1]-1, column=8).value = self.set_volume_flowrate[1]
-            self.sheet[0].cell(row=self.counter[1][1]-1, column=9).value = self.actual_volume_flowrate[1]
-            self.sheet[0].cell(row=self.counter[1][1]-1, column=10).value = self.actual_molar_flowrate[1]
-            self.sheet[0].cell(row=self.counter[1][1]-1, column=11).value = self.actual_water_molar_flowrate[1]
+                self.actual_molar_flowrate[jdx] += self.actual_flowrate_list[idx] * self.concentration[idx] / 6E4
+                self.actual_water_molar_flowrate[jdx] += self.actual_flowrate_list[idx] * self.water_concentration / 6E4
+
+            # process setup entry (the columns are counted from 0)
+            self.setup_row[1] = self.evalutaion_time[0]
+            self.setup_row[3] = self.set_volume_flowrate[0]
+            self.setup_row[4] = self.actual_volume_flowrate[0]
+            self.setup_row[5] = self.actual_molar_flowrate[0]
+            self.setup_row[6] = self.actual_water_molar_flowrate[0]
+            self.setup_row[7] = self.set_volume_flowrate[1]
+            self.setup_row[8] = self.actual_volume_flowrate[1]
+            self.setup_row[9] = self.actual_molar_flowrate[1]
+            self.setup_row[10] = self.actual_water_molar_flowrate[1]
                             
         # ongoing calculation
         if self.waiting_counter == 1:
-            mean_values = []
             temp_difference = []
             heat_flux_outside = []
             heat_flux_reactor = None
             enthalpy_difference = None
 
             # process setup entry
-            self.evalutaion_time[1] = self.datalist[len(self.datalist)-1][0]
-            self.sheet[0].cell(row=self.counter[1][1]-1, column=3).value = self.evalutaion_time[1]
+            self.evalutaion_time[1] = line[0]
+            self.setup_row[2] = self.evalutaion_time[1]
 
             # raw data processing entry (mean values)
-            self.sheet[0].cell(row=self.counter[2][1]-1, column=1).value = self.process_point
+            self.statistics.push(line)
+            mean_values = self.statistics.get_mean()
             for idx in range(5,11):
-                mean = 0
-                counter = 0
-                for jdx in range(self.starting_idx, len(self.datalist)):
-                    counter += 1
-                    mean += self.datalist[jdx][idx]
-                mean_values.append(mean/counter)
-                self.sheet[0].cell(row=self.counter[2][1]-1, column=idx-3).value = mean_values[idx-5]
+                self.processing_row[idx-4] = mean_values[idx-5]
             
             # raw data processing and calculation entry (temperature difference and outside heat flux)
             for idx in range(3):
                 temp_difference.append(self.cur_operation_point.temperature - mean_values[idx])
-                self.sheet[0].cell(row=self.counter[2][1]-1, column=idx+8).value = temp_difference[idx]
+                self.processing_row[idx+7] = temp_difference[idx]
 
                 if not idx == 2:
-                    tmp = self.actual_volume_flowrate[idx] * Dictionary.calculation_data["concentration"] * Dictionary.calculation_data["cp"] * temp_difference[idx] / 6E4
+                    tmp = self.actual_volume_flowrate[idx] * self.water_concentration * self.cp * temp_difference[idx] / 6E4
                     heat_flux_outside.append(tmp)
-                    self.sheet[0].cell(row=self.counter[3][1]-1, column=idx+2).value = heat_flux_outside[idx]
+                    self.calculation_row[idx+1] = heat_flux_outside[idx]
 
                 else:
-                    tmp = sum(self.actual_water_molar_flowrate) * Dictionary.calculation_data["cp"] * temp_difference[idx]
+                    tmp = sum(self.actual_water_molar_flowrate) * self.cp * temp_difference[idx]
                     heat_flux_outside.append(tmp)
-                    self.sheet[0].cell(row=self.counter[2][1]-1, column=self.counter[2][2]).value = heat_flux_outside[idx]
+                    self.processing_row[-1] = heat_flux_outside[idx]
 
             # calculation entry (reactor heat flux and enthalpy difference)
-            self.sheet[0].cell(row=self.counter[3][1]-1, column=1).value = self.process_point
-            heat_flux_reactor = Dictionary.calorimeter_thermostat["{:d}".format(int(self.cur_operation_point.temperature))].forward(mean_values[3:])
+            heat_flux_reactor = self.calorimeter_calibration.forward(mean_values[3:])
             heat_flux_reactor.insert(1, heat_flux_reactor[0]-sum(heat_flux_outside[:2]))
 
             for idx in range(len(heat_flux_reactor)):
-                self.sheet[0].cell(row=self.counter[3][1]-1, column=idx+4).value = heat_flux_reactor[idx]
+                self.calculation_row[idx+3] = heat_flux_reactor[idx]
 
             enthalpy_difference = (sum(heat_flux_reactor[1:])+heat_flux_outside[2]) / (self.actual_molar_flowrate[0]*1000)
-            self.sheet[0].cell(row=self.counter[3][1]-1, column=self.counter[3][2]).value = enthalpy_difference
-
-            # save changes 
-            self.workbook.save("Calorimetry\{0}.xlsx".format(self.excel_name))
+            self.calculation_row[-1] = enthalpy_difference
 
     def point_complete(self):
         if self.state == Output_Calculation_Absolute_Evaluation.States.TEMPERATURE_EQUILIBRATION:
@@ -230,24 +269,21 @@ class Output_Calculation_Absolute_Evaluation(pyStrategy.Strategy_Base):
             if len(self.datalist) < val:
                 return False
         
-            for col_idx in [2, 3, 4]:
-                valid_count = 0
-                for idx in range(val):
-                    if abs(self.datalist[len(self.datalist)-1-idx][col_idx] - self.cur_operation_point.get_temperature()) < 0.1:
-                        valid_count += 1
-                if valid_count < math.ceil(val*0.9):
-                    # return False
-                    return True
+            last_values = self.datalist.last(val)[:, [2, 3, 4]]
+            valid_count = np.sum(np.abs(last_values - self.cur_operation_point.get_temperature()) < 0.1, axis=0)
+            if np.any(valid_count < math.ceil(val*0.9)):
+                # return False
+                return True
             return True
         elif self.state == Output_Calculation_Absolute_Evaluation.States.SETTING_DEADLINE:
-            self.cur_deadline = time.monotonic_ns() + self.cur_operation_point.get_time_ms() * 1E6
-            self.min_time = time.monotonic_ns() +  self.dead_time
+            self.cur_deadline = Clock.now_ns() + self.cur_operation_point.get_time_ms() * 1E6
+            self.min_time = Clock.now_ns() + self.dead_time * 1E6
             self.state = Output_Calculation_Absolute_Evaluation.States.WAITING_FOR_DEADLINE
             self.waiting_counter = 0
             return False
         elif self.state == Output_Calculation_Absolute_Evaluation.States.WAITING_FOR_DEADLINE:
-            if self.cur_deadline < time.monotonic_ns():
-                self.workbook.save("Calorimetry\{0}.xlsx".format(self.excel_name))
+            if self.cur_deadline < Clock.now_ns():
+                self.writer.flush()
                 return True
             else:
                 return False
@@ -257,25 +293,58 @@ class Output_Calculation_Absolute_Evaluation(pyStrategy.Strategy_Base):
         if not self.state == Output_Calculation_Absolute_Evaluation.States.TEMPERATURE_EQUILIBRATION:
             return False
 
-        if self.cur_deadline < time.monotonic_ns():
+        if self.cur_deadline < Clock.now_ns():
             print("set_temp is not reached at the reactor")
             return True
         return False
 
+    def get_wakeup(self):
+        if self.state == Output_Calculation_Absolute_Evaluation.States.SETTING_DEADLINE:
+            return 0
+        if self.state == Output_Calculation_Absolute_Evaluation.States.WAITING_FOR_DEADLINE and self.waiting_counter == 0:
+            return min(self.min_time, self.cur_deadline)
+        return self.cur_deadline
+
     def push_actual_flowrate(self, val):
         self.actual_flowrate_list = val
 
     def get_finish_instruction(self):
+        export_name = None
+        if Dictionary.excel["raw_export"]:
+            export_name = "{}_raw_data".format(self.excel_name)
+        self.writer.close(lambda: self.finish_workbook(export_name))
+
+        # streamed after the workbook is closed, so that it is not kept in memory twice
+        if export_name is not None:
+            Excel_Functions.export_raw_data(self.raw_store, export_name, Dictionary.excel["sheet_rows"])
+
+    def snapshot_evaluation(self):
+        """This function is called by the writer under its lock. The copy of the report is laid out in the evaluation sheet by the writer thread."""
+        report = self.report.copy()
+        return lambda: report.write(self.sheet[0])
+
+    def finish_workbook(self, export_name = None):
+        self.counter = self.report.write(self.sheet[0])
+
+        # the charts are drawn from a decimated copy of the raw data
+        chart_sheet = self.workbook.create_sheet("Raw_Data_Chart")
+        chart_sheet.append(Excel_Functions.raw_data_header)
+        for row in Excel_Functions.to_rows(Excel_Functions.decimate_raw_data(self.raw_store, Dictionary.excel["chart_rows"])):
+            chart_sheet.append(row)
+        chart_rows = chart_sheet.max_row - 1
+        if export_name is not None:
+            Excel_Functions.reference_raw_data_export(self.sheet[1], "Calorimetry\{0}.xlsx".format(export_name))
+
         # generate charts
         Dia_Raw_Temp = LineChart()
 
         Dia_Raw_Temp.y_axis.title = "Temperature [°C]"
-        y_data = Reference(self.sheet[1], min_col = 2, min_row = 1, max_col = 8, max_row = len(self.datalist)+1)
+        y_data = Reference(chart_sheet, min_col = 2, min_row = 1, max_col = 8, max_row = chart_rows+1)
         Dia_Raw_Temp.add_data(y_data, titles_from_data = True)
 
         Dia_Raw_Temp.x_axis.title = "Time [s]"
-        Dia_Raw_Temp.x_axis.tickLblSkip = math.ceil(len(self.datalist)/10)
-        x_data = Reference(self.sheet[1], min_col = 1, min_row = 2, max_row = len(self.datalist)+1)
+        Dia_Raw_Temp.x_axis.tickLblSkip = math.ceil(chart_rows/10)
+        x_data = Reference(chart_sheet, min_col = 1, min_row = 2, max_row = chart_rows+1)
         Dia_Raw_Temp.set_categories(x_data)
 
         chart1 = self.workbook.create_chartsheet("Dia_Raw_Temp")
@@ -284,12 +353,12 @@ class Output_Calculation_Absolute_Evaluation(pyStrategy.Strategy_Base):
         Dia_Raw_Voltage = LineChart()
 
         Dia_Raw_Voltage.y_axis.title = "Voltage [mV]"
-        y_data = Reference(self.sheet[1], min_col = 9, min_row = 1, max_col = 11, max_row = len(self.datalist)+1)
+        y_data = Reference(chart_sheet, min_col = 9, min_row = 1, max_col = 11, max_row = chart_rows+1)
         Dia_Raw_Voltage.add_data(y_data, titles_from_data = True)
 
         Dia_Raw_Voltage.x_axis.title = "Time [s]"
-        Dia_Raw_Voltage.x_axis.tickLblSkip = math.ceil(len(self.datalist)/10)
-        x_data = Reference(self.sheet[1], min_col = 1, min_row = 2, max_row = len(self.datalist)+1)
+        Dia_Raw_Voltage.x_axis.tickLblSkip = math.ceil(chart_rows/10)
+        x_data = Reference(chart_sheet, min_col = 1, min_row = 2, max_row = chart_rows+1)
         Dia_Raw_Voltage.set_categories(x_data)
 
         chart2 = self.workbook.create_chartsheet("Dia_Raw_Voltage")
@@ -324,5 +393,4 @@ class Output_Calculation_Absolute_Evaluation(pyStrategy.Strategy_Base):
         for idx in range(2):
             self.sheet[0].cell(row=idx+3, column=9).fill = PatternFill("lightTrellis", fgColor=add_data_color)
             self.sheet[0].cell(row=3, column=idx+8).border = Border(top=Side(border_style="thick"))    
-        
-        self.workbook.save("Calorimetry\{0}.xlsx".format(self.excel_name))
+
@@ -1,10 +1,12 @@
 # library/modules from python:
-import time
 import math
+import numpy as np
 from enum import Enum
 
 # own scripts:
+import automat.Clock as Clock
 import pyStrategy
+import Sample_Buffer
 
 class operation_point_list_entry:
     """This class turns the user's input into an object, making it easier to handle the operating points."""
@@ -38,7 +40,7 @@ class Operation_Point_List (pyStrategy.Strategy_Base):
         self.cur_deadline = 0
         self.cur_operation_point = None
         self.state = Operation_Point_List.States.TEMPERATURE_EQUILIBRATION
-        self.datalist = []
+        self.datalist = Sample_Buffer.Buffer()
         
     def get_operation_point(self):
         if not self.idx < len(self.list):
@@ -47,7 +49,7 @@ class Operation_Point_List (pyStrategy.Strategy_Base):
 
         self.cur_operation_point = self.list[self.idx]
         if not self.cur_operation_point.get_temperature() == self.cur_temp:
-            self.cur_deadline = time.monotonic_ns() + 10 * 60 * 1E9
+            self.cur_deadline = Clock.now_ns() + 10 * 60 * 1E9
             self.state = Operation_Point_List.States.TEMPERATURE_EQUILIBRATION
             self.cur_temp =  self.cur_operation_point.get_temperature()
             return pyStrategy.Strategy_Base.operation_point_information(self.cur_temp, [0] * self.cur_operation_point.get_number_of_pumps())
@@ -66,21 +68,18 @@ class Operation_Point_List (pyStrategy.Strategy_Base):
             if len(self.datalist) < val:
                 return False
         
-            for col_idx in [2, 3, 4]:
-                valid_count = 0
-                for idx in range(val):
-                    if abs(self.datalist[len(self.datalist)-1-idx][col_idx] - self.cur_operation_point.get_temperature()) < 0.1:
-                        valid_count += 1
-                if valid_count < math.ceil(val*0.9):
-                    # return False
-                    return True
+            last_values = self.datalist.last(val)[:, [2, 3, 4]]
+            valid_count = np.sum(np.abs(last_values - self.cur_operation_point.get_temperature()) < 0.1, axis=0)
+            if np.any(valid_count < math.ceil(val*0.9)):
+                # return False
+                return True
             return True
         elif self.state == Operation_Point_List.States.SETTING_DEADLINE:
-            self.cur_deadline = time.monotonic_ns() + self.cur_operation_point.get_time_ms() * 1E6
+            self.cur_deadline = Clock.now_ns() + self.cur_operation_point.get_time_ms() * 1E6
             self.state = Operation_Point_List.States.WAITING_FOR_DEADLINE
             return False
         elif self.state == Operation_Point_List.States.WAITING_FOR_DEADLINE:
-            if self.cur_deadline < time.monotonic_ns():
+            if self.cur_deadline < Clock.now_ns():
                 return True
             else:
                 return False
@@ -90,11 +89,16 @@ class Operation_Point_List (pyStrategy.Strategy_Base):
         if not self.state == Operation_Point_List.States.TEMPERATURE_EQUILIBRATION:
             return False
 
-        if self.cur_deadline < time.monotonic_ns():
+        if self.cur_deadline < Clock.now_ns():
             print("set_temp is not reached at the reactor")
             return True
         return False
 
+    def get_wakeup(self):
+        if self.state == Operation_Point_List.States.SETTING_DEADLINE:
+            return 0
+        return self.cur_deadline
+
 
 
 
@@ -0,0 +1,197 @@
+# This file contains the trace recorder of the state machines. If it is
+# enabled in the dictionary, every transition of an engine and every
+# event that a state accepts without a transition is written as a
+# record of fixed size into a ring buffer: the time of the installed
+# clock, the path of the engine (e.g. "HPLC A/Check_Pump_State"), the
+# state, the event and the next state. Entering and leaving an engine
+# are recorded as the events "enter" and "exit". The names are stored once in a
+# table and the records only hold their numbers. The ring buffer is
+# written to a file on demand or when the automatization shuts down
+# because of an error. The decoder turns a file into the residency of
+# each engine in its states. It is run as a script from the main folder:
+#     python -m automat.Trace Calorimetry\trace_<time>.trace [engine path]
+
+# library/modules from python:
+import itertools
+import struct
+import sys
+import threading
+import time
+import numpy as np
+
+# own scripts:
+import automat.Clock as Clock
+import automat.Dictionary as Dictionary
+
+enabled = Dictionary.trace["enabled"]
+
+# time [ns], engine path, state, event, next state
+record_format = struct.Struct("<qHHHH")
+record_dtype = np.dtype([("time", "<i8"), ("path", "<u2"), ("state", "<u2"), ("event", "<u2"), ("next_state", "<u2")])
+file_magic = b"PYSTATE_TRACE_1\n"
+
+class Recorder:
+    """This class keeps the last records in a ring buffer of fixed size. The slots are handed out by an atomic counter, so that the engines of several threads (see Driver_Worker) can record without waiting for each other. Only new names take the lock, and the number of records is advanced under a lock of its own."""
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.buffer = bytearray(capacity * record_format.size)
+        self.counter = itertools.count()
+        self.count = 0
+        self.count_lock = threading.Lock()
+        self.names = []
+        self.ids = {}
+        self.lock = threading.Lock()
+
+    def get_id(self, name):
+        with self.lock:
+            tmp = self.ids.get(name)
+            if tmp is None:
+                self.names.append(name)
+                tmp = self.ids[name] = len(self.names) - 1
+            return tmp
+
+    def record(self, path, state, event, next_state):
+        ids = self.ids
+        try:
+            values = (ids[path], ids[state], ids[event], ids[next_state])
+        except KeyError:
+            values = (self.get_id(path), self.get_id(state), self.get_id(event), self.get_id(next_state))
+        idx = next(self.counter)
+        record_format.pack_into(self.buffer, (idx % self.capacity) * record_format.size, Clock.current.now_ns(), *values)
+        # a thread that took its slot earlier may finish later, the count must not go back
+        with self.count_lock:
+            if self.count <= idx:
+                self.count = idx + 1
+
+    def get_records(self):
+        """This function returns the records in the buffer from the oldest to the newest one as bytes. The engines do not wait for it, so the records are only consistent once the engines have stopped; while they run, the oldest records may already be overwritten and a slot may still be written."""
+        with self.lock:
+            with self.count_lock:
+                count = self.count
+            if count <= self.capacity:
+                return bytes(self.buffer[:count * record_format.size]), list(self.names)
+            split = (count % self.capacity) * record_format.size
+            return bytes(self.buffer[split:] + self.buffer[:split]), list(self.names)
+
+recorder = Recorder(Dictionary.trace["capacity"])
+
+# engines and states that are currently creating a state, per thread (nested engines take their path from them)
+context = threading.local()
+
+def enable(flag = True):
+    global enabled
+    enabled = flag
+
+def reset(capacity = None):
+    global recorder
+    if capacity is None:
+        capacity = Dictionary.trace["capacity"]
+    recorder = Recorder(capacity)
+
+# state of an engine that is not entered
+inactive = "-"
+
+# In the following, the functions are defined which are called by the engines, but only if the trace is enabled.
+def get_stack():
+    try:
+        return context.stack
+    except AttributeError:
+        context.stack = []
+        return context.stack
+
+def set_path(engine):
+    """A nested engine is named after the state that creates it, an engine without such a state after its factory. Nested engines that were created before the trace was enabled are named after their factory as well."""
+    stack = get_stack()
+    if len(stack) > 0:
+        parent, state_name = stack[-1]
+        if parent.path is None:
+            set_path(parent)
+        engine.path = "{}/{}".format(parent.path, state_name)
+    else:
+        engine.path = type(engine.fac).__qualname__
+
+def push(engine, state_name):
+    get_stack().append((engine, state_name))
+
+def pop():
+    get_stack().pop()
+
+def record(engine, state, event, next_state):
+    if engine.path is None:
+        set_path(engine)
+    recorder.record(engine.path, state, event, next_state)
+
+# file:
+def dump(file_name = None):
+    """This function writes the records in the buffer into a file and returns its path. It is only consistent once the engines have stopped (see Recorder.get_records)."""
+    if file_name is None:
+        file_name = "{}_{}".format(Dictionary.trace["file_name"], time.strftime("%Y%m%d_%H%M%S"))
+    path = "Calorimetry\{0}.trace".format(file_name)
+    data, names = recorder.get_records()
+    table = "\n".join(names).encode("utf-8")
+    with open(path, "wb") as fout:
+        fout.write(file_magic)
+        fout.write(struct.pack("<II", len(table), len(data) // record_format.size))
+        fout.write(table)
+        fout.write(data)
+    return path
+
+def load(path):
+    """This function returns the names and the records (numpy array with the fields of record_dtype) of a trace file."""
+    with open(path, "rb") as fin:
+        if not fin.read(len(file_magic)) == file_magic:
+            raise Exception("{} is not a trace file".format(path))
+        table_size, num_records = struct.unpack("<II", fin.read(8))
+        names = fin.read(table_size).decode("utf-8").split("\n")
+        records = np.frombuffer(fin.read(num_records * record_format.size), dtype=record_dtype)
+    return names, records
+
+# decoder:
+def residency(names, records):
+    """This function returns for each engine path the periods of its states as [state, start, end] (times in ns). The first period of an engine starts with the oldest record of the file, the last one ends with the newest."""
+    ret = {}
+    if len(records) == 0:
+        return ret
+    first = int(records["time"][0])
+    last = int(records["time"][-1])
+    cur = {}                # engine path: [start of the current state, current state]
+    for rec in records:
+        if rec["state"] == rec["next_state"]:
+            # an event that was accepted without a transition
+            continue
+        path = names[rec["path"]]
+        start = cur.get(path, [first])[0]
+        periods = ret.setdefault(path, [])
+        if not names[rec["state"]] == inactive:
+            periods.append([names[rec["state"]], start, int(rec["time"])])
+        cur[path] = [int(rec["time"]), names[rec["next_state"]]]
+    for path in ret:
+        if not cur[path][1] == inactive:
+            ret[path].append([cur[path][1], cur[path][0], last])
+    return ret
+
+def render(periods, engine_path = None):
+    """This function returns the residency as text: the time per state of each engine and the timeline of its states."""
+    lines = []
+    for path in sorted(periods):
+        if engine_path is not None and not path == engine_path:
+            continue
+        if len(periods[path]) == 0:
+            continue
+        total = {}
+        for state, start, end in periods[path]:
+            total[state] = total.get(state, 0) + end - start
+        duration = max(periods[path][-1][2] - periods[path][0][1], 1)
+
+        lines.append("# {}".format(path))
+        for state in sorted(total, key=lambda name: -total[name]):
+            lines.append("{:<30}{:12.3f} s{:8.1f} %".format(state, total[state] / 1E9, 100 * total[state] / duration))
+        if engine_path is not None:
+            for state, start, end in periods[path]:
+                lines.append("{:12.3f} s  {:<30}{:12.3f} s".format((start - periods[path][0][1]) / 1E9, state, (end - start) / 1E9))
+        lines.append("")
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    names, records = load(sys.argv[1])
+    print(render(residency(names, records), sys.argv[2] if len(sys.argv) > 2 else None))
@@ -1,7 +1,85 @@
 # This file contains the basic class for creating a state, from which 
 # all further states inherit later, and the engine class that is 
 # responsible for building (This is done via the factory) and running 
-# the states, which is always called in the state machine.
+# the states, which is always called in the state machine. In the 
+# compiled mode, each transition table is turned into a dictionary 
+# and checked once, when the engine is constructed. In the pooled 
+# mode, the factory builds each state object only once and arms it 
+# again with "enter" on every transition. The states report when they 
+# have to be ticked again at the latest ("get_wakeup"), so that a 
+# runner can sleep in between.
+
+# library/modules from python:
+import sys
+import threading
+import time
+
+# own scripts:
+import automat.Clock as Clock
+import automat.Metrics as Metrics
+import automat.Trace as Trace
+
+# compiled tables, the tables are class attributes of the states, so the 
+# same table object is compiled only once
+compiled_tables = {}
+
+def validate_table(table, init_state, factory = None):
+    """This function checks a transition table for duplicate transitions, unreachable states and, if a factory is given, for states that the factory can not create."""
+    seen = set()
+    for tran in table:
+        if (tran[0], tran[1]) in seen:
+            raise Exception("Duplicate transition for state {} and event {}".format(tran[0], tran[1]))
+        seen.add((tran[0], tran[1]))
+
+    reachable = {init_state}
+    todo = [init_state]
+    while len(todo) > 0:
+        cur = todo.pop()
+        for tran in table:
+            if tran[0] == cur and not tran[2] in reachable:
+                reachable.add(tran[2])
+                todo.append(tran[2])
+    for tran in table:
+        if not tran[0] in reachable:
+            raise Exception("State {} can not be reached from {}".format(tran[0], init_state))
+
+    if factory is None:
+        return
+    for name in reachable:
+        if not factory.can_create(name):
+            raise Exception("Factory can not create state {}".format(name))
+
+def compile_table(table, init_state, factory):
+    """This function returns the table as a dictionary from (state, event) to the next state. The names are interned, so that the lookups mostly compare identities."""
+    # The table is identified by the object, it must not be changed after 
+    # it was compiled. The cache keeps the table, so its id is not reused.
+    key = (id(table), type(factory), init_state)
+    cached = compiled_tables.get(key)
+    if cached is not None and cached[0] is table:
+        return cached[1]
+
+    validate_table(table, init_state, factory)
+    lookup = {}
+    for tran in table:
+        lookup[(sys.intern(tran[0]), sys.intern(tran[1]))] = sys.intern(tran[2])
+    compiled_tables[key] = [table, lookup]
+    return lookup
+
+class Counters(threading.local):
+    """This class counts the transitions of the engines and the events that were accepted by a state without a transition (such a state may only react to the event in the next tick). The counters belong to the thread that ticks the engines, so a runner can compare them before and after a tick to find out whether its own machine made progress. The machines of other threads (e.g. the driver workers) do not count."""
+    def __init__(self):
+        self.transitions = 0
+        self.events = 0
+
+counters = Counters()
+
+def earliest(wakeups):
+    """This function returns the earliest of the given wake-up times, None is ignored."""
+    ret = None
+    for wakeup in wakeups:
+        if wakeup is not None and (ret is None or wakeup < ret):
+            ret = wakeup
+    return ret
 
 class State_Base:
     
@@ -22,16 +100,86 @@ class State_Base:
     def get_state(self):
         return self.name
 
+    def enter_engine(self, factory_class, init_state, *args):
+        """This function enters the nested engine of the state with the table "tab". The factory and the engine are built once, a pooled state that is entered again only arms its factory with the new arguments."""
+        if getattr(self, "en", None) is None:
+            self.fac = factory_class(*args)
+            self.en = Engine(self.tab, self.fac, init_state)
+        else:
+            self.fac.arm(*args)
+        self.en.enter()
+
+    def get_wakeup(self):
+        """This function returns the time (Clock.now_ns) at which the state has to be ticked again, or None if it only waits for new bytes from a port. States with a nested engine take the wake-up time of their current substate."""
+        en = getattr(self, "en", None)
+        if en is None:
+            return None
+        return en.get_wakeup()
+
+class Factory_Base:
+    """This class is the base of the factories. A factory creates the state "X" with its function "create_X", which gets the name of the state. So the engine can check which states a factory can create. The factories of nested engines take their arguments with "arm", so that they can be armed again (see State_Base.enter_engine). The engine tells the factory whether its states are pooled."""
+    pooled = False
+
+    def __init__(self, *args):
+        self.arm(*args)
+
+    def arm(self, *args):
+        return
+
+    def can_create(self, state_name):
+        return hasattr(self, "create_" + state_name)
+
+    def create_state(self, state_name):
+        create = getattr(self, "create_" + state_name, None)
+        if create is None:
+            raise Exception("Unhandled State in Factory")
+        return create(state_name)
+
+    def reuse(self, cls, state_name):
+        if not self.pooled:
+            return cls()
+        try:
+            pool = self.pool
+        except AttributeError:
+            pool = self.pool = {}
+        st = pool.get((state_name, cls))
+        if st is None:
+            st = cls()
+            pool[(state_name, cls)] = st
+        return st
+
 class Engine:
+    # Engines use compiled tables unless this is switched off here or for 
+    # a single engine.
+    compiled = True
+
+    # The same applies to the pooling of the states. A state is always 
+    # left before the same object is entered again.
+    pooled = True
     
-    def __init__(self,  table, factory, init_state):
+    def __init__(self,  table, factory, init_state, compiled = None, pooled = None, path = None):
         self.tab = table
         self.fac = factory
         self.init_state = init_state
         self.cur = None
 
+        # name of the engine in the trace, nested engines are named after the state that creates them
+        self.path = path
+
+        if compiled is None:
+            compiled = Engine.compiled
+        self.lookup = None
+        if compiled:
+            self.lookup = compile_table(table, init_state, factory)
+
+        if pooled is None:
+            pooled = Engine.pooled
+        self.fac.pooled = pooled
+
     def enter(self):
-        self.cur = self.fac.create_state(self.init_state)
+        if Trace.enabled:
+            Trace.record(self, Trace.inactive, "enter", self.init_state)
+        self.cur = self.new_state(self.init_state)
 
         if self.cur is None:
             raise Exception("Factory has created None")
@@ -41,38 +189,104 @@ class Engine:
     
     def exit(self):
         if self.cur is not None:
+            if Trace.enabled:
+                Trace.record(self, self.cur.get_state(), "exit", Trace.inactive)
             self.cur.exit()
             self.cur = None
 
+    def new_state(self, state_name):
+        if not Trace.enabled:
+            return self.fac.create_state(state_name)
+        Trace.push(self, state_name)
+        try:
+            return self.fac.create_state(state_name)
+        finally:
+            Trace.pop()
+
     def search_in_table(self, event):
+        if self.lookup is not None:
+            target = self.lookup.get((self.cur.get_state(), event))
+            if target is None:
+                return False
+            
+            if Trace.enabled:
+                Trace.record(self, self.cur.get_state(), event, target)
+            self.cur.exit()
+            self.cur = self.new_state(target)
+            counters.transitions += 1
+            return True
+
         for tran in self.tab:
             if not tran[0] == self.cur.get_state():
                 continue
             if not tran[1] == event:
                 continue
 
+            if Trace.enabled:
+                Trace.record(self, self.cur.get_state(), event, tran[2])
             self.cur.exit()
-            self.cur = self.fac.create_state(tran[2])
+            self.cur = self.new_state(tran[2])
+            counters.transitions += 1
             return True
         return False
  
     def tick(self):
+        if Metrics.enabled:
+            return self.measured_tick()
         ent = self.cur()
         if ent is None:
             return None
         if self.search_in_table(ent):
             return None
         return ent
+
+    def measured_tick(self):
+        """This function ticks like "tick" and records the duration for the current state (see Metrics)."""
+        state_name = self.cur.get_state()
+        start = time.perf_counter_ns()
+        ent = self.cur()
+        if ent is not None and self.search_in_table(ent):
+            ent = None
+        Metrics.record_tick(state_name, time.perf_counter_ns() - start)
+        return ent
     
     def handle_event(self, event):
         if self.search_in_table(event):
             return True
         if self.cur.handle_event(event):
+            counters.events += 1
+            if Trace.enabled:
+                Trace.record(self, self.cur.get_state(), event, self.cur.get_state())
             return True
         return False
         
     def get_state(self):
         return self.cur.get_state()
 
+    def get_wakeup(self):
+        return self.cur.get_wakeup()
 
+# helpers for the runners, a machine is anything with "tick" and "get_wakeup" 
+# (the automatization or a single driver):
+def tick_until_idle(machine, max_ticks = 100):
+    """This function ticks the machine until a tick does not cause a transition anymore. Only the transitions of the calling thread count (see Counters)."""
+    extra_tick = True
+    for idx in range(max_ticks):
+        transitions = counters.transitions
+        events = counters.events
+        machine.tick()
+        if not transitions == counters.transitions:
+            extra_tick = True
+            continue
+        # a state that accepted an event (e.g. "request_pump_on") reacts in the next tick
+        if not events == counters.events and extra_tick:
+            extra_tick = False
+            continue
+        return
 
+def get_sleep_s(machine, max_sleep_s):
+    """This function returns the time until the earliest wake-up time of the states. It is limited by max_sleep_s, because some handles (e.g. the dummy handles) can not report new bytes."""
+    wakeup = machine.get_wakeup()
+    if wakeup is None:
+        return max_sleep_s
+    return min(max(wakeup - Clock.now_ns(), 0) / 1E9, max_sleep_s)
@@ -25,6 +25,10 @@ class Strategy_Base:
     def has_error(self):
         return False
 
+    def get_wakeup(self):
+        """This function returns the time (Clock.now_ns) at which point_complete or has_error may change without new data, or None."""
+        return None
+
     def push_actual_flowrate(self, val):
         return 
 